@@ -16,5 +16,5 @@
 # with this program; if not, write to the Free Software Foundation, Inc.,
 # 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
 
-from . import legacy, diskimg
+from . import legacy, appledouble, diskimg, dos33, prodos
 from .logging import LOG
@@ -0,0 +1,128 @@
+# vim: set tabstop=4 shiftwidth=4 noexpandtab filetype=python:
+
+# Copyright (C) 2013-2016  Ivan Drucker
+# Copyright (C) 2017       T. Joseph Carter
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+# or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License
+# for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+"""Netatalk-compatible AppleDouble v2 headers
+
+Every AppleDouble file cppo writes has the same 741 byte header layout, with
+the resource fork (if any) following it.  The parts that never change are
+built once into TEMPLATE, and each file's header starts as a copy of it.  The
+few fields that differ from file to file are stamped in with precompiled
+struct layouts, taking the file type and auxiliary type as plain ints.
+"""
+
+import struct
+
+HEADER_LENGTH = 741
+"""Length of the header, and so the offset of the resource fork"""
+
+APPLE_EPOCH_OFFSET = 946684800
+"""The number of seconds between 1970-01-01 amd 2000-01-01"""
+# $ date --date="2000-01-01 00:00:00 GMT" +%s
+# 946684800
+
+DATE_UNKNOWN = 0x80000000
+"""AppleDouble's value for a date that was never set"""
+
+# Entry descriptors: (entry ID, offset, length)
+_ENTRIES = (
+		(2, HEADER_LENGTH, 0),  # Resource Fork
+		(3, 0x0b6, 0),          # Real Name
+		(4, 0x1b5, 0),          # Comment
+		(8, 0x27d, 16),         # Dates Info
+		(9, 0x28d, 32),         # Finder Info
+		(11, 0x2c1, 8),         # ProDOS file info
+		(13, 0x2b5, 0),         # AFP short name
+		(14, 0x2b1, 4),         # AFP File Info
+		(15, 0x2ad, 4),         # AFP Directory ID
+		)
+# dbd (second time) will create DEV, INO, SYN, SV~
+
+_PREAMBLE = struct.Struct('>II16xH')
+"""Magic number, version, filler, and number of entries"""
+
+_ENTRY = struct.Struct('>III')
+"""An entry descriptor"""
+
+def _template() -> bytes:
+	header = bytearray(HEADER_LENGTH)
+	# the entry count has always said 13, though only nine are described
+	_PREAMBLE.pack_into(header, 0, 0x00051607, 0x00020000, 13)
+	for i, entry in enumerate(_ENTRIES):
+		_ENTRY.pack_into(header, _PREAMBLE.size + i * _ENTRY.size, *entry)
+	return bytes(header)
+
+TEMPLATE = _template()
+"""The header with no per-file fields filled in"""
+
+RSRC_LENGTH = struct.Struct('>I')
+RSRC_LENGTH_OFFSET = _PREAMBLE.size + 8
+"""Length of the resource fork, in its entry descriptor"""
+
+FILE_INFO = struct.Struct('>IIIIcBH4s')
+FILE_INFO_OFFSET = 0x27d
+"""Dates Info (created, modified, backup, accessed) followed by the Finder
+type and creator, which for a ProDOS file are 'p', the file type, and the
+auxiliary type, then 'pdos'"""
+
+FINDER_INFO_OFFSET = 0x295
+"""Finder info proper (FInfo), which follows the type and creator"""
+
+EXTENDED_FINDER_INFO_OFFSET = 0x29d
+"""Extended Finder info (FXInfo)"""
+
+def apple_date(unix_date: int) -> int:
+	"""Convert a Unix date to the AppleDouble epoch (2000-01-01)
+
+	Args:
+		unix_date: seconds since 1970-01-01 00:00:00 GMT
+
+	Returns:
+		seconds since 2000-01-01 00:00:00 GMT as an unsigned 32 bit value
+	"""
+	# Think: "UNIX dates have 30 years too many seconds to be Apple dates,
+	# so we need to subtract 30 years' worth of seconds."
+	return int(unix_date - APPLE_EPOCH_OFFSET) & 0xffffffff
+
+def new_header() -> bytearray:
+	"""Return a fresh copy of the header template to fill in"""
+	return bytearray(TEMPLATE)
+
+def set_rsrc_length(header: bytearray, length: int) -> None:
+	"""Record the length of the resource fork following the header"""
+	RSRC_LENGTH.pack_into(header, RSRC_LENGTH_OFFSET, length)
+
+def set_file_info(
+		header: bytearray,
+		created: int,
+		modified: int,
+		file_type: int,
+		aux_type: int
+		) -> None:
+	"""Stamp a file's dates and ProDOS type into its header
+
+	Args:
+		header: The header to modify
+		created: Creation date as Unix time
+		modified: Modification date as Unix time
+		file_type: ProDOS file type
+		aux_type: ProDOS auxiliary type
+	"""
+	FILE_INFO.pack_into(header, FILE_INFO_OFFSET,
+			apple_date(created), apple_date(modified),
+			DATE_UNKNOWN, DATE_UNKNOWN,
+			b'p', file_type, aux_type, b'pdos')
@@ -0,0 +1,377 @@
+# vim: set tabstop=4 shiftwidth=4 noexpandtab filetype=python:
+
+# Copyright (C) 2017  T. Joseph Carter
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+# or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License
+# for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+"""Extract into a tar or zip archive instead of a directory
+
+An extracted volume is mostly small files, and an AppleDouble sidecar for
+each of them with -ad, which is slow to create one at a time on about any
+filesystem.  An Archive takes the directories and files an Extractor would
+have created and writes them as members of a single tar or zip stream, which
+can be a file or stdout.  Files get the modification times they'd have had
+on disk.
+
+Tar archives are written in stream mode, so nothing needs to seek and each
+file's extents are copied into the archive without assembling the file
+first.  Zip members are built in memory one file at a time.
+
+Members are written in the order they're finished, so an Archive should be
+fed from one thread.
+"""
+
+import sys
+import tarfile
+import time
+import zipfile
+from abc import ABCMeta, abstractmethod
+from typing import List, Optional, Tuple
+
+from .sink import QueuedWriter
+
+ARCHIVE_FORMATS = {
+		'.tar': ('tar', ''),
+		'.tar.gz': ('tar', 'gz'),
+		'.tgz': ('tar', 'gz'),
+		'.tar.bz2': ('tar', 'bz2'),
+		'.tar.xz': ('tar', 'xz'),
+		'.zip': ('zip', None),
+		}
+"""Archive file extensions: (format, tar compression)"""
+
+class _ExtentReader(object):
+	"""File-like object reading a fork from its extents
+
+	Args:
+		size: Length of the fork
+		extents: (offset, data) pairs; anything not covered reads as zeros
+	"""
+
+	def __init__(self, size: int, extents: List[Tuple[int, bytes]]) -> None:
+		self.size = size
+		self._extents = sorted(extents, key=lambda extent: extent[0])
+		self._index = 0
+		self._position = 0
+
+	def read(self, size: int = -1) -> bytes:
+		"""Return up to size bytes from the current position"""
+		if size < 0:
+			size = self.size
+		start = self._position
+		end = min(start + size, self.size)
+		chunk = bytearray(end - start)
+		extents = self._extents
+		while (self._index < len(extents)
+				and extents[self._index][0] + len(extents[self._index][1])
+					<= start):
+			self._index += 1
+		i = self._index
+		while i < len(extents) and extents[i][0] < end:
+			offset, data = extents[i]
+			low = max(offset, start)
+			high = min(offset + len(data), end)
+			if low < high:
+				chunk[low - start:high - start] = (
+						data[low - offset:high - offset])
+			i += 1
+		self._position = end
+		return bytes(chunk)
+
+
+class Archive(object, metaclass=ABCMeta):
+	"""Abstract tree of extracted files written as a single archive
+
+	Paths are given as the Extractor builds them, and stored relative to
+	root.
+
+	Args:
+		fileobj: Binary file object to write the archive to
+		root: Directory member paths are relative to
+		close_fileobj: True to close fileobj along with the archive, False
+			to just flush it
+	"""
+
+	def __init__(
+			self,
+			fileobj,
+			root: str = "",
+			close_fileobj: bool = False
+			) -> None:
+		self.fileobj = fileobj
+		self.root = root.rstrip('/')
+		self.close_fileobj = close_fileobj
+		self._dirs = set()
+		self._closed = False
+
+	def __enter__(self) -> 'Archive':
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback) -> None:
+		self.close()
+
+	def member_name(self, path: str) -> str:
+		"""Return the archive member name of an output path"""
+		if self.root and path.startswith(self.root + '/'):
+			path = path[len(self.root):]
+		return path.lstrip('/')
+
+	def add_dir(self, path: str) -> None:
+		"""Add a directory (and no more than once)
+
+		Args:
+			path: The directory's output path
+		"""
+		name = self.member_name(path)
+		if name and name not in self._dirs:
+			self._dirs.add(name)
+			self._add_dir(name, int(time.time()))
+
+	def add_file(
+			self,
+			path: str,
+			size: int,
+			extents: List[Tuple[int, bytes]],
+			mtime: Optional[int] = None
+			) -> None:
+		"""Add a file
+
+		Args:
+			path: The file's output path
+			size: Its length
+			extents: (offset, data) pairs making up its contents, with zeros
+				in between
+			mtime: Its modification time (default: now)
+		"""
+		if mtime is None:
+			mtime = int(time.time())
+		self._add_file(self.member_name(path), _ExtentReader(size, extents),
+				size, mtime)
+
+	def open_writer(
+			self,
+			path: str,
+			size: int,
+			skip: int = 0
+			) -> 'ArchiveWriter':
+		"""Return a ForkWriter adding a fork to this archive when closed
+
+		Args:
+			path: The fork's output path
+			size: The length of the fork
+			skip: Number of bytes to drop from the front of the fork
+		"""
+		return ArchiveWriter(self, path, size, skip)
+
+	@abstractmethod
+	def _add_dir(self, name: str, mtime: int) -> None:
+		pass
+
+	@abstractmethod
+	def _add_file(
+			self,
+			name: str,
+			reader: _ExtentReader,
+			size: int,
+			mtime: int
+			) -> None:
+		pass
+
+	@abstractmethod
+	def _finish(self) -> None:
+		pass
+
+	def close(self) -> None:
+		"""Finish the archive and close or flush its file object"""
+		if self._closed:
+			return
+		self._closed = True
+		self._finish()
+		if self.close_fileobj:
+			self.fileobj.close()
+		else:
+			self.fileobj.flush()
+
+
+class TarArchive(Archive):
+	"""Archive written as a (possibly compressed) tar stream
+
+	Args:
+		fileobj: Binary file object to write the archive to
+		root: Directory member paths are relative to
+		close_fileobj: True to close fileobj along with the archive
+		compression: '', 'gz', 'bz2', or 'xz'
+	"""
+
+	def __init__(
+			self,
+			fileobj,
+			root: str = "",
+			close_fileobj: bool = False,
+			compression: str = ''
+			) -> None:
+		super(TarArchive, self).__init__(fileobj, root, close_fileobj)
+		self._tar = tarfile.open(
+				fileobj=fileobj, mode='w|' + compression,
+				format=tarfile.PAX_FORMAT)
+
+	def _add_dir(self, name: str, mtime: int) -> None:
+		info = tarfile.TarInfo(name)
+		info.type = tarfile.DIRTYPE
+		info.mode = 0o755
+		info.mtime = mtime
+		self._tar.addfile(info)
+
+	def _add_file(
+			self,
+			name: str,
+			reader: _ExtentReader,
+			size: int,
+			mtime: int
+			) -> None:
+		info = tarfile.TarInfo(name)
+		info.size = size
+		info.mode = 0o644
+		info.mtime = mtime
+		self._tar.addfile(info, reader)
+
+	def _finish(self) -> None:
+		self._tar.close()
+
+
+class ZipArchive(Archive):
+	"""Archive written as a deflated zip file
+
+	Zip dates can't predate 1980, so earlier ones are stored as 1980-01-01.
+
+	Args:
+		fileobj: Binary file object to write the archive to
+		root: Directory member paths are relative to
+		close_fileobj: True to close fileobj along with the archive
+	"""
+
+	def __init__(
+			self,
+			fileobj,
+			root: str = "",
+			close_fileobj: bool = False
+			) -> None:
+		super(ZipArchive, self).__init__(fileobj, root, close_fileobj)
+		self._zip = zipfile.ZipFile(
+				fileobj, 'w', compression=zipfile.ZIP_DEFLATED)
+
+	@staticmethod
+	def _info(name: str, mtime: int) -> zipfile.ZipInfo:
+		date_time = max(time.localtime(mtime)[:6], (1980, 1, 1, 0, 0, 0))
+		return zipfile.ZipInfo(name, date_time)
+
+	def _add_dir(self, name: str, mtime: int) -> None:
+		info = self._info(name + '/', mtime)
+		info.external_attr = (0o40755 << 16) | 0x10  # MS-DOS directory
+		self._zip.writestr(info, b'')
+
+	def _add_file(
+			self,
+			name: str,
+			reader: _ExtentReader,
+			size: int,
+			mtime: int
+			) -> None:
+		info = self._info(name, mtime)
+		info.external_attr = 0o100644 << 16
+		info.compress_type = zipfile.ZIP_DEFLATED
+		self._zip.writestr(info, reader.read())
+
+	def _finish(self) -> None:
+		self._zip.close()
+
+
+class ArchiveWriter(QueuedWriter):
+	"""ForkWriter which adds the fork to an Archive when it is closed
+
+	Args:
+		archive: The Archive to add the fork to
+		path: The fork's output path
+		size: The length of the fork
+		skip: Number of bytes to drop from the front of the fork
+	"""
+
+	def __init__(
+			self,
+			archive: Archive,
+			path: str,
+			size: int,
+			skip: int = 0
+			) -> None:
+		super(ArchiveWriter, self).__init__(path, size, skip)
+		self.archive = archive
+
+	def close(self, mtime: Optional[int] = None) -> None:
+		"""Add the queued extents to the archive as a file
+
+		Args:
+			mtime: Modification time to give the file
+		"""
+		if self._extents is not None:
+			self.archive.add_file(self.path, self.size, self._extents, mtime)
+			self._extents = None
+
+
+def archive_format(path: str) -> Tuple[str, Optional[str]]:
+	"""Return the format and tar compression for an archive's file name
+
+	Args:
+		path: The archive's path
+
+	Returns:
+		A value of ARCHIVE_FORMATS, or ('tar', '') for stdout ('-')
+
+	Raises:
+		ValueError: the extension isn't one of ARCHIVE_FORMATS
+	"""
+	if path == '-':
+		return ARCHIVE_FORMATS['.tar']
+	lower = path.lower()
+	for extension in sorted(ARCHIVE_FORMATS, key=len, reverse=True):
+		if lower.endswith(extension):
+			return ARCHIVE_FORMATS[extension]
+	raise ValueError("{}: not a .tar, .tar.gz, .tgz, .tar.bz2, .tar.xz or "
+			".zip file".format(path))
+
+def open_archive(path: str, root: str = "") -> Archive:
+	"""Open an archive to extract into
+
+	Args:
+		path: File to write, with its format given by its extension, or '-'
+			to write a tar stream to stdout
+		root: Directory member paths are relative to
+
+	Returns:
+		A TarArchive or ZipArchive, which closes its file (but not stdout)
+		when it is closed
+
+	Raises:
+		ValueError: the format can't be told from path
+	"""
+	kind, compression = archive_format(path)
+	if path == '-':
+		return TarArchive(sys.stdout.buffer, root, False, compression)
+	fileobj = open(path, 'wb')
+	try:
+		if kind == 'zip':
+			return ZipArchive(fileobj, root, True)
+		return TarArchive(fileobj, root, True, compression)
+	except BaseException:
+		fileobj.close()
+		raise
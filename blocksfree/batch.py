@@ -0,0 +1,163 @@
+# vim: set tabstop=4 shiftwidth=4 noexpandtab filetype=python:
+
+# Copyright (C) 2017  T. Joseph Carter
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+# or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License
+# for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+"""Extract or catalog many images at once
+
+A batch is a directory tree of images or a manifest file listing them, one
+path to a line.  Each image is handed to a legacy.Extractor in a pool of
+worker processes, and gets a target directory of its own named for its path
+relative to the root of the batch so that images with the same volume name
+can't collide.  What each Extractor prints is collected and returned with its
+exit status, in the order the images were listed.
+"""
+
+import io
+import os
+import traceback
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+from . import legacy
+from .logging import LOG, Formatter, StreamHandler
+
+IMAGE_EXTENSIONS = (
+		'.po', '.do', '.dsk', '.2mg', '.2img', '.hdv', '.shk', '.sdk', '.bxy')
+"""File extensions looked for when a batch is given as a directory"""
+
+ImageResult = namedtuple('ImageResult', (
+		'image', 'target_dir', 'exitcode', 'files', 'output'))
+"""Outcome of one image: its path, the directory it was extracted into (None
+when cataloging), the exit status cppo would have given it, the number of
+files extracted, and everything printed while processing it"""
+
+def find_images(source: str) -> Tuple[str, List[str]]:
+	"""Return the images making up a batch
+
+	If source is a directory, it is searched recursively for files with one of
+	the IMAGE_EXTENSIONS.  Otherwise it is read as a manifest of image paths,
+	one to a line, with blank lines and lines beginning with # ignored.
+	Relative paths in a manifest are relative to the manifest's directory.
+
+	Args:
+		source: A directory or manifest file
+
+	Returns:
+		(root, images) where images is a list of image paths in batch order
+		and root is the directory they are all found under
+	"""
+	images = []
+	if os.path.isdir(source):
+		root = source
+		for dir_name, subdirs, files in os.walk(source):
+			subdirs.sort()
+			for name in sorted(files):
+				if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS:
+					images.append(os.path.join(dir_name, name))
+	else:
+		base = os.path.dirname(source)
+		with open(source) as manifest:
+			for line in manifest:
+				line = line.strip()
+				if line and not line.startswith('#'):
+					images.append(os.path.normpath(os.path.join(base, line)))
+		if images:
+			root = os.path.commonpath(
+					[os.path.dirname(os.path.abspath(image))
+						for image in images])
+		else:
+			root = base
+	return root, images
+
+def image_target(root: str, image: str, target_dir: str) -> str:
+	"""Return the directory an image in a batch is extracted into
+
+	Args:
+		root: Directory all of the batch's images are found under
+		image: Path of the image
+		target_dir: Target directory of the whole batch
+
+	Returns:
+		target_dir joined with the image's path relative to root
+	"""
+	relpath = os.path.relpath(os.path.abspath(image), os.path.abspath(root))
+	return os.path.join(target_dir, relpath)
+
+def _run_image(job: Tuple[str, Optional[str], dict]) -> ImageResult:
+	"""Process one image of a batch in a worker process
+
+	Everything the image's Extractor prints or logs is collected, so that
+	it comes out under the image's own heading rather than mixed in with
+	whatever the other workers are doing.  A worker runs one image at a
+	time, so the job's log handler stands in for any it inherited.
+	"""
+	image, target_dir, options = job
+	output = io.StringIO()
+	handler = StreamHandler(output)
+	handler.setFormatter(Formatter('{message}', style='{'))
+	inherited = LOG.logger.handlers
+	LOG.logger.handlers = [handler]
+	files = 0
+	try:
+		if target_dir is not None:
+			os.makedirs(target_dir, exist_ok=True)
+		extractor = legacy.Extractor(
+				image, target_dir or "", output=output, **options)
+		exitcode = extractor.run()
+		files = len(extractor.extracted)
+	except Exception:  # pylint: disable=broad-except
+		output.write(traceback.format_exc())
+		exitcode = 1
+	finally:
+		LOG.logger.handlers = inherited
+	return ImageResult(image, target_dir, exitcode, files, output.getvalue())
+
+def run_batch(
+		root: str,
+		images: Sequence[str],
+		target_dir: Optional[str] = None,
+		workers: Optional[int] = None,
+		**options
+		) -> Iterator[ImageResult]:
+	"""Extract or catalog a batch of images in a pool of worker processes
+
+	Args:
+		root: Directory all of the images are found under, see find_images()
+		images: Paths of the images
+		target_dir: Target directory of the whole batch (None to catalog)
+		workers: Number of worker processes (default: one per CPU)
+		options: Extractor options applied to every image
+
+	Yields:
+		An ImageResult for each image, in the order they were given
+	"""
+	jobs = [(image,
+			None if target_dir is None
+				else image_target(root, image, target_dir),
+			options)
+			for image in images]
+	if not jobs:
+		return
+	workers = workers or os.cpu_count() or 1
+	chunksize = max(1, min(16, len(jobs) // (workers * 4)))
+	with ProcessPoolExecutor(max_workers=workers) as executor:
+		for result in executor.map(_run_image, jobs, chunksize=chunksize):
+			yield result
+
+def exit_status(results: Sequence[ImageResult]) -> int:
+	"""Return the exit status of a batch: the worst of its images'"""
+	return max((result.exitcode for result in results), default=0)
@@ -59,6 +59,13 @@ class BufferType(object, metaclass=ABCMeta):
 		return self
 
 	def __exit__(self, exc_type, exc_value, traceback) -> None:
+		self.close()
+
+	def close(self) -> None:
+		"""Release any resources held by the buffer
+
+		Buffers which hold nothing but memory need not implement this.
+		"""
 		pass
 
 	@abstractmethod
@@ -94,6 +101,48 @@ class BufferType(object, metaclass=ABCMeta):
 		"""
 		pass
 
+	def read_view(self, start: int, count: int) -> memoryview:
+		"""Return a memoryview of count bytes beginning at start
+
+		Subclasses which can expose their storage directly should override
+		this so that callers copying data out of the buffer need copy it only
+		once.  The default implementation wraps a copy made by read.
+
+		The view may refer to the buffer's own storage.  Callers must not hold
+		onto it past the point where the buffer is resized or closed.
+
+		Args:
+			start: Starting position of bytes to return
+			count: Number of bytes to return
+
+		Returns:
+			memoryview of the requested length
+
+		Raises:
+			IndexError if attempt to read outside the buffer is made
+		"""
+		return memoryview(self.read(start, count))
+
+	def readinto(self, start: int, buf: bytearray) -> int:
+		"""Fill a writable bytes-like object from buffer beginning at start
+
+		Args:
+			start: Starting position of bytes to copy
+			buf: The writable bytes-like object to fill; its length determines
+				how many bytes are copied
+
+		Returns:
+			The number of bytes copied
+
+		Raises:
+			IndexError if attempt to read outside the buffer is made
+		"""
+		with memoryview(buf) as dest:
+			count = dest.nbytes
+			with self.read_view(start, count) as src:
+				dest.cast('B')[:] = src
+		return count
+
 	@abstractmethod
 	def read1(self, offset: int) -> int:
 		"""Return single byte from buffer as int
@@ -72,7 +72,31 @@ class ByteBuffer(BufferType):
 			assert start + count <= len(self._buf)
 		except AssertionError:
 			raise IndexError('buffer read with index out of range')
-		return bytes(self._buf[start:start + count])
+		return bytes(memoryview(self._buf)[start:start + count])
+
+	def read_view(self, start: int, count: int) -> memoryview:
+		"""Return a memoryview of count bytes beginning at start
+
+		The view refers to the buffer's own storage, so no bytes are copied.
+		It must be released before the buffer can be resized.
+
+		Args:
+			start: Starting position of bytes to return
+			count: Number of bytes to return
+
+		Returns:
+			memoryview of the requested length
+
+		Raises:
+			IndexError if attempt to read outside the buffer is made
+		"""
+		try:
+			assert start >= 0
+			assert count >= 0
+			assert start + count <= len(self._buf)
+		except AssertionError:
+			raise IndexError('buffer read with index out of range')
+		return memoryview(self._buf)[start:start + count]
 
 	def read1(self, offset: int) -> int:
 		"""Return single byte from buffer as int
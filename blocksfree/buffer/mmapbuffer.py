@@ -0,0 +1,233 @@
+# vim: set tabstop=4 shiftwidth=4 noexpandtab filetype=python:
+
+# Copyright (C) 2017  T. Joseph Carter
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+# or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License
+# for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+"""BufferTypes backed by a memory-mapped file
+
+Reading a whole disk image into a bytearray is simple, but it means a 32M
+ProDOS volume costs 32M of RAM before we've looked at a single block of it.
+Mapping the file instead lets the operating system page in only the blocks we
+actually touch, which is usually the directory and whatever files we extract.
+"""
+
+import mmap
+from typing import Dict, List, Optional
+from .buffertype import BufferType
+from .. import util
+
+class MmapBuffer(BufferType):
+	"""MmapBuffer(file_path) -> MmapBuffer
+
+	Create a read-only BufferType object by mapping the regular file found at
+	file_path.  The file must not be empty, as zero-length files cannot be
+	mapped.
+	"""
+
+	_ACCESS = mmap.ACCESS_READ
+	_MODE = 'rb'
+
+	def __init__(self, file_path: str) -> None:
+		self._map = None
+		with open(file_path, self._MODE) as mapfile:
+			# The mapping holds its own reference to the file, so we don't
+			# need to keep the file object around once it's mapped.
+			self._map = mmap.mmap(mapfile.fileno(), 0, access=self._ACCESS)
+		self.file_path = file_path
+
+	def __len__(self) -> int:
+		"""Implement len(self)"""
+		return len(self._map)
+
+	def read(self, start: int, count: int) -> bytes:
+		"""Return count bytes from buffer beginning at start
+
+		Args:
+			start: Starting position of bytes to return
+			count: Number of bytes to return
+
+		Returns:
+			bytes object of the requested length copied from buffer
+
+		Raises:
+			IndexError if attempt to read outside the buffer is made
+		"""
+		try:
+			assert start >= 0
+			assert count >= 0
+			assert start + count <= len(self._map)
+		except AssertionError:
+			raise IndexError('buffer read with index out of range')
+		return self._map[start:start + count]
+
+	def read_view(self, start: int, count: int) -> memoryview:
+		"""Return a memoryview of count bytes beginning at start
+
+		The view refers to the mapping itself, so no bytes are copied and only
+		the pages actually used are read from the file.  It must be released
+		before the buffer is closed.
+
+		Args:
+			start: Starting position of bytes to return
+			count: Number of bytes to return
+
+		Returns:
+			memoryview of the requested length
+
+		Raises:
+			IndexError if attempt to read outside the buffer is made
+		"""
+		try:
+			assert start >= 0
+			assert count >= 0
+			assert start + count <= len(self._map)
+		except AssertionError:
+			raise IndexError('buffer read with index out of range')
+		return memoryview(self._map)[start:start + count]
+
+	def read1(self, offset: int) -> int:
+		"""Return single byte from buffer as int
+
+		Args:
+			offset: The position of the requested byte in the buffer
+
+		Returns:
+			int value of the requested byte
+
+		Raises:
+			IndexError if attempt to read outside the buffer is made
+		"""
+		try:
+			assert 0 <= offset < len(self._map)
+		except AssertionError:
+			raise IndexError('buffer read with index out of range')
+		return self._map[offset]
+
+	def close(self) -> None:
+		"""Unmap the file
+
+		The buffer may not be used after it has been closed.  If views of it
+		are still around (held by the traceback of an error writing them
+		out, say), the file is unmapped once the last of them is gone
+		instead, so that closing the buffer never hides that error.
+		"""
+		if self._map is not None:
+			try:
+				self._map.close()
+			except BufferError:
+				pass
+			self._map = None
+
+	def __repr__(self):
+		"""Return repr(self)"""
+		return '{}({!r})'.format(type(self).__name__, self.file_path)
+
+	def __str__(self) -> str:
+		"""Implement str(self)"""
+		return '<{} of {} bytes>'.format(type(self).__name__, len(self._map))
+
+	def hexdump(self, *args: List, **kwargs: Dict) -> None:
+		"""Performas a canonical hexdump of self.
+
+		Args:
+			Any for blocksfree.util.hexdump, see that function for details.
+		"""
+		util.hexdump(self._map, *args, **kwargs)
+
+
+class WritableMmapBuffer(MmapBuffer):
+	"""WritableMmapBuffer(file_path[, locked]) -> WritableMmapBuffer
+
+	Create a read-write BufferType object by mapping the regular file found at
+	file_path.  Writes go straight through to the file, although the operating
+	system decides when they actually reach the disk unless flush is called.
+	The size of the file cannot be changed through the buffer.
+	"""
+
+	_ACCESS = mmap.ACCESS_WRITE
+	_MODE = 'r+b'
+
+	def __init__(self, file_path: str, locked: bool = False) -> None:
+		super(WritableMmapBuffer, self).__init__(file_path)
+		self._changed = False
+		self._locked = locked
+
+	@property
+	def changed(self):
+		"""Return True if buffer has been altered
+
+		Returns:
+			True if anything has been written to the buffer
+		"""
+		return self._changed
+
+	def write(
+			self,
+			buf: bytes,
+			start: int,
+			count: Optional[int] = None
+			) -> None:
+		"""Write given bytes-like object to buffer at start
+
+		Args:
+			buf: The bytes-like object to write
+			start: Offset to where in buffer it should be written
+			count: Length to write (default: length of buf)
+
+		Raises:
+			IndexError if attempt to read outside the buffer is made
+			BufferError if buffer is locked
+		"""
+		if self.locked:
+			raise BufferError('cannot write to locked buffer')
+
+		if not count:
+			count = len(buf)
+		try:
+			assert start >= 0
+			assert count >= 0
+			assert start + count <= len(self._map)
+		except AssertionError:
+			raise IndexError('buffer write with index out of range')
+
+		self._map[start:start + count] = buf[:count]
+		self._changed = True
+
+	def flush(self) -> None:
+		"""Flush changes to the underlying file"""
+		if self._changed:
+			self._map.flush()
+
+	def close(self) -> None:
+		"""Flush changes and unmap the file
+
+		The buffer may not be used after it has been closed.
+		"""
+		if self._map is not None:
+			self.flush()
+		super(WritableMmapBuffer, self).close()
+
+	@property
+	def locked(self) -> bool:
+		"""Determine writability of buffer
+
+		Returns:
+			True if buffer has been locked to prevent writing
+		"""
+		return self._locked
+
+	@locked.setter
+	def locked(self, value: bool) -> None:
+		self._locked = value
@@ -0,0 +1,193 @@
+# vim: set tabstop=4 shiftwidth=4 noexpandtab filetype=python:
+
+# Copyright (C) 2017  T. Joseph Carter
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+# or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License
+# for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+"""BufferType that reorders fixed-size units of another buffer
+
+A 140k image may store its sectors in DOS 3.3 order or in ProDOS order, and
+which one you have says nothing about which filesystem is on it.  Rather than
+shuffling every sector of the image into the order we want up front, a
+RemapBuffer translates each offset as it's read, so we only pay for the
+sectors we actually look at.
+"""
+
+from typing import Callable, Iterator, Optional, Sequence, Tuple
+from .buffertype import BufferType
+
+class RemapBuffer(BufferType):
+	"""RemapBuffer(buffer, unit_size, unit_map[, offsets]) -> RemapBuffer
+
+	Present buffer as a sequence of unit_size units in a different order.
+	Logical unit n of the RemapBuffer is physical unit unit_map(n) of buffer.
+	If offsets is given, it must be a sequence holding the physical byte offset
+	of every logical unit, and it will be used instead of calling unit_map.
+	The length of buffer must be a multiple of unit_size.
+	"""
+
+	def __init__(
+			self,
+			buffer: BufferType,
+			unit_size: int,
+			unit_map: Callable[[int], int],
+			offsets: Optional[Sequence[int]] = None
+			) -> None:
+		if len(buffer) % unit_size:
+			raise ValueError('buffer length is not a multiple of unit size')
+		self._base = buffer
+		self._unit_size = unit_size
+		self._unit_map = unit_map
+		self._offsets = offsets
+
+	def __len__(self) -> int:
+		"""Implement len(self)"""
+		return len(self._base)
+
+	def _physical(self, unit: int) -> int:
+		"""Return the physical byte offset of a logical unit"""
+		if self._offsets is not None:
+			return self._offsets[unit]
+		return self._unit_map(unit) * self._unit_size
+
+	def _pieces(self, start: int, count: int) -> Iterator[Tuple[int, int]]:
+		"""Yield (physical offset, length) pieces covering a logical range
+
+		Runs of logical units which are also adjacent in the underlying buffer
+		are yielded as a single piece.
+		"""
+		if start < 0 or count < 0 or start + count > len(self._base):
+			raise IndexError('buffer read with index out of range')
+		run_start = None
+		run_len = 0
+		while count:
+			unit, offset = divmod(start, self._unit_size)
+			length = min(count, self._unit_size - offset)
+			physical = self._physical(unit) + offset
+			if run_start is not None and run_start + run_len == physical:
+				run_len += length
+			else:
+				if run_start is not None:
+					yield run_start, run_len
+				run_start, run_len = physical, length
+			start += length
+			count -= length
+		if run_start is not None:
+			yield run_start, run_len
+
+	def read(self, start: int, count: int) -> bytes:
+		"""Return count bytes from buffer beginning at start
+
+		Args:
+			start: Starting position of bytes to return
+			count: Number of bytes to return
+
+		Returns:
+			bytes object of the requested length copied from buffer
+
+		Raises:
+			IndexError if attempt to read outside the buffer is made
+		"""
+		return b''.join(self._base.read(physical, length)
+				for physical, length in self._pieces(start, count))
+
+	def read_view(self, start: int, count: int) -> memoryview:
+		"""Return a memoryview of count bytes beginning at start
+
+		If the requested range is contiguous in the underlying buffer, this is
+		a view of the underlying buffer.  Otherwise the pieces are gathered
+		into a new buffer.
+
+		Args:
+			start: Starting position of bytes to return
+			count: Number of bytes to return
+
+		Returns:
+			memoryview of the requested length
+
+		Raises:
+			IndexError if attempt to read outside the buffer is made
+		"""
+		pieces = list(self._pieces(start, count))
+		if len(pieces) == 1:
+			return self._base.read_view(*pieces[0])
+		gathered = bytearray(count)
+		pos = 0
+		for physical, length in pieces:
+			self._base.readinto(
+					physical, memoryview(gathered)[pos:pos + length])
+			pos += length
+		return memoryview(gathered)
+
+	def read1(self, offset: int) -> int:
+		"""Return single byte from buffer as int
+
+		Args:
+			offset: The position of the requested byte in the buffer
+
+		Returns:
+			int value of the requested byte
+
+		Raises:
+			IndexError if attempt to read outside the buffer is made
+		"""
+		if not 0 <= offset < len(self._base):
+			raise IndexError('buffer read with index out of range')
+		unit, offset = divmod(offset, self._unit_size)
+		return self._base.read1(self._physical(unit) + offset)
+
+	def write(
+			self,
+			buf: bytes,
+			start: int,
+			count: Optional[int] = None
+			) -> None:
+		"""Write given bytes-like object to buffer at start
+
+		Args:
+			buf: The bytes-like object to write
+			start: Offset to where in buffer it should be written
+			count: Length to write (default: length of buf)
+
+		Raises:
+			IndexError if attempt to write outside the buffer is made
+			BufferError if the underlying buffer is locked
+			NotImplementedError if the underlying buffer is read-only
+		"""
+		if not count:
+			count = len(buf)
+		buf = memoryview(buf)
+		pos = 0
+		for physical, length in self._pieces(start, count):
+			self._base.write(buf[pos:pos + length], physical, length)
+			pos += length
+
+	@property
+	def changed(self):
+		"""Return True if the underlying buffer has been altered"""
+		return self._base.changed
+
+	@property
+	def locked(self) -> bool:
+		"""Determine writability of the underlying buffer"""
+		return self._base.locked
+
+	def close(self) -> None:
+		"""Close the underlying buffer"""
+		self._base.close()
+
+	def __str__(self) -> str:
+		"""Implement str(self)"""
+		return '<RemapBuffer of {} {}-byte units over {}>'.format(
+				len(self) // self._unit_size, self._unit_size, self._base)
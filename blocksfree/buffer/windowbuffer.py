@@ -0,0 +1,146 @@
+# vim: set tabstop=4 shiftwidth=4 noexpandtab filetype=python:
+
+# Copyright (C) 2017  T. Joseph Carter
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+# or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License
+# for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+"""BufferType that exposes a slice of another buffer
+
+Image formats like 2MG wrap the disk data in a header (and sometimes a
+trailer) of their own.  A WindowBuffer lets the rest of the code see only the
+disk data without copying it out of the image.
+"""
+
+from typing import Optional
+from .buffertype import BufferType
+
+class WindowBuffer(BufferType):
+	"""WindowBuffer(buffer, offset[, length]) -> WindowBuffer
+
+	Present length bytes of buffer beginning at offset as a buffer of their
+	own.  If length is not given, the window extends to the end of buffer.
+	"""
+
+	def __init__(
+			self,
+			buffer: BufferType,
+			offset: int,
+			length: Optional[int] = None
+			) -> None:
+		if length is None:
+			length = len(buffer) - offset
+		if offset < 0 or length < 0 or offset + length > len(buffer):
+			raise IndexError('window lies outside of buffer')
+		self._base = buffer
+		self._offset = offset
+		self._length = length
+
+	def __len__(self) -> int:
+		"""Implement len(self)"""
+		return self._length
+
+	def _check(self, start: int, count: int) -> None:
+		if start < 0 or count < 0 or start + count > self._length:
+			raise IndexError('buffer read with index out of range')
+
+	def read(self, start: int, count: int) -> bytes:
+		"""Return count bytes from buffer beginning at start
+
+		Args:
+			start: Starting position of bytes to return
+			count: Number of bytes to return
+
+		Returns:
+			bytes object of the requested length copied from buffer
+
+		Raises:
+			IndexError if attempt to read outside the buffer is made
+		"""
+		self._check(start, count)
+		return self._base.read(self._offset + start, count)
+
+	def read_view(self, start: int, count: int) -> memoryview:
+		"""Return a memoryview of count bytes beginning at start
+
+		Args:
+			start: Starting position of bytes to return
+			count: Number of bytes to return
+
+		Returns:
+			memoryview of the requested length
+
+		Raises:
+			IndexError if attempt to read outside the buffer is made
+		"""
+		self._check(start, count)
+		return self._base.read_view(self._offset + start, count)
+
+	def read1(self, offset: int) -> int:
+		"""Return single byte from buffer as int
+
+		Args:
+			offset: The position of the requested byte in the buffer
+
+		Returns:
+			int value of the requested byte
+
+		Raises:
+			IndexError if attempt to read outside the buffer is made
+		"""
+		if not 0 <= offset < self._length:
+			raise IndexError('buffer read with index out of range')
+		return self._base.read1(self._offset + offset)
+
+	def write(
+			self,
+			buf: bytes,
+			start: int,
+			count: Optional[int] = None
+			) -> None:
+		"""Write given bytes-like object to buffer at start
+
+		Args:
+			buf: The bytes-like object to write
+			start: Offset to where in buffer it should be written
+			count: Length to write (default: length of buf)
+
+		Raises:
+			IndexError if attempt to write outside the buffer is made
+			BufferError if the underlying buffer is locked
+			NotImplementedError if the underlying buffer is read-only
+		"""
+		if not count:
+			count = len(buf)
+		if start < 0 or count < 0 or start + count > self._length:
+			raise IndexError('buffer write with index out of range')
+		self._base.write(buf, self._offset + start, count)
+
+	@property
+	def changed(self):
+		"""Return True if the underlying buffer has been altered"""
+		return self._base.changed
+
+	@property
+	def locked(self) -> bool:
+		"""Determine writability of the underlying buffer"""
+		return self._base.locked
+
+	def close(self) -> None:
+		"""Close the underlying buffer"""
+		self._base.close()
+
+	def __str__(self) -> str:
+		"""Implement str(self)"""
+		return '<WindowBuffer of {} bytes at {} in {}>'.format(
+				self._length, self._offset, self._base)
@@ -0,0 +1,170 @@
+# vim: set tabstop=4 shiftwidth=4 noexpandtab filetype=python:
+
+# Copyright (C) 2017  T. Joseph Carter
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+# or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License
+# for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+"""Machine-readable catalogs
+
+A catalog is one record per file, written as each file is found rather than
+once the whole image has been read.  A record has the fields in FIELDS, in
+that order, any of which may be None where the image has nothing to say
+(DOS 3.3 has no dates, and ShrinkIt archives have no blocks):
+
+	path: The file's path within the image, as -cat prints it
+	storage_type: ProDOS storage type (DOS 3.3 files are all saplings)
+	file_type: ProDOS file type (DOS 3.3 types are mapped to one)
+	aux_type: ProDOS auxiliary type
+	eof: Length of the file (of its data fork for forked files)
+	blocks_used: Blocks used, or sectors used for DOS 3.3
+	key_pointer: Key block, or [track, sector] of a DOS 3.3 file's first
+		track/sector list
+	created: Creation date, in ISO 8601 local time
+	modified: Modification date, in ISO 8601 local time
+	access: ProDOS access bits
+
+The catalog can be written as NDJSON (one JSON object to a line), as a single
+JSON array of objects, or as CSV with a header row.
+"""
+
+import csv
+import datetime
+import json
+from abc import ABCMeta, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, Optional, TextIO
+
+FIELDS = (
+		'path', 'storage_type', 'file_type', 'aux_type', 'eof',
+		'blocks_used', 'key_pointer', 'created', 'modified', 'access')
+"""Fields of a catalog record, in order"""
+
+def iso_date(timestamp: Optional[int]) -> Optional[str]:
+	"""Return a UNIX timestamp as an ISO 8601 local time, or None"""
+	if timestamp is None:
+		return None
+	return datetime.datetime.fromtimestamp(timestamp).isoformat()
+
+def _ordered(record: Dict[str, Any]) -> OrderedDict:
+	"""Return a record's fields in FIELDS order"""
+	return OrderedDict((field, record[field]) for field in FIELDS)
+
+
+class CatalogWriter(object, metaclass=ABCMeta):
+	"""Abstract stream of catalog records
+
+	Args:
+		output: Text file to write the catalog to
+	"""
+
+	def __init__(self, output: TextIO) -> None:
+		self.output = output
+		self.count = 0
+
+	def __enter__(self) -> 'CatalogWriter':
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback) -> None:
+		self.close()
+
+	def write(self, record: Dict[str, Any]) -> None:
+		"""Write a record
+
+		Args:
+			record: A value for each of FIELDS
+		"""
+		self._write(record)
+		self.count += 1
+
+	@abstractmethod
+	def _write(self, record: Dict[str, Any]) -> None:
+		pass
+
+	def close(self) -> None:
+		"""Finish the catalog and flush the output (which stays open)"""
+		self.output.flush()
+
+
+class NDJSONWriter(CatalogWriter):
+	"""Catalog written as one JSON object to a line"""
+
+	def _write(self, record: Dict[str, Any]) -> None:
+		self.output.write(json.dumps(_ordered(record)) + '\n')
+
+
+class JSONWriter(CatalogWriter):
+	"""Catalog written as a JSON array, one object to a line"""
+
+	def __init__(self, output: TextIO) -> None:
+		super(JSONWriter, self).__init__(output)
+		self._closed = False
+
+	def _write(self, record: Dict[str, Any]) -> None:
+		self.output.write(('[\n' if not self.count else ',\n')
+				+ json.dumps(_ordered(record)))
+
+	def close(self) -> None:
+		if not self._closed:
+			self._closed = True
+			self.output.write('[]\n' if not self.count else '\n]\n')
+		super(JSONWriter, self).close()
+
+
+class CSVWriter(CatalogWriter):
+	"""Catalog written as CSV, headed by the field names
+
+	Fields that are None are left empty, and a DOS 3.3 key pointer is
+	written as track/sector.
+	"""
+
+	def __init__(self, output: TextIO) -> None:
+		super(CSVWriter, self).__init__(output)
+		self._csv = csv.writer(output, lineterminator='\n')
+		self._csv.writerow(FIELDS)
+
+	def _write(self, record: Dict[str, Any]) -> None:
+		row = []
+		for field in FIELDS:
+			value = record[field]
+			if value is None:
+				value = ''
+			elif isinstance(value, (list, tuple)):
+				value = '/'.join(str(part) for part in value)
+			row.append(value)
+		self._csv.writerow(row)
+
+
+CATALOG_FORMATS = {
+		'ndjson': NDJSONWriter,
+		'json': JSONWriter,
+		'csv': CSVWriter,
+		}
+"""Catalog writers by format name"""
+
+def open_catalog(catalog_format: str, output: TextIO) -> CatalogWriter:
+	"""Return a CatalogWriter for a format
+
+	Args:
+		catalog_format: One of CATALOG_FORMATS
+		output: Text file to write the catalog to
+
+	Raises:
+		ValueError: The format isn't one of CATALOG_FORMATS
+	"""
+	try:
+		writer_class = CATALOG_FORMATS[catalog_format]
+	except KeyError:
+		raise ValueError("catalog format {} is not one of {}".format(
+			catalog_format, ', '.join(sorted(CATALOG_FORMATS))))
+	return writer_class(output)
@@ -0,0 +1,254 @@
+# vim: set tabstop=4 shiftwidth=4 noexpandtab filetype=python:
+
+# Copyright (C) 2017  T. Joseph Carter
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+# or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License
+# for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+"""A persistent cache of image catalogs
+
+Cataloging the same unchanging images over and over reads and walks every
+one of them each time.  A CatalogCache keeps the catalog of each image in an
+SQLite database in a cache directory: everything cataloging it output, in
+order, so that it can be output again just the same.  That is an entry for
+each line printed, each message logged, and, with -catfmt, each catalog
+record written (a plain -cat doesn't make records, and so its catalogs are
+cached apart from -catfmt ones).  A catalog is looked up by the image's
+fingerprint (its size, modification time, and a hash of its contents) and
+the options it was cataloged with, so an image that changes simply stops
+being found, and the same image under another name is (the caller counts
+the extension among the options, since that can decide how an image is
+read).  Storing a new catalog of an image drops those of whatever the same
+path held before.
+
+The hash covers the whole image up to HASH_LIMIT bytes, and evenly spaced
+samples of anything larger, which is enough to notice an image being
+replaced without reading all of a hard drive image each time.
+
+Any number of processes can share a cache; SQLite does the locking.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+from typing import Any, List, Optional, Sequence, Tuple
+
+CACHE_NAME = 'catalog.sqlite3'
+CACHE_VERSION = 3
+
+HASH_LIMIT = 1 << 20
+"""Images up to this long are hashed in full"""
+
+HASH_SAMPLES = 16
+HASH_SAMPLE_SIZE = 65536
+"""Number and length of the samples hashed of longer images"""
+
+Fingerprint = Tuple[int, int, str]
+
+LINE = 'line'
+LOG = 'log'
+RECORD = 'record'
+"""Kinds of catalog entry, whose values are a line printed, a [level,
+message] logged, and a catalog record written"""
+
+Entry = Tuple[str, Any]
+
+_SCHEMA = (
+		'DROP TABLE IF EXISTS entries',
+		'DROP TABLE IF EXISTS images',
+		"""CREATE TABLE IF NOT EXISTS images (
+			id INTEGER PRIMARY KEY,
+			path TEXT NOT NULL,
+			size INTEGER NOT NULL,
+			mtime_ns INTEGER NOT NULL,
+			digest TEXT NOT NULL,
+			options TEXT NOT NULL,
+			UNIQUE (size, mtime_ns, digest, options))""",
+		'CREATE INDEX IF NOT EXISTS images_path ON images (path, options)',
+		"""CREATE TABLE IF NOT EXISTS entries (
+			image INTEGER NOT NULL REFERENCES images (id) ON DELETE CASCADE,
+			seq INTEGER NOT NULL,
+			kind TEXT NOT NULL,
+			value TEXT NOT NULL,
+			PRIMARY KEY (image, seq))""",
+		)
+"""Statements replacing whatever tables a cache had with CACHE_VERSION's"""
+
+def fingerprint(image_file: str) -> Fingerprint:
+	"""Return an image's size, modification time in ns, and hash
+
+	Raises:
+		OSError: The image can't be read
+	"""
+	with open(image_file, 'rb') as image:
+		stat = os.fstat(image.fileno())
+		digest = hashlib.sha1()
+		if stat.st_size <= HASH_LIMIT:
+			digest.update(image.read())
+		else:
+			step = (stat.st_size - HASH_SAMPLE_SIZE) // (HASH_SAMPLES - 1)
+			for sample in range(HASH_SAMPLES):
+				image.seek(sample * step)
+				digest.update(image.read(HASH_SAMPLE_SIZE))
+	return stat.st_size, stat.st_mtime_ns, digest.hexdigest()
+
+
+class LogRecorder(logging.Handler):
+	"""Logging handler adding each message logged to a catalog's entries
+
+	Only messages logged by the thread that made the recorder are recorded,
+	since other threads may be logging about other images at the same time.
+
+	Args:
+		entries: List of catalog entries to append (LOG, [level, message]) to
+	"""
+
+	def __init__(self, entries: List[Entry]) -> None:
+		super(LogRecorder, self).__init__()
+		self.entries = entries
+		self.thread = threading.get_ident()
+
+	def filter(self, record: logging.LogRecord) -> bool:
+		return (record.thread == self.thread
+				and super(LogRecorder, self).filter(record))
+
+	def emit(self, record: logging.LogRecord) -> None:
+		self.entries.append((LOG, [record.levelno, record.getMessage()]))
+
+
+class CatalogCache(object):
+	"""Catalogs of images, kept in a cache directory
+
+	Args:
+		cache_dir: Directory holding the cache database (created if need be)
+
+	Raises:
+		OSError: The cache directory can't be created
+		sqlite3.Error: The database can't be opened
+	"""
+
+	def __init__(self, cache_dir: str) -> None:
+		os.makedirs(cache_dir, exist_ok=True)
+		self.path = os.path.join(cache_dir, CACHE_NAME)
+		self._db = sqlite3.connect(self.path, timeout=60)
+		try:
+			if self._version() != CACHE_VERSION:
+				self._create()
+			self._db.execute('PRAGMA foreign_keys = ON')
+		except BaseException:
+			self._db.close()
+			raise
+
+	def _version(self) -> int:
+		"""Return the version of the cache's schema (0 if it's new)"""
+		version, = self._db.execute('PRAGMA user_version').fetchone()
+		return version
+
+	def _create(self) -> None:
+		"""Replace the cache's tables with new ones of CACHE_VERSION
+
+		This is done holding an exclusive lock, checking the version again
+		first, so that of several processes opening a new cache at once
+		only one creates the tables, and nothing another has stored in
+		them since is dropped.
+		"""
+		# BEGIN and COMMIT ourselves; DDL mustn't commit along the way
+		self._db.isolation_level = None
+		try:
+			self._db.execute('BEGIN EXCLUSIVE')
+			try:
+				if self._version() != CACHE_VERSION:
+					for statement in _SCHEMA:
+						self._db.execute(statement)
+					self._db.execute(
+							'PRAGMA user_version = {}'.format(CACHE_VERSION))
+			except BaseException:
+				self._db.execute('ROLLBACK')
+				raise
+			self._db.execute('COMMIT')
+		finally:
+			self._db.isolation_level = ''
+
+	def __enter__(self) -> 'CatalogCache':
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback) -> None:
+		self.close()
+
+	def lookup(
+			self,
+			image: Fingerprint,
+			options: str
+			) -> Optional[List[Entry]]:
+		"""Return the cached catalog of an image, or None if there isn't one
+
+		Args:
+			image: The image's fingerprint()
+			options: The options affecting its catalog
+
+		Returns:
+			The (kind, value) of each entry, in the order they were output
+		"""
+		row = self._db.execute(
+				'SELECT id FROM images WHERE size = ? AND mtime_ns = ? '
+				'AND digest = ? AND options = ?',
+				image + (options,)).fetchone()
+		if row is None:
+			return None
+		return [(kind, json.loads(value))
+				for kind, value in self._db.execute(
+					'SELECT kind, value FROM entries WHERE image = ? '
+					'ORDER BY seq', row)]
+
+	def store(
+			self,
+			image_file: str,
+			image: Fingerprint,
+			options: str,
+			entries: Sequence[Entry]
+			) -> None:
+		"""Cache the catalog of an image, replacing any already cached
+
+		Catalogs made with the same options of whatever image_file held
+		before are dropped, so that the cache doesn't keep growing as the
+		images in it change.
+
+		Args:
+			image_file: Path of the image
+			image: The image's fingerprint()
+			options: The options affecting its catalog
+			entries: The (kind, value) of each entry, in the order they were
+				output
+		"""
+		path = os.path.abspath(image_file)
+		with self._db:
+			self._db.execute(
+					'DELETE FROM images WHERE (path = ? AND options = ?) '
+					'OR (size = ? AND mtime_ns = ? AND digest = ? '
+					'AND options = ?)', (path, options) + image + (options,))
+			image_id = self._db.execute(
+					'INSERT INTO images (path, size, mtime_ns, digest, '
+					'options) VALUES (?, ?, ?, ?, ?)',
+					(path,) + image + (options,)).lastrowid
+			self._db.executemany(
+					'INSERT INTO entries (image, seq, kind, value) '
+					'VALUES (?, ?, ?, ?)',
+					((image_id, seq, kind, json.dumps(value))
+						for seq, (kind, value) in enumerate(entries)))
+
+	def close(self) -> None:
+		"""Close the database"""
+		self._db.close()
@@ -20,24 +20,150 @@
 """
 
 import os
+import struct
+from collections import namedtuple
+from typing import Optional
 from .buffer.bytebuffer import ByteBuffer
+from .buffer.buffertype import BufferType
+from .buffer.mmapbuffer import MmapBuffer
+from .buffer.remapbuffer import RemapBuffer
+from .buffer.windowbuffer import WindowBuffer
+from .logging import LOG
 
 # FIXME Move to_sys_name
 from . import legacy
 
+def dopo_sector(sector: int) -> int:
+	"""Return the sector holding a given sector after a DOS/ProDOS reorder
+
+	Turning a DOS 3.3 ordered track into a ProDOS ordered one (or the other
+	way around) leaves sectors 0 and 15 alone and reverses the rest, which
+	makes the swap its own inverse.
+
+	Args:
+		sector: A sector number within a track (0-15)
+
+	Returns:
+		The corresponding sector number in the other ordering
+	"""
+	return sector if sector in (0, 15) else 15 - sector
+
+def _dopo_unit(unit: int) -> int:
+	"""Return the physical sector number of a logical 140k image sector"""
+	track, sector = divmod(unit, 16)
+	return track * 16 + dopo_sector(sector)
+
+DOPO_OFFSETS = tuple(_dopo_unit(unit) * 256 for unit in range(560))
+"""Byte offsets of each sector of a 140k image in the opposite ordering"""
+
+def dopo_swap(buffer: BufferType) -> RemapBuffer:
+	"""Return a view of a 140k image in the opposite sector ordering
+
+	Sectors are translated as they're read, so this costs nothing up front
+	no matter how little of the image is actually used.
+
+	Args:
+		buffer: A 143360 byte buffer in DOS 3.3 or ProDOS sector order
+
+	Returns:
+		A RemapBuffer over buffer in the other sector order
+	"""
+	return RemapBuffer(buffer, 256, _dopo_unit, DOPO_OFFSETS)
+
+TWOIMG_MAGIC = b'2IMG'
+TWOIMG_HEADER = struct.Struct('<4s4sHHIIIIIIIII16x')
+"""Layout of the 64 byte 2MG (aka 2IMG) header, all values little-endian"""
+
+TWOIMG_DOS_ORDER = 0
+TWOIMG_PRODOS_ORDER = 1
+TWOIMG_NIBBLE = 2
+
+TwoImgHeader = namedtuple('TwoImgHeader', (
+		'magic', 'creator', 'header_len', 'version', 'image_format', 'flags',
+		'prodos_blocks', 'data_offset', 'data_len', 'comment_offset',
+		'comment_len', 'creator_offset', 'creator_len'))
+
+def read_2mg_header(buffer: BufferType) -> Optional[TwoImgHeader]:
+	"""Return the 2MG header of an image, if it has one
+
+	Some images in the wild have a data length of zero.  In that case the
+	length is derived from the ProDOS block count or, failing that, runs to
+	the end of the image.  A data length running past the end of the image is
+	likewise truncated.
+
+	Args:
+		buffer: The raw image buffer
+
+	Returns:
+		A TwoImgHeader with data_offset and data_len adjusted to be usable, or
+		None if buffer does not begin with a 2MG header
+	"""
+	if (len(buffer) < TWOIMG_HEADER.size
+			or buffer.read(0, 4) != TWOIMG_MAGIC):
+		return None
+	header = TwoImgHeader._make(
+			TWOIMG_HEADER.unpack(buffer.read(0, TWOIMG_HEADER.size)))
+	data_offset = header.data_offset or header.header_len
+	available = max(len(buffer) - data_offset, 0)
+	data_len = header.data_len
+	if not data_len and header.image_format == TWOIMG_PRODOS_ORDER:
+		data_len = header.prodos_blocks * 512
+	if not data_len or data_len > available:
+		if data_len:
+			LOG.warning("2MG data length exceeds image, truncating")
+		data_len = available
+	return header._replace(data_offset=data_offset, data_len=data_len)
+
+def open_buffer(file_path: str, use_mmap: bool = True) -> BufferType:
+	"""Return a read-only BufferType for the image file at file_path
+
+	Regular files are memory-mapped when possible so that only the parts of
+	the image we actually read are loaded.  Anything that can't be mapped
+	(empty files, pipes, filesystems without mmap support) is read into
+	memory instead.
+
+	Args:
+		file_path: Path to the image file
+		use_mmap: False to always read the whole file into memory
+
+	Returns:
+		A BufferType containing the image
+	"""
+	sys_path = legacy.to_sys_name(file_path)
+	if use_mmap and os.path.isfile(sys_path) and os.path.getsize(sys_path):
+		try:
+			return MmapBuffer(sys_path)
+		except (OSError, ValueError):
+			pass
+	with open(sys_path, "rb") as imagefile:
+		return ByteBuffer(imagefile.read())
+
 class Disk:
 	"""A basic "intelligent" (hopefully at some point) disk image class
 	"""
-	def __init__(self, name: str = None) -> None:
+	def __init__(self, name: str = None, use_mmap: bool = True) -> None:
 		if name is not None:
 			self.pathname = name
 			self.path, self.filename = os.path.split(name)
 			self.diskname, self.ext = os.path.splitext(self.filename)
 			self.ext = os.path.splitext(name)[1].lower()
 			# FIXME: Handle compressed images?
-			with open(legacy.to_sys_name(name), "rb") as imagefile:
-				self.buffer = ByteBuffer(imagefile.read())
+			self.buffer = open_buffer(name, use_mmap)
+			self.twoimg = read_2mg_header(self.buffer)
+			if self.twoimg:
+				self.buffer = WindowBuffer(self.buffer,
+						self.twoimg.data_offset, self.twoimg.data_len)
 
 	def __len__(self) -> int:
 		"""Implement len(self)"""
 		return len(self.buffer)
+
+	def __enter__(self) -> 'Disk':
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback) -> None:
+		self.close()
+
+	def close(self) -> None:
+		"""Release the image buffer"""
+		self.buffer.close()
@@ -0,0 +1,272 @@
+# vim: set tabstop=4 shiftwidth=4 noexpandtab filetype=python:
+
+# Copyright (C) 2013-2016  Ivan Drucker
+# Copyright (C) 2017       T. Joseph Carter
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+# or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License
+# for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+"""DOS 3.3 catalog structures
+
+The DOS 3.3 catalog is a chain of 256 byte sectors, each holding seven 35 byte
+file entries starting at offset 0x0b.  An entry whose first byte is zero has
+never been used and marks the end of the catalog, and one whose first byte is
+0xff has been deleted.
+
+Entries are unpacked with a single struct call into slotted records.  What an
+entry can't tell us (the load address of a binary file, or the length of
+anything) has to be read from the file itself.  The file's track/sector list
+is walked at most once and the resulting list of data sectors is kept with
+the entry for anything else that needs it.
+"""
+
+import struct
+from typing import Iterator, List, Tuple
+
+from .buffer.buffertype import BufferType
+from .logging import LOG
+
+SECTOR_SIZE = 256
+SECTORS_PER_TRACK = 16
+ENTRY_LENGTH = 35
+ENTRIES_PER_SECTOR = 7
+FIRST_ENTRY = 0x0b
+
+ENTRY = struct.Struct('<BBB30sH')
+"""Layout of a 35 byte DOS 3.3 catalog entry"""
+
+# DOS 3.3 file types (with the locked bit masked off) as ProDOS types
+FILE_TYPES = {
+		0x00: 0x04,  # T: TXT
+		0x01: 0xfa,  # I: INT
+		0x02: 0xfc,  # A: BAS
+		0x04: 0x06,  # B: BIN
+		}
+
+def ts(track: int, sector: int) -> int:
+	"""Return the byte offset of a track and sector in a DOS ordered image"""
+	return (track * SECTORS_PER_TRACK + sector) * SECTOR_SIZE
+
+
+class FileEntry(object):
+	"""A DOS 3.3 catalog entry
+
+	Attributes:
+		catalog: (track, sector) of the catalog sector holding the entry
+		key_pointer: (track, sector) of the first track/sector list sector
+		storage_type: Always 2 (sapling) for an active file, for the sake of
+			code which handles ProDOS and DOS 3.3 alike
+		dos_type: The DOS 3.3 file type with the locked bit masked off
+		locked: True if the file is locked
+		file_type: The closest ProDOS file type as an int
+		name: The file name with high bits and trailing spaces stripped
+		sector_count: Number of sectors used, per the catalog
+
+	The data sectors of the file are cached in the entry by data_sectors(),
+	as are its length and auxiliary type by file_length() and aux_type(), so
+	none of them are worked out until something asks for them, and then only
+	once.
+	"""
+	__slots__ = (
+			'catalog', 'key_pointer', 'storage_type', 'dos_type', 'locked',
+			'file_type', 'name', 'sector_count', '_sectors', '_length',
+			'_aux_type')
+
+	def __init__(self, catalog: Tuple[int, int], fields: tuple) -> None:
+		track, sector, dos_type, name, self.sector_count = fields
+		self.catalog = catalog
+		self.key_pointer = (track, sector)
+		self.storage_type = 2
+		self.dos_type = dos_type & 0x7f
+		self.locked = bool(dos_type & 0x80)
+		self.file_type = FILE_TYPES.get(self.dos_type, 0x04)
+		self.name = bytes(char & 0x7f for char in name).rstrip()
+		self._sectors = None
+		self._length = None
+		self._aux_type = None
+
+	def __repr__(self) -> str:
+		return '<DOS 3.3 FileEntry {!r} type ${:02x}>'.format(
+				self.name, self.file_type)
+
+
+def read_catalog(
+		buffer: BufferType,
+		first: Tuple[int, int]
+		) -> Iterator[FileEntry]:
+	"""Yield the active entries of a DOS 3.3 catalog
+
+	The walk ends at the first never-used entry, at the end of the sector
+	chain, or if the chain loops back on itself or points outside the image.
+
+	Args:
+		buffer: The disk image, in DOS 3.3 order
+		first: (track, sector) of the first catalog sector, from the VTOC
+
+	Yields:
+		A FileEntry for each active entry in catalog order
+	"""
+	seen = set()
+	catalog = tuple(first)
+	while catalog != (0, 0) and catalog not in seen:
+		seen.add(catalog)
+		pos = ts(*catalog)
+		if pos + SECTOR_SIZE > len(buffer):
+			break
+		with buffer.read_view(pos, SECTOR_SIZE) as raw:
+			next_catalog = (raw[1], raw[2])
+			entries = list(ENTRY.iter_unpack(raw[FIRST_ENTRY:
+					FIRST_ENTRY + ENTRY_LENGTH * ENTRIES_PER_SECTOR]))
+		for fields in entries:
+			if fields[0] == 0:
+				return  # no more file entries
+			if fields[0] != 0xff:  # skip deleted files
+				yield FileEntry(catalog, fields)
+		catalog = next_catalog
+
+def walk_ts_list(
+		buffer: BufferType,
+		first: Tuple[int, int]
+		) -> List[Tuple[int, int]]:
+	"""Return the data sectors listed by a chain of track/sector lists
+
+	The list of data sectors ends at the first empty (0, 0) pair or at the end
+	of the chain.  A chain which loops back on itself, or any pointer outside
+	the image, also ends it (with a warning) so that a corrupted catalog can't
+	keep us walking forever.
+
+	Args:
+		buffer: The disk image, in DOS 3.3 order
+		first: (track, sector) of the first track/sector list sector
+
+	Returns:
+		A list of (track, sector) tuples in file order
+	"""
+	tracks = len(buffer) // (SECTOR_SIZE * SECTORS_PER_TRACK)
+	def valid(pair):
+		return pair[0] < tracks and pair[1] < SECTORS_PER_TRACK
+
+	sectors = []
+	seen = set()
+	tslist = tuple(first)
+	while tslist != (0, 0):
+		if tslist in seen:
+			LOG.warning("track/sector list loops back on itself")
+			break
+		if not valid(tslist):
+			LOG.warning("bad track/sector list pointer {}", tslist)
+			break
+		seen.add(tslist)
+		with buffer.read_view(ts(*tslist), SECTOR_SIZE) as raw:
+			tslist = (raw[1], raw[2])
+			pairs = raw[12:SECTOR_SIZE].tolist()
+		for pair in zip(pairs[0::2], pairs[1::2]):
+			if pair == (0, 0):
+				return sectors
+			if not valid(pair):
+				LOG.warning("bad data sector pointer {}", pair)
+				return sectors
+			sectors.append(pair)
+	return sectors
+
+def data_sectors(
+		buffer: BufferType,
+		entry: FileEntry
+		) -> List[Tuple[int, int]]:
+	"""Return the data sectors of a file, walking its T/S list only once
+
+	Args:
+		buffer: The disk image, in DOS 3.3 order
+		entry: The catalog entry of the file
+
+	Returns:
+		A list of (track, sector) tuples in file order, see walk_ts_list()
+	"""
+	if entry._sectors is None:  # pylint: disable=protected-access
+		entry._sectors = walk_ts_list(buffer, entry.key_pointer)
+	return entry._sectors  # pylint: disable=protected-access
+
+def _file_header(buffer: BufferType, entry: FileEntry, offset: int) -> int:
+	"""Return a 16-bit value from the start of a file's data"""
+	sectors = data_sectors(buffer, entry)
+	if not sectors:
+		return 0
+	return struct.unpack('<H', buffer.read(ts(*sectors[0]) + offset, 2))[0]
+
+def aux_type(buffer: BufferType, entry: FileEntry) -> int:
+	"""Return the ProDOS auxiliary type of a DOS 3.3 file
+
+	Binary files keep their load address in their first two bytes.  The other
+	types have fixed values.
+
+	Args:
+		buffer: The disk image, in DOS 3.3 order
+		entry: The catalog entry of the file
+
+	Returns:
+		The auxiliary type as an int
+	"""
+	# pylint: disable=protected-access
+	if entry._aux_type is None:
+		entry._aux_type = _aux_type(buffer, entry)
+	return entry._aux_type
+
+def _aux_type(buffer: BufferType, entry: FileEntry) -> int:
+	"""Work out a file's auxiliary type for aux_type()"""
+	if entry.file_type == 0x06:  # BIN (B)
+		# file address is in first two bytes of file data
+		return _file_header(buffer, entry, 0)
+	elif entry.file_type == 0xfc:  # BAS (A)
+		return 0x0801
+	elif entry.file_type == 0xfa:  # INT (I)
+		return 0x9600
+	else:  # TXT (T) or other
+		return 0x0000
+
+def file_length(buffer: BufferType, entry: FileEntry) -> int:
+	"""Return the length of a DOS 3.3 file
+
+	Binary, Applesoft, and Integer BASIC files record their own length at the
+	start of their data.  Everything else is as long as all of the sectors in
+	its track/sector list, less anything after the last non-zero byte of the
+	final sector.
+
+	Args:
+		buffer: The disk image, in DOS 3.3 order
+		entry: The catalog entry of the file
+
+	Returns:
+		The length of the file in bytes, including any address and length
+		header at the start of the data
+	"""
+	# pylint: disable=protected-access
+	if entry._length is None:
+		entry._length = _file_length(buffer, entry)
+	return entry._length
+
+def _file_length(buffer: BufferType, entry: FileEntry) -> int:
+	"""Work out a file's length for file_length()"""
+	if entry.file_type == 0x06:  # BIN (B)
+		# file length is in second two bytes of file data
+		return _file_header(buffer, entry, 2) + 4
+	elif entry.file_type in (0xfc, 0xfa):  # BAS (A) or INT (I)
+		# file length is in first two bytes of file data
+		return _file_header(buffer, entry, 0) + 2
+
+	# TXT (T) or other
+	sectors = data_sectors(buffer, entry)
+	if not sectors:
+		return 0
+	# now find out where the file really ends by finding the last 00
+	last = buffer.read(ts(*sectors[-1]), SECTOR_SIZE).rstrip(b'\0')
+	return (len(sectors) - 1) * SECTOR_SIZE + len(last)
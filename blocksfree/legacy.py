@@ -42,7 +42,8 @@ options:
 
 + after a file name indicates a GS/OS or Mac OS extended (forked) file.
 Wildcard matching (*) is not supported and images are not validated.
-ShrinkIt support requires Nulib2. cppo requires Python 2.6+ or 3.0+."""
+ShrinkIt archives using Huffman squeeze or LZC are not supported.
+cppo requires Python 2.6+ or 3.0+."""
 
 # cppo by Ivan X, ivan@ivanx.com, ivanx.com/appleii
 
@@ -51,61 +52,17 @@ ShrinkIt support requires Nulib2. cppo requires Python 2.6+ or 3.0+."""
 import sys
 import os
 import datetime
-import shutil
 import errno
-import uuid  # for temp directory
-import subprocess
-#import tempfile  # not used, but should be for temp directory?
+import sqlite3
 import struct
-from binascii import a2b_hex, b2a_hex
 
-from . import diskimg
+from . import (
+		appledouble, catalog, catcache, diskimg, dos33, manifest, nufx, prodos,
+		sink)
 from .logging import LOG
 
-class Globals:
-	pass
-
-g = Globals()
-
-g.out_data = bytearray(b'')
-g.ex_data = None
-
-g.activeDirBlock = None
-g.activeFileName = None
-g.activeFileSize = None
-g.activeFileBytesCopied = 0
-g.resourceFork = 0
-g.shk_hasrf = False
-
-g.PDOSPATH = []
-g.PDOSPATH_INDEX = 0
-g.PDOSPATH_SEGMENT = None
-g.DIRPATH = ""
-
-g.target_name = None
-g.target_dir = ""
-g.appledouble_dir = None
-g.image_file = None
-g.extract_file = None
-
-# runtime options
-g.use_appledouble = False   # -ad  (AppleDouble headers + resource forks)
-g.use_extended = False      # -e   (extended filenames + resource forks)
-g.catalog_only = False      # -cat (catalog only, no extract)
-g.casefold_upper = False    # -uc  (GS/OS mixed case filenames extract as uppercase)
-g.src_shk = False           # -shk (ShrinkIt archive source)
-g.prodos_names = False      # -pro (adapt DOS 3.3 names to ProDOS)
-g.afpsync_msg = True        # -s   (sets False to suppress afpsync message at end)
-g.extract_in_place = False  # -n   (don't create parent dir for SHK, extract files in place)
-g.dos33 = False             #      (DOS 3.3 image source, selected automatically)
-
 # functions
 
-def pack_u24be(buf: bytearray, offset: int, val: int):
-	lo16 = val & 0xffff
-	hi8 = (val >> 16) & 0xff
-	struct.pack_into('>BH', buf, offset, hi8, lo16)
-
 def pack_u32be(buf: bytearray, offset: int, val: int):
 	# Currently unused, will be needed for resource fork dates later
 	struct.pack_into('>L', buf, offset, val)
@@ -117,288 +74,21 @@ def unpack_u24le(buf: bytes, offset: int = 0) -> int:
 	lo16, hi8 = struct.unpack_from('<HB', buf, offset)
 	return lo16 | (hi8 << 16)
 
+class ShkEntry(object):
+	"""A file in a ShrinkIt archive
 
-def date_prodos_to_unix(prodos_date: bytes) -> int:
-	"""Returns a UNIX timestamp given a raw ProDOS date"""
-	"""The ProDOS date consists of two 16-bit words stored little-
-	endian.  We receive them as raw bytes with this layout:
-
-	  mmmddddd yyyyyyym 00MMMMMM 000HHHHH
-
-	where:
-
-	  year     yyyyyyy
-	  month    m mmm
-	  day      ddddd
-	  hour     HHHHH
-	  minute   MMMMMM
-
-	Some notes about that:
-
-	- The high bit of the month is the low bit of prodos_date[1], the rest of
-	  lower bits are found in prodos_date[0].
-	- The two-digit year treats 40-99 as being 19xx, else 20xx.
-	- ProDOS has only minute-precision for its timestamps.  Data regarding
-	  seconds is lost.
-	- ProDOS dates are naive in the sense they lack a timezone.  We (naively)
-	  assume these timestamps are in local time.
-	- The unused bits in the time fields are masked off, just in case they're
-	  ever NOT zero.  2040 is coming.
+	Attributes:
+		path: The directory holding the file in the archive, separated by
+			"/" ("" at the top level)
+		name: The file name, including nulib2's #typeaux suffix
+		record: The file's nufx.Record
 	"""
-	try:
-		year = (prodos_date[1] & 0xfe)>>1
-		year += 1900 if year >= 40 else 2000
-		month = ((prodos_date[1] & 0x01)<<4) | ((prodos_date[0] & 0xe0)>>5)
-		day = prodos_date[0] & 0x1f
-		hour = prodos_date[3] & 0x1f
-		minute = prodos_date[2] & 0x3f
-
-		return int(datetime.datetime(year, month, day,
-			hour, minute).timestamp())
-	except:
-		# <NO DATE> is always an option
-		return None
-
-APPLE_EPOCH_OFFSET = 946684800
-"""The number of seconds between 1970-01-01 amd 2000-01-01"""
-# $ date --date="2000-01-01 00:00:00 GMT" +%s
-# 946684800
-
-def date_unix_to_appledouble(unix_date):
-	""" convert UNIX date to Apple epoch (2000-01-01) """
-	# input: seconds since Unix epoch (1-Jan-1970 00:00:00 GMT)
-	# output: seconds since Netatalk epoch (1-Jan-2000 00:00:00 GMT),
-	#         in 4 bytes
-	adDate = int(unix_date - APPLE_EPOCH_OFFSET)
-	# Think: "UNIX dates have 30 years too many seconds to be Apple dates,
-	# so we need to subtract 30 years' worth of seconds."
-	if adDate < 0:
-		adDate += 1<<32  # to get negative hex number
-	return adDate.to_bytes(4, 'big')
-
-# cppo support functions:
-# arg1: directory block or [T,S] containing file entry, or shk file dir path
-# arg2: file index in overall directory (if applicable), or shk file name
-
-# returns byte position in disk image file
-def getStartPos(arg1, arg2):
-	if g.dos33:
-		return (ts(arg1) + (35 * (arg2 % 7)) + 11)
-	else:  # ProDOS
-		return ( (arg1 * 512)
-				+ (39 * ((arg2 + (arg2 > 11)) % 13))
-				+ (4 if arg2 > 11 else 43) )
-
-def getStorageType(disk, arg1, arg2):
-	start = getStartPos(arg1, arg2)
-	firstByte = disk.buffer.read1(start)
-	return (int(firstByte != 255)*2 if g.dos33 else (firstByte//16))
-
-def getFileName(disk, arg1, arg2):
-	start = getStartPos(arg1, arg2)
-	if g.dos33:
-		fileNameLo = bytearray()
-		fileNameHi = disk.buffer.read(start + 3, 30)
-		for b in fileNameHi:
-			fileNameLo.append(b & 0x7f)
-		fileName = bytes(fileNameLo).rstrip()
-	else:  # ProDOS
-		firstByte = disk.buffer.read1(start)
-		entryType = firstByte//16
-		nameLength = firstByte - entryType*16
-		fileName = disk.buffer.read(start + 1, nameLength)
-		caseMask = getCaseMask(disk, arg1, arg2)
-		if caseMask and not g.casefold_upper:
-			fileName = bytearray(fileName)
-			for i in range(0, len(fileName)):
-				if caseMask[i] == "1":
-					fileName[i:i+1] = fileName[i:i+1].lower()
-			fileName = bytes(fileName)
-	return fileName
-
-def getCaseMask(disk, arg1, arg2):
-	start = getStartPos(arg1, arg2)
-	caseMaskDec = unpack_u16le(disk.buffer.read(start + 28, 2))
-	if caseMaskDec < 32768:
-		return None
-	else:
-		return format(caseMaskDec - 32768, '015b')
-
-def getFileType(disk, arg1, arg2):
-	if g.src_shk:
-		return arg2.split('#')[1][0:2]
-	start = getStartPos(arg1, arg2)
-	if g.dos33:
-		d33fileType = disk.buffer.read1(start + 2)
-		if (d33fileType & 127) == 4:
-			return '06'  # BIN
-		elif (d33fileType & 127) == 1:
-			return 'FA'  # INT
-		elif (d33fileType & 127) == 2:
-			return 'FC'  # BAS
-		else:
-			return '04'  # TXT or other
-	else:  # ProDOS
-		return format(disk.buffer.read1(start + 16), '02x')
-
-def getAuxType(disk, arg1, arg2):
-	if g.src_shk:
-		return arg2.split('#')[1][2:6]
-	start = getStartPos(arg1, arg2)
-	if g.dos33:
-		fileType = getFileType(disk, arg1, arg2)
-		if fileType == '06':  # BIN (B)
-			# file address is in first two bytes of file data
-			fileTSlist = list(disk.buffer.read(start, 2))
-			fileStart = list(disk.buffer.read(ts(fileTSlist)+12, 2))
-			file_addr = unpack_u16le(disk.buffer.read(ts(fileStart), 2))
-			return format(file_addr, '04x')
-		elif fileType == 'FC':  # BAS (A)
-			return '0801'
-		elif fileType == 'FA':  # INT (I)
-			return '9600'
-		else:  # TXT (T) or other
-			return '0000'
-	else:  # ProDOS
-		return format(unpack_u16le(disk.buffer.read(start + 31, 2)) , '04x')
-
-def getKeyPointer(disk, arg1, arg2):
-	start = getStartPos(arg1, arg2)
-	if g.dos33:
-		return list(disk.buffer.read(start, 2))
-	else:  # ProDOS
-		return unpack_u16le(disk.buffer.read(start + 17, 2))
-
-def getFileLength(disk, arg1, arg2):
-	start = getStartPos(arg1, arg2)
-	if g.dos33:
-		fileType = getFileType(disk, arg1, arg2)
-		fileTSlist = list(disk.buffer.read(start, 2))
-		fileStart = list(disk.buffer.read(ts(fileTSlist) + 12, 2))
-		if fileType == '06':  # BIN (B)
-			# file length is in second two bytes of file data
-			file_size = unpack_u16le(disk.buffer.read(ts(fileStart) + 2, 2)) + 4
-		elif fileType == 'FC' or fileType == 'FA':  # BAS (A) or INT (I)
-			# file length is in first two bytes of file data
-			file_size = unpack_u16le(disk.buffer.read(ts(fileStart), 2)) + 2
-		else:  # TXT (T) or other
-			# sadly, we have to walk the whole file
-			# length is determined by sectors in TSlist, minus wherever
-			# anything after the first zero in the last sector
-			file_size = 0
-			lastTSpair = None
-			prevTSpair = [0,0]
-			nextTSlistSector = fileTSlist
-			endFound = False
-			while not endFound:
-				pos = ts(nextTSlistSector)
-				for tsPos in range(12, 256, 2):
-					cur_ts_pair = list(disk.buffer.read(pos + tsPos, 2))
-					if ts(cur_ts_pair) != 0:
-						file_size += 256
-						prevTSpair = cur_ts_pair
-					else:
-						lastTSpair = prevTSpair
-						endFound = True
-						break
-				if not lastTSpair:
-					nextTSlistSector = list(disk.buffer.read(pos + 1, 2))
-					if nextTSlistSector[0]+nextTSlistSector[1] == 0:
-						lastTSpair = prevTSpair
-						endFound = True
-						break
-			file_size -= 256
-			pos = ts(prevTSpair)
-			# now find out where the file really ends by finding the last 00
-			for offset in range(255, -1, -1):
-				#print("pos: {#b}".format(pos))
-				if disk.buffer.read1(pos + offset) != 0:
-					file_size += (offset + 1)
-					break
-	else:  # ProDOS
-		file_size = unpack_u24le(disk.buffer.read(start + 21, 3))
-
-	return file_size
-
-def getCreationDate(disk, arg1, arg2):
-	#outputs prodos creation date/time as Unix time
-	#  (seconds since Jan 1 1970 GMT)
-	#or None if there is none
-	if g.src_shk:
-		return None
-	elif g.dos33:
-		return None
-	else:  # ProDOS
-		start = getStartPos(arg1, arg2)
-		return date_prodos_to_unix(disk.buffer.read(start + 24, 4))
-
-def getModifiedDate(disk, arg1, arg2):
-	#outputs prodos modified date/time as Unix time
-	#  (seconds since Jan 1 1970 GMT)
-	#or None if there is none
-
-	if g.src_shk:
-		return int(os.path.getmtime(os.path.join(arg1, arg2)))
-	elif g.dos33:
-		return None
-	else:  # ProDOS
-		start = getStartPos(arg1, arg2)
-		return date_prodos_to_unix(disk.buffer.read(start + 33, 4))
-
-def getVolumeName(disk):
-	return getWorkingDirName(disk, 2)
-
-def getWorkingDirName(disk, arg1, arg2=None):
-	# arg1:block, arg2:casemask (optional)
-	start = arg1 * 512
-	firstByte = disk.buffer.read1(start + 4)
-	entryType = firstByte // 16
-	nameLength = firstByte - entryType * 16
-	workingDirName = disk.buffer.read(start + 5, nameLength)
-	if entryType == 15:  # volume directory, get casemask from header
-		caseMaskDec = unpack_u16le(disk.buffer.read(start + 26, 2))
-		if caseMaskDec < 32768:
-			caseMask = None
-		else:
-			caseMask = format(caseMaskDec - 32768,'015b')
-	else:  # subdirectory, get casemask from arg2 (not available in header)
-		caseMask = arg2
-	if caseMask and not g.casefold_upper:
-		workingDirName = bytearray(workingDirName)
-		for i in range(0, len(workingDirName)):
-			if caseMask[i] == "1":
-				workingDirName[i:i+1] = workingDirName[i:i+1].lower()
-		workingDirName = bytes(workingDirName)
-	return workingDirName
-
-def getDirEntryCount(disk, arg1):
-	if g.dos33:
-		entryCount = 0
-		nextSector = arg1
-		while True:
-			top = ts(nextSector)
-			pos = top+11
-			for e in range(0, 7):
-				if disk.buffer.read1(pos) == 0:
-					return entryCount  # no more file entries
-				else:
-					if disk.buffer.read1(pos) != 255:
-						entryCount += 1  # increment if not deleted file
-					pos += 35
-			nextSector = list(disk.buffer.read(top + 1, 2))
-			if nextSector == [0,0]:  # no more catalog sectors
-				return entryCount
-	else:  # ProDOS
-		start = arg1 * 512
-		return unpack_u16le(disk.buffer.read(start + 37, 2))
-
-def getDirNextChunkPointer(disk, arg1):
-	if g.dos33:
-		start = ts(arg1)
-		return list(disk.buffer.read(start + 1, 2))
-	else:  # ProDOS
-		start = arg1 * 512
-		return unpack_u16le(disk.buffer.read(start + 2, 2))
+	__slots__ = ('path', 'name', 'record')
+
+	def __init__(self, path, name, record):
+		self.path = path
+		self.name = name
+		self.record = record
 
 def toProdosName(name):
 	i = 0
@@ -422,364 +112,6 @@ def ts(track, sector=None):
 		sector = int(sector, 16)
 	return track*16*256 + sector*256
 
-def sli(start, length=1, ext=None):
-	"""return a slice object from an offset and length"""
-	return slice(start, start + length, ext)
-
-# --- main logic functions
-
-def copyFile(arg1, arg2, disk):
-	#arg1/arg2:
-	#  ProDOS  : directory block  / file index in overall directory
-	#  DOS 3.3 : [track, sector]  / file index in overall VTOC
-	#  ShrinkIt: directory path   / file name
-	# copies file or dfork to g.out_data, rfork if any to g.ex_data
-	g.activeFileBytesCopied = 0
-
-	if g.src_shk:
-		with open(os.path.join(arg1, arg2), 'rb') as infile:
-			g.out_data += infile.read()
-		if g.shk_hasrf:
-			print("    [data fork]")
-			if g.use_extended or g.use_appledouble:
-				print("    [resource fork]")
-				if g.ex_data == None:
-					g.ex_data = bytearray(b'')
-				with open(os.path.join(arg1, (arg2 + "r")), 'rb') as infile:
-					g.ex_data += infile.read()
-	else:  # ProDOS or DOS 3.3
-		storageType = getStorageType(disk, arg1, arg2)
-		keyPointer = getKeyPointer(disk, arg1, arg2)
-		fileLen = getFileLength(disk, arg1, arg2)
-		if storageType == 1:  #seedling
-			copyBlock(disk, keyPointer, fileLen)
-		elif storageType == 2:  #sapling
-			processIndexBlock(disk, keyPointer)
-		elif storageType == 3:  #tree
-			processMasterIndexBlock(disk, keyPointer)
-		elif storageType == 5:  #extended (forked)
-			processForkedFile(disk, keyPointer)
-	if g.prodos_names:
-		# remove address/length data from DOS 3.3 file data if ProDOS target
-		if getFileType(disk, arg1, arg2) == '06':
-			g.out_data = g.out_data[4:]
-		elif (getFileType(disk, arg1, arg2) == 'FA'
-				or getFileType(disk, arg1, arg2) == 'FC'):
-			g.out_data = g.out_data[2:]
-
-def copyBlock(disk, arg1, arg2):
-	#arg1: block number or [t,s] to copy
-	#arg2: bytes to write (should be 256 (DOS 3.3) or 512 (ProDOS),
-	#      unless final block with less)
-	#print(arg1 + " " + arg2 + " " + g.activeFileBytesCopied)
-	if arg1 == 0:
-		outBytes = bytes(arg2)
-	else:
-		if g.dos33:
-			outBytes = disk.buffer.read(ts(arg1), arg2)
-		else:
-			outBytes = disk.buffer.read(arg1 * 512, arg2)
-	# FIXME: Sort out the read-one vs. read-many problem later
-	if type(outBytes) == int:
-		outBytes = bytes((outBytes))
-	if g.resourceFork > 0:
-		if g.use_appledouble or g.use_extended:
-			offset = (741 if g.use_appledouble else 0)
-			if g.ex_data == None:
-				g.ex_data = bytearray(b'')
-			g.ex_data[
-					g.activeFileBytesCopied + offset
-					: g.activeFileBytesCopied + offset + arg2
-					] = outBytes
-	else:
-		g.out_data[
-				g.activeFileBytesCopied
-				: g.activeFileBytesCopied + arg2
-				] = outBytes
-	g.activeFileBytesCopied += arg2
-
-def process_dir(disk, arg1, arg2=None, arg3=None, arg4=None, arg5=None):
-	# arg1: ProDOS directory block, or DOS 3.3 [track,sector]
-	# for key block (with directory header):
-	#   arg2: casemask (optional), arg3:None, arg4:None, arg5:None
-	# for secondary directory blocks (non-key block):
-	#   arg2/3/4/5: for non-key chunks: entryCount, entry#,
-	#   workingDirName, processedEntryCount
-
-	entryCount = None
-	e = None
-	pe = None
-	workingDirName = None
-
-	if arg3:
-		entryCount = arg2
-		e = arg3
-		workingDirName = arg4
-		pe = arg5
-	else:
-		e = 0
-		pe = 0
-		entryCount = getDirEntryCount(disk, arg1)
-		if not g.dos33:
-			workingDirName = getWorkingDirName(disk, arg1, arg2).decode("L1")
-			g.DIRPATH = g.DIRPATH + "/" + workingDirName
-			if g.PDOSPATH_INDEX:
-				if g.PDOSPATH_INDEX == 1:
-					if ("/" + g.PDOSPATH_SEGMENT.lower()) != g.DIRPATH.lower():
-						print("ProDOS volume name does not match disk image.")
-						quit_now(2)
-					else:
-						g.PDOSPATH_INDEX += 1
-						g.PDOSPATH_SEGMENT = g.PDOSPATH[g.PDOSPATH_INDEX]
-			#else: print(g.DIRPATH)
-	while pe < entryCount:
-		if getStorageType(disk, arg1, e) > 0:
-			#print(pe, e, entryCount)
-			processEntry(disk, arg1, e)
-			pe += 1
-		e += 1
-		if not (e + (0 if g.dos33 else (e>11)) ) % (7 if g.dos33 else 13):
-			process_dir(
-					disk,
-					getDirNextChunkPointer(disk, arg1), entryCount, e,
-					workingDirName, pe)
-			break
-
-def processEntry(disk, arg1, arg2):
-	# arg1=block number, [t,s] if g.dos33=True, or subdir name if g.src_shk=1
-	# arg2=index number of entry in directory, or file name if g.src_shk=1
-
-	#print(getFileName(disk, arg1, arg2), getStorageType(disk, arg1, arg2),
-	#		getFileType(disk, arg1, arg2), getKeyPointer(disk, arg1, arg2),
-	#		getFileLength(disk, arg1, arg2), getAuxType(disk, arg1, arg2),
-	#		getCreationDate(disk, arg1, arg2), getModifiedDate(disk, arg1, arg2))
-
-	eTargetName = None
-	g.ex_data = None
-	g.out_data = bytearray(b'')
-	if g.src_shk:  # ShrinkIt archive
-		g.activeFileName = (arg2 if g.use_extended else arg2.split('#')[0])
-		if g.casefold_upper:
-			g.activeFileName = g.activeFileName.upper()
-		origFileName = g.activeFileName
-	else:  # ProDOS or DOS 3.3 image
-		g.activeFileName = getFileName(disk, arg1 ,arg2).decode("L1")
-		origFileName = g.activeFileName
-		if g.prodos_names:
-			g.activeFileName = toProdosName(g.activeFileName)
-		g.activeFileSize = getFileLength(disk, arg1, arg2)
-
-	if (not g.PDOSPATH_INDEX or
-		g.activeFileName.upper() == g.PDOSPATH_SEGMENT.upper()):
-
-		# if ProDOS directory, not file
-		if not g.src_shk and getStorageType(disk, arg1, arg2) == 13:
-			if not g.PDOSPATH_INDEX:
-				g.target_dir = g.target_dir + "/" + g.activeFileName
-			g.appledouble_dir = g.target_dir + "/.AppleDouble"
-			if not g.catalog_only or os.path.isdir(g.target_dir):
-				makedirs(g.target_dir)
-			if (not g.catalog_only and g.use_appledouble
-					and not os.path.isdir(g.appledouble_dir)):
-				makedirs(g.appledouble_dir)
-			if g.PDOSPATH_SEGMENT:
-				g.PDOSPATH_INDEX += 1
-				g.PDOSPATH_SEGMENT = g.PDOSPATH[g.PDOSPATH_INDEX]
-			process_dir(disk, getKeyPointer(disk, arg1, arg2),
-					getCaseMask(disk, arg1, arg2))
-			g.DIRPATH = g.DIRPATH.rsplit("/", 1)[0]
-			if not g.PDOSPATH_INDEX:
-				g.target_dir = g.target_dir.rsplit("/", 1)[0]
-			g.appledouble_dir = g.target_dir + "/.AppleDouble"
-		else:  # ProDOS or DOS 3.3 file either from image or ShrinkIt archive
-			dirPrint = ""
-			if g.DIRPATH:
-				dirPrint = g.DIRPATH + "/"
-			else:
-				if g.src_shk:
-					if "/".join(dirName.split('/')[3:]):
-						dirPrint = ("/".join(dirName.split('/')[3:]) + "/")
-			if (not g.extract_file or (
-						os.path.basename(g.extract_file.lower())
-						== origFileName.split('#')[0].lower())):
-				filePrint = g.activeFileName.split("#")[0]
-				print(
-						dirPrint + filePrint
-						+ ("+" if (g.shk_hasrf
-							or (not g.src_shk
-								and getStorageType(disk, arg1, arg2) == 5))
-							else "")
-						+ ((" [" + origFileName + "] ")
-							if (g.prodos_names
-								and origFileName != g.activeFileName)
-							else ""))
-				if g.catalog_only:
-					return
-				if not g.target_name:
-					g.target_name = g.activeFileName
-				if g.use_extended:
-					if g.src_shk:
-						eTargetName = arg2
-					else:  # ProDOS image
-						eTargetName = (g.target_name + "#"
-								+ getFileType(disk, arg1, arg2).lower()
-								+ getAuxType(disk, arg1, arg2).lower())
-				# touch(g.target_dir + "/" + g.target_name)
-				if g.use_appledouble:
-					makeADfile()
-				copyFile(arg1, arg2, disk)
-				saveName = (g.target_dir + "/"
-						+ (eTargetName if eTargetName else g.target_name))
-				save_file(saveName, g.out_data)
-				d_created = getCreationDate(disk, arg1, arg2)
-				d_modified = getModifiedDate(disk, arg1, arg2)
-				if not d_modified:
-					d_modified = (d_created
-							or int(datetime.datetime.today().timestamp()))
-				if not d_created:
-					d_created = d_modified
-				if g.use_appledouble:  # AppleDouble
-					# set dates
-					ADfile_path = g.appledouble_dir + "/" + g.target_name
-					g.ex_data[637:641] = date_unix_to_appledouble(d_created)
-					g.ex_data[641:645] = date_unix_to_appledouble(d_modified)
-					g.ex_data[645] = 0x80
-					g.ex_data[649] = 0x80
-					#set type/creator
-					g.ex_data[653] = ord('p')
-					g.ex_data[654:657] = bytes.fromhex(
-							getFileType(disk, arg1, arg2)
-							+ getAuxType(disk, arg1, arg2))
-					g.ex_data[657:661] = b'pdos'
-					save_file(ADfile_path, g.ex_data)
-				touch(saveName, d_modified)
-				if g.use_extended:  # extended name from ProDOS image
-					if g.ex_data:
-						save_file((saveName + "r"), g.ex_data)
-						touch((saveName + "r"), d_modified)
-				if (g.PDOSPATH_SEGMENT
-						or (g.extract_file
-							and (g.extract_file.lower()
-								== origFileName.lower()))):
-					quit_now(0)
-				g.target_name = None
-	#else print(g.activeFileName + " doesn't match " + g.PDOSPATH_SEGMENT)
-
-def processForkedFile(disk, arg1):
-	# finder info except type/creator
-	fInfoA_entryType = disk.buffer.read1(9)
-	fInfoB_entryType = disk.buffer.read1(27)
-	if (fInfoA_entryType == 1):
-		disk.buffer.write(disk.buffer.read(18, 8), 661, 8)
-	elif (fInfoA_entryType == 2):
-		disk.buffer.write(disk.buffer.read(10, 16), 669, 16)
-	if (fInfoB_entryType == 1):
-		disk.buffer.write(disk.buffer.read(36, 8), 661, 8)
-	elif (fInfoB_entryType == 2):
-		disk.buffer.write(disk.buffer.read(28, 16), 669, 16)
-
-	for f in (0, 256):
-		g.resourceFork = f
-		g.activeFileBytesCopied = 0
-		forkStart = arg1 * 512  # start of Forked File key block
-		#print("--" + forkStart)
-		forkStorageType = disk.buffer.read1(forkStart + f)
-		forkKeyPointer = unpack_u16le(disk.buffer.read(forkStart + f + 1, 2))
-		forkFileLen = unpack_u24le(disk.buffer.read(forkStart + f + 5, 3))
-		g.activeFileSize = forkFileLen
-		if g.resourceFork > 0:
-			rsrcForkLen = unpack_u24le(disk.buffer.read(forkStart + f + 5, 3))
-			#print(">>>", rsrcForkLen)
-			if g.use_appledouble or g.use_extended:
-				print("    [resource fork]")
-			if g.use_appledouble:
-				pack_u24be(g.ex_data, 35, rsrcForkLen)
-		else:
-			print("    [data fork]")
-		if forkStorageType == 1:  #seedling
-			copyBlock(disk, forkKeyPointer, forkFileLen)
-		elif forkStorageType == 2:  #sapling
-			processIndexBlock(disk, forkKeyPointer)
-		elif forkStorageType == 3:  #tree
-			processMasterIndexBlock(disk, forkKeyPointer)
-	#print()
-	g.resourceFork = 0
-
-def processMasterIndexBlock(disk, arg1):
-	processIndexBlock(disk, arg1, True)
-
-def processIndexBlock(disk, arg1, arg2=False):
-	#arg1: indexBlock, or [t,s] of track/sector list
-	#arg2: if True, it's a Master Index Block
-	pos = 12 if g.dos33 else 0
-	bytesRemaining = g.activeFileSize
-	while g.activeFileBytesCopied < g.activeFileSize:
-		if g.dos33:
-			targetTS = list(disk.buffer.read(ts(arg1) + pos, 2))
-			#print('{02x} {02x}'.format(targetTS[0], targetTS[1]))
-			bytesRemaining = (g.activeFileSize - g.activeFileBytesCopied)
-			bs = (bytesRemaining if bytesRemaining < 256 else 256)
-			copyBlock(disk, targetTS, bs)
-			pos += 2
-			if pos > 255:
-				# continue with next T/S list sector
-				processIndexBlock(disk, list(disk.buffer.read(ts(arg1) + 1, 2)))
-		else:  # ProDOS
-			# Note these are not consecutive bytes
-			targetBlock = (disk.buffer.read1(arg1 * 512 + pos) +
-					disk.buffer.read1(arg1 * 512 + pos+256) * 256)
-			if arg2:
-				processIndexBlock(disk, targetBlock)
-			else:
-				bytesRemaining = (g.activeFileSize - g.activeFileBytesCopied)
-				bs = bytesRemaining if bytesRemaining < 512 else 512
-				copyBlock(disk, targetBlock, bs)
-			pos += 1
-			if pos > 255:
-				break  # go to next entry in Master Index Block (tree)
-
-def makeADfile():
-	if not g.use_appledouble:
-		return
-	touch(g.appledouble_dir + "/" + g.target_name)
-	g.ex_data = bytearray(741)
-	# ADv2 header
-	g.ex_data[sli(0x00,8)] = a2b_hex("0005160700020000")
-	# number of entries
-	g.ex_data[sli(0x18,2)] = a2b_hex("000D")
-	# Resource Fork
-	g.ex_data[sli(0x1a,12)] = a2b_hex("00000002000002E500000000")
-	# Real Name
-	g.ex_data[sli(0x26,12)] = a2b_hex("00000003000000B600000000")
-	# Comment
-	g.ex_data[sli(0x32,12)] = a2b_hex("00000004000001B500000000")
-	# Dates Info
-	g.ex_data[sli(0x3e,12)] = a2b_hex("000000080000027D00000010")
-	# Finder Info
-	g.ex_data[sli(0x4a,12)] = a2b_hex("000000090000028D00000020")
-	# ProDOS file info
-	g.ex_data[sli(0x56,12)] = a2b_hex("0000000B000002C100000008")
-	# AFP short name
-	g.ex_data[sli(0x62,12)] = a2b_hex("0000000D000002B500000000")
-	# AFP File Info
-	g.ex_data[sli(0x6e,12)] = a2b_hex("0000000E000002B100000004")
-	# AFP Directory ID
-	g.ex_data[sli(0x7a,12)] = a2b_hex("0000000F000002AD00000004")
-	# dbd (second time) will create DEV, INO, SYN, SV~
-
-def quit_now(exitcode=0):
-	if (exitcode == 0 and g.afpsync_msg and
-			g.use_appledouble and os.path.isdir("/usr/local/etc/netatalk")):
-		print(
-				"File(s) have been copied to the target directory. "
-				"If the directory\n"
-				"is shared by Netatalk, please type 'afpsync' now.")
-	if g.src_shk:  # clean up
-		for file in os.listdir('/tmp'):
-			if file.startswith("cppo-"):
-				shutil.rmtree('/tmp' + "/" + file)
-	sys.exit(exitcode)
-
 def to_sys_name(name):
 	if os.name == 'nt':
 		if name[-1] == '.':
@@ -787,19 +119,33 @@ def to_sys_name(name):
 		name = name.replace('./', '.-/')
 	return name
 
-#---- IvanX general purpose functions ----#
-
-def touch(file_path, modTime=None):
-	# http://stackoverflow.com/questions/1158076/implement-touch-using-python
-	#print(file_path)
-	with open(to_sys_name(file_path), "ab"):
-		os.utime(file_path, None if modTime is None else (modTime, modTime))
-
-def mkdir(dirPath):
+def finishFile(out_data, ex_data, ad_header, ADfile_path, saveName, modTime,
+		save=None):
+	# runs on the writer pool once copyFile is done with a file
+	# out_data, ex_data: the file's sink.ForkWriters (ex_data may be None)
+	# ad_header: finished AppleDouble header to save at ADfile_path (-ad)
+	# modTime: modification time to set on the file
+	# save: function to save ad_header with (default: save_file)
+	# each file is opened, written, dated, and closed just once
+	# if anything fails, both forks let go of the image before it's raised
 	try:
-		os.mkdir(to_sys_name(dirPath))
-	except FileExistsError:
-		pass
+		out_data.close(modTime)
+		if ad_header is not None:
+			if ex_data is not None:  # header goes before rfork
+				ex_data.write(0, ad_header)
+				ex_data.close()
+			else:
+				(save or save_file)(ADfile_path, ad_header)
+		if ad_header is None and ex_data is not None:
+			# extended name from ProDOS image
+			ex_data.close(modTime)
+	except BaseException:
+		out_data.discard()
+		if ex_data is not None:
+			ex_data.discard()
+		raise
+
+#---- IvanX general purpose functions ----#
 
 def makedirs(dirPath):
 	try:
@@ -812,92 +158,873 @@ def load_file(file_path):
 	with open(to_sys_name(file_path), "rb") as image_handle:
 		return image_handle.read()
 
-def save_file(file_path, fileData):
-	with open(to_sys_name(file_path), "wb") as image_handle:
-		image_handle.write(fileData)
-
-def dopo_swap(image_data):
-	# for each track,
-	# read each sector in the right sequence to make
-	# valid ProDOS blocks (sector pairs)
-	dopo = bytearray(143360)
-	for t in range(0, 35):
-		for s in range(16):
-			src = ts(t,s)
-			dst = ts(t,s if s in (0,15) else 15-s)
-			dopo[dst:dst+256] = image_data[src:src+256]
-	return bytes(dopo)
+def save_file(file_path, fileData, modTime=None):
+	sink.write_file(to_sys_name(file_path), fileData, modTime)
 
 #---- end IvanX general purpose functions ----#
 
-def run_cppo():
-	try:
-		disk = diskimg.Disk(g.image_file)
-	except IOError as e:
-		LOG.critical(e)
-		quit_now(2)
-
-	# automatically set ShrinkIt mode if extension suggests it
-	if g.src_shk or disk.ext in ('.shk', '.sdk', '.bxy'):
-		if os.name == "nt":
-			print("ShrinkIt archives cannot be extracted on Windows.")
-			quit_now(2)
-		else:
+
+class _Finished(Exception):
+	"""Raised by Extractor.quit_now to end a run with an exit status"""
+
+	def __init__(self, exitcode: int) -> None:
+		super(_Finished, self).__init__(exitcode)
+		self.exitcode = exitcode
+
+
+class Extractor(object):
+	"""Copy or catalog the files in one disk image or ShrinkIt archive
+
+	This is cppo, minus the command line.  Everything a run needs to keep
+	track of lives in the Extractor rather than in the module, so any number
+	of them can be run one after another or side by side in separate threads.
+	Each Extractor handles a single run; make a new one for the next image.
+
+	Args:
+		image_file: Path of the disk image or ShrinkIt archive
+		target_dir: Directory to extract into (unused with catalog_only)
+		extract_file: Path of a single file within the image to extract
+		target_name: Name to save extract_file as (default: its own name)
+		use_appledouble: -ad  (AppleDouble headers + resource forks)
+		use_extended: -e   (extended filenames + resource forks)
+		catalog_only: -cat (catalog only, no extract)
+		casefold_upper: -uc  (GS/OS mixed case filenames extract as
+			uppercase)
+		src_shk: -shk (ShrinkIt archive source)
+		prodos_names: -pro (adapt DOS 3.3 names to ProDOS)
+		afpsync_msg: -s   (False to suppress afpsync message at end)
+		extract_in_place: -n   (don't create parent dir for SHK, extract
+			files in place)
+		stream_output: Write extents straight to the output files rather
+			than collecting each fork in memory first
+		writer_threads: Number of threads finishing output files while the
+			next ones are read from the image (0 to write as we go)
+		incremental: -inc (skip files a manifest in target_dir says are
+			already current)
+		dedupe_dir: -dedupe (directory of a sink.DedupeStore to hard link
+			identical output files to)
+		archive: -archive (archive.Archive to write the extracted tree into
+			rather than target_dir; files are added on the calling thread,
+			and -inc and -dedupe don't apply)
+		verify_crc: False for -nocrc (don't check the CRCs of ShrinkIt
+			LZW/1 threads)
+		catalog_format: -catfmt (one of catalog.CATALOG_FORMATS to catalog
+			as a record per file rather than as a listing; implies
+			catalog_only)
+		catalog_output: Text file catalog records are written to (default:
+			output)
+		catalog_cache: -catcache (directory of a catcache.CatalogCache to
+			serve catalogs of images that haven't changed from, and to
+			keep new catalogs in, along with whatever making them printed
+			and logged)
+		output: File-like object for what cppo prints (default: sys.stdout)
+
+	Attributes:
+		extracted: Paths of the files saved so far
+		skipped: Paths of the files left alone because they were current
+	"""
+
+	def __init__(
+			self,
+			image_file: str,
+			target_dir: str = "",
+			extract_file: str = None,
+			target_name: str = None,
+			use_appledouble: bool = False,
+			use_extended: bool = False,
+			catalog_only: bool = False,
+			casefold_upper: bool = False,
+			src_shk: bool = False,
+			prodos_names: bool = False,
+			afpsync_msg: bool = True,
+			extract_in_place: bool = False,
+			stream_output: bool = True,
+			writer_threads: int = 4,
+			incremental: bool = False,
+			dedupe_dir: str = None,
+			archive=None,
+			verify_crc: bool = True,
+			catalog_format: str = None,
+			catalog_output=None,
+			catalog_cache: str = None,
+			output=None
+			) -> None:
+		self.image_file = image_file
+		self.target_dir = target_dir
+		self.extract_file = extract_file
+		self.target_name = target_name
+		self.use_appledouble = use_appledouble
+		self.use_extended = use_extended
+		self.catalog_only = catalog_only or bool(catalog_format)
+		self.casefold_upper = casefold_upper
+		self.src_shk = src_shk
+		self.prodos_names = prodos_names
+		self.afpsync_msg = afpsync_msg
+		self.extract_in_place = extract_in_place
+		self.stream_output = stream_output
+		self.writer_threads = writer_threads
+		self.incremental = incremental
+		self.dedupe_dir = dedupe_dir
+		self.archive = archive
+		self.verify_crc = verify_crc
+		self.catalog_format = catalog_format
+		self.catalog_output = catalog_output
+		self.catalog_cache = catalog_cache
+		self.output = output
+		self.dos33 = False  # DOS 3.3 image source, selected automatically
+
+		self.extracted = []
+		self.skipped = []
+
+		self.out_data = None    # sink.ForkWriter for the data fork
+		self.ex_data = None     # sink.ForkWriter for the resource fork, if any
+		self.ad_header = None   # AppleDouble header being built (-ad)
+		self.writer = None      # sink.WriterPool, during run()
+		self.manifest = None    # manifest.Manifest, during run() with -inc
+		self.store = None       # sink.DedupeStore, during run() with -dedupe
+		self.catalog = None     # catalog.CatalogWriter, with -catfmt
+		self.cached = None      # catcache entries output, with -catcache
+
+		self.activeDirBlock = None
+		self.activeFileName = None
+		self.activeFileSize = None
+		self.activeFileBytesCopied = 0
+		self.resourceFork = 0
+		self.shk_hasrf = False
+
+		self.PDOSPATH = []
+		self.PDOSPATH_INDEX = 0
+		self.PDOSPATH_SEGMENT = None
+		self.DIRPATH = ""
+		self.dirStack = []      # (target_dir, DIRPATH) of enclosing dirs
+		self.dirsMade = set()   # directories this run has ensured exist
+
+		self.appledouble_dir = None
+
+	def run(self) -> int:
+		"""Extract or catalog the image
+
+		Returns:
+			The exit status cppo would exit with: 0 on success, 1 if the
+			file to extract can't be found or a ShrinkIt archive can't be
+			expanded, and 2 if the image can't be read or used as asked
+		"""
+		if (not self.catalog_cache or not self.catalog_only
+				or self.extract_file):
+			return self.processImage()
+		cache = None
+		try:
+			cache = catcache.CatalogCache(self.catalog_cache)
+			image = catcache.fingerprint(self.image_file)
+			options = self.catalogOptions()
+			cached = cache.lookup(image, options)
+		except (OSError, sqlite3.Error) as e:
+			LOG.warning("not using catalog cache: {}", e)
+			if cache is not None:
+				cache.close()
+			return self.processImage()
+		with cache:
+			if cached is not None:
+				self.replayCatalog(cached)
+				return 0
+			# everything printed and logged is cached along with the records
+			self.cached = []
+			recorder = catcache.LogRecorder(self.cached)
+			LOG.logger.addHandler(recorder)
 			try:
-				with open(os.devnull, "w") as fnull:
-					subprocess.call("nulib2", stdout = fnull, stderr = fnull)
-				g.src_shk = True
-			except Exception:
-				print(
-						"Nulib2 is not available; not expanding "
-						"ShrinkIt archive.")
-				quit_now(2)
-
-	if g.src_shk:
-		g.prodos_names = False
-		unshkdir = ('/tmp' + "/cppo-" + str(uuid.uuid4()))
-		makedirs(unshkdir)
-		result = os.system(
-				"/bin/bash -c 'cd " + unshkdir + "; "
-				+ "result=$(nulib2 -xse " + os.path.abspath(disk.pathname)
-				+ ((" " + g.extract_file.replace('/', ':'))
-					if g.extract_file else "") + " 2> /dev/null); "
-				+ "if [[ $result == \"Failed.\" ]]; then exit 3; "
-				+ "else if grep -q \"no records match\" <<< \"$result\""
-				+ " > /dev/null; then exit 2; else exit 0; fi; fi'")
-		if result == 512:
-			print(
-					"File not found in ShrinkIt archive. "
-					"Try cppo -cat to get the path,\n"
-					"  and omit any leading slash or colon.")
-			quit_now(1)
-		elif result != 0:
-			print(
-					"ShrinkIt archive is invalid, "
+				exitcode = self.processImage()
+			finally:
+				LOG.logger.removeHandler(recorder)
+			if exitcode == 0:
+				try:
+					cache.store(self.image_file, image, options, self.cached)
+				except sqlite3.Error as e:
+					LOG.warning("catalog not cached: {}", e)
+		return exitcode
+
+	def processImage(self) -> int:
+		# extracts or catalogs the image, returning run()'s exit status
+		try:
+			disk = diskimg.Disk(self.image_file)
+		except IOError as e:
+			LOG.critical(e)
+			return 2
+		if self.archive is not None:
+			# members go into the archive in order, from this thread
+			self.writer = sink.WriterPool(0)
+		else:
+			self.writer = sink.WriterPool(self.writer_threads)
+		toFiles = self.archive is None and not self.catalog_only
+		if self.dedupe_dir and toFiles:
+			self.store = sink.DedupeStore(self.dedupe_dir)
+		if self.incremental and toFiles:
+			self.manifest = manifest.Manifest(
+					self.target_dir, self.image_file, self.manifestOptions())
+		if self.catalog_format:
+			self.catalog = catalog.open_catalog(self.catalog_format,
+					self.catalog_output or self.output or sys.stdout)
+		try:
+			with disk:
+				try:
+					with self.writer:
+						self.run_cppo(disk)
+				finally:
+					# a file cut short never reached the writer pool; it
+					#   mustn't keep views of the image once it's closed
+					self.discardForks()
+		except _Finished as e:
+			exitcode = e.exitcode
+		else:
+			exitcode = 0
+		finally:
+			if self.catalog is not None:
+				self.catalog.close()
+		# only once everything recorded in it has been written
+		if self.manifest is not None:
+			self.manifest.save()
+		return exitcode
+
+	def discardForks(self) -> None:
+		# lets go of the forks of the file being copied, if there is one
+		for fork in (self.out_data, self.ex_data):
+			if fork is not None:
+				fork.discard()
+		self.out_data = None
+		self.ex_data = None
+
+	def manifestOptions(self) -> str:
+		# the flags that change what's written for a file, so that changing
+		#   them makes everything in the manifest out of date
+		flags = (("-ad", self.use_appledouble), ("-e", self.use_extended),
+				("-uc", self.casefold_upper), ("-pro", self.prodos_names),
+				("-n", self.extract_in_place))
+		return " ".join(flag for flag, isSet in flags if isSet)
+
+	def catalogOptions(self) -> str:
+		# the flags given that change what a catalog lists, so that catalogs
+		#   made with different ones are cached separately (only -catfmt
+		#   makes records, whatever the format), and the image's extension,
+		#   which decides its sector order and whether it's a ShrinkIt
+		#   archive as much as its contents do
+		flags = (("-shk", self.src_shk), ("-uc", self.casefold_upper),
+				("-pro", self.prodos_names),
+				("-catfmt", bool(self.catalog_format)))
+		return " ".join([flag for flag, isSet in flags if isSet]
+				+ [os.path.splitext(self.image_file)[1].lower()])
+
+	def replayCatalog(self, cached) -> None:
+		# outputs again everything -catcache kept of cataloging the image
+		if self.catalog_format:
+			self.catalog = catalog.open_catalog(self.catalog_format,
+					self.catalog_output or self.output or sys.stdout)
+		try:
+			for kind, value in cached:
+				if kind == catcache.RECORD:
+					self.catalog.write(value)
+				elif kind == catcache.LOG:
+					LOG.log(value[0], "{}", value[1])
+				else:
+					self._print(value)
+		finally:
+			if self.catalog is not None:
+				self.catalog.close()
+
+	def _print(self, *args) -> None:
+		if self.cached is not None:
+			self.cached.append(
+					(catcache.LINE, " ".join(str(arg) for arg in args)))
+		print(*args, file=self.output or sys.stdout)
+
+	# cppo support functions:
+	# entry: a prodos.FileEntry, dos33.FileEntry, or ShkEntry, decoded once by
+	# process_dir (or run_cppo for ShrinkIt archives) and passed along from
+	# there
+
+	def getFileName(self, entry):
+		if self.dos33 or not self.casefold_upper:
+			return entry.name
+		return entry.raw_name
+
+	def getFileType(self, entry):
+		if self.src_shk:
+			return int(entry.name.split('#')[1][0:2], 16)
+		return entry.file_type
+
+	def getAuxType(self, disk, entry):
+		if self.src_shk:
+			return int(entry.name.split('#')[1][2:6], 16)
+		if self.dos33:
+			return dos33.aux_type(disk.buffer, entry)
+		return entry.aux_type
+
+	def getFileLength(self, disk, entry):
+		if self.dos33:
+			return dos33.file_length(disk.buffer, entry)
+		return entry.eof
+
+	def getDataForkLength(self, disk, entry):
+		# returns the length of a ProDOS file, or of its data fork if it's
+		#   an extended file, whose EOF is that of its extended key block
+		if entry.storage_type != prodos.EXTENDED:
+			return entry.eof
+		return unpack_u24le(
+				disk.buffer.read(entry.key_pointer * 512 + 5, 3))
+
+	def getResourceForkLength(self, disk, entry):
+		# returns the length of the file's resource fork, 0 if it has none
+		if self.src_shk:
+			thread = entry.record.resource_fork
+			return entry.record.length(thread) if thread else 0
+		if self.dos33 or entry.storage_type != prodos.EXTENDED:
+			return 0
+		return unpack_u24le(
+				disk.buffer.read(entry.key_pointer * 512 + 256 + 5, 3))
+
+	def getCreationDate(self, entry):
+		#outputs prodos creation date/time as Unix time
+		#  (seconds since Jan 1 1970 GMT)
+		#or None if there is none
+		if self.src_shk or self.dos33:
+			return None
+		return entry.created
+
+	def getModifiedDate(self, entry):
+		#outputs prodos modified date/time as Unix time
+		#  (seconds since Jan 1 1970 GMT)
+		#or None if there is none
+		if self.src_shk:
+			return entry.record.modified
+		elif self.dos33:
+			return None
+		return entry.modified
+
+	def getVolumeName(self, disk):
+		return self.getWorkingDirName(
+				prodos.read_directory_header(disk.buffer, 2))
+
+	def getWorkingDirName(self, header, caseMask=None):
+		# header: prodos.DirectoryHeader
+		# caseMask: from the subdirectory's entry
+		if self.casefold_upper:
+			return header.raw_name
+		return header.name(caseMask)
+
+	# --- main logic functions
+
+	def ensureDir(self, dirPath):
+		# creates dirPath and its parents, unless this run already has
+		#   (output directories are only ever created, never removed)
+		if dirPath not in self.dirsMade:
+			if self.archive is not None:
+				self.archive.add_dir(dirPath)
+			else:
+				makedirs(dirPath)
+			self.dirsMade.add(dirPath)
+
+	def openFork(self, file_path, size, skip=0):
+		# returns a sink.ForkWriter for a fork of size bytes, less skip bytes
+		#   dropped from the front; it's written as it's copied if
+		#   self.stream_output, or left for the writer pool if there is one
+		#   (unless it would take more than sink.SPILL_LIMIT bytes of copies
+		#   to keep); with -dedupe, it may end up a link to a stored copy
+		#   instead, and with -archive it's added to the archive when it's
+		#   closed
+		if self.archive is not None:
+			return self.archive.open_writer(file_path, size, skip)
+		return sink.open_writer(
+				to_sys_name(file_path), size, skip, self.stream_output,
+				queued=bool(self.writer.threads), store=self.store)
+
+	def saveFile(self, file_path, fileData):
+		# saves a file that's complete in memory, to the archive with -archive
+		if self.archive is not None:
+			self.archive.add_file(file_path, len(fileData), [(0, fileData)])
+		else:
+			save_file(file_path, fileData)
+
+	def openResourceFork(self, saveName, size):
+		# returns a sink.ForkWriter for a resource fork of size bytes, or None
+		#   if it's empty; it goes after the AppleDouble header (-ad), which is
+		#   written at offset 0 once it's finished, or in saveName + "r" (-e)
+		if not size:
+			return None
+		if self.use_appledouble:
+			appledouble.set_rsrc_length(self.ad_header, size)
+			return self.openFork(
+					self.appledouble_dir + "/" + self.target_name,
+					appledouble.HEADER_LENGTH + size)
+		return self.openFork(saveName + "r", size)
+
+	def copyFile(self, disk, entry, saveName):
+		# entry: the file's directory entry (see cppo support functions)
+		# saveName: the file to save the data fork in
+		# copies file or dfork to self.out_data, rfork if any to self.ex_data;
+		#   both are sink.ForkWriters, left open for processEntry to finish
+		self.activeFileBytesCopied = 0
+
+		if self.src_shk:
+			record = entry.record
+			thread = record.disk_image or record.data_fork
+			self.out_data = self.openFork(
+					saveName, record.length(thread) if thread else 0)
+			if thread is not None:
+				self.copyThread(disk, record, thread, self.out_data)
+			if self.shk_hasrf:
+				self._print("    [data fork]")
+				if self.use_extended or self.use_appledouble:
+					self._print("    [resource fork]")
+					thread = record.resource_fork
+					self.ex_data = self.openResourceFork(
+							saveName, record.length(thread))
+					if self.ex_data is not None:
+						self.copyThread(disk, record, thread, self.ex_data,
+								(appledouble.HEADER_LENGTH
+									if self.use_appledouble else 0))
+		else:  # ProDOS or DOS 3.3
+			storageType = entry.storage_type
+			keyPointer = entry.key_pointer
+			fileLen = self.getFileLength(disk, entry)
+			if self.dos33 or storageType in (
+					prodos.SEEDLING, prodos.SAPLING, prodos.TREE):
+				skip = 0
+				if self.prodos_names:
+					# remove address/length data from DOS 3.3 file data if
+					# ProDOS target
+					if entry.file_type == 0x06:
+						skip = 4
+					elif entry.file_type in (0xfa, 0xfc):
+						skip = 2
+				self.out_data = self.openFork(saveName, fileLen, skip)
+				if self.dos33:
+					self.copySectors(
+							disk, dos33.data_sectors(disk.buffer, entry))
+				else:
+					self.copyExtents(disk, prodos.file_extents(
+						disk.buffer, storageType, keyPointer, fileLen))
+			elif storageType == prodos.EXTENDED:  #extended (forked)
+				self.processForkedFile(disk, keyPointer, saveName)
+			else:  # nothing here we know how to copy
+				self.out_data = self.openFork(saveName, 0)
+
+	def copyThread(self, disk, record, thread, writer, offset=0):
+		# copies a ShrinkIt archive thread to a sink.ForkWriter, offset bytes
+		#   into the fork, decompressing it as it goes
+		for position, data in nufx.read_thread(
+				disk.buffer, record, thread, self.verify_crc):
+			writer.write(offset + position, data)
+
+	def copyBlock(self, disk, arg1, arg2):
+		#arg1: block number or [t,s] to copy
+		#arg2: bytes to write (should be 256 (DOS 3.3) or a multiple of 512
+		#      (ProDOS run of blocks), unless final block with less)
+		#print(arg1 + " " + arg2 + " " + self.activeFileBytesCopied)
+		# forks are sized up front and zero-filled (or sparse) already, so
+		# sparse blocks are skipped and read_view lets us copy straight from
+		# the image
+		if arg1 == 0:
+			self.activeFileBytesCopied += arg2
+			return
+		if self.dos33:
+			outBytes = disk.buffer.read_view(ts(arg1), arg2)
+		else:
+			outBytes = disk.buffer.read_view(arg1 * 512, arg2)
+		if self.resourceFork > 0:
+			if self.use_appledouble or self.use_extended:
+				offset = (appledouble.HEADER_LENGTH
+						if self.use_appledouble else 0)
+				self.ex_data.write(
+						self.activeFileBytesCopied + offset, outBytes)
+		else:
+			self.out_data.write(self.activeFileBytesCopied, outBytes)
+		self.activeFileBytesCopied += arg2
+
+	def process_dir(self, disk, arg1, arg2=None):
+		# arg1: ProDOS directory key block, or DOS 3.3 (track, sector) of the
+		#       first catalog sector
+		# arg2: ProDOS casemask from the subdirectory's file entry (optional)
+		if self.dos33:
+			entries = dos33.read_catalog(disk.buffer, arg1)
+		else:
+			header = prodos.read_directory_header(disk.buffer, arg1)
+			workingDirName = self.getWorkingDirName(header, arg2).decode("L1")
+			self.DIRPATH = self.DIRPATH + "/" + workingDirName
+			if self.PDOSPATH_INDEX:
+				if self.PDOSPATH_INDEX == 1:
+					if (("/" + self.PDOSPATH_SEGMENT.lower())
+							!= self.DIRPATH.lower()):
+						self._print("ProDOS volume name does not match "
+								"disk image.")
+						self.quit_now(2)
+					else:
+						self.PDOSPATH_INDEX += 1
+						self.PDOSPATH_SEGMENT = self.PDOSPATH[
+								self.PDOSPATH_INDEX]
+			#else: self._print(self.DIRPATH)
+			entries = prodos.read_directory(
+					disk.buffer, arg1, header.file_count)
+		for entry in entries:
+			self.processEntry(disk, entry)
+
+	def processEntry(self, disk, entry):
+		# entry: prodos.FileEntry, dos33.FileEntry, or ShkEntry (src_shk)
+
+		#print(entry)
+
+		eTargetName = None
+		self.ex_data = None
+		self.out_data = None
+		if self.src_shk:  # ShrinkIt archive
+			self.activeFileName = (entry.name if self.use_extended
+					else entry.name.split('#')[0])
+			if self.casefold_upper:
+				self.activeFileName = self.activeFileName.upper()
+			origFileName = self.activeFileName
+		else:  # ProDOS or DOS 3.3 image
+			self.activeFileName = self.getFileName(entry).decode("L1")
+			origFileName = self.activeFileName
+			if self.prodos_names:
+				self.activeFileName = toProdosName(self.activeFileName)
+			# a listing never shows the length, which for a DOS 3.3 text
+			#   file means walking its track/sector list; dos33 memoizes it
+			#   in the entry for whatever does need it
+			self.activeFileSize = (None if self.catalog_only
+					else self.getFileLength(disk, entry))
+
+		if (not self.PDOSPATH_INDEX or
+			self.activeFileName.upper() == self.PDOSPATH_SEGMENT.upper()):
+
+			# if ProDOS directory, not file
+			if not self.src_shk and entry.storage_type == prodos.DIRECTORY:
+				# save where we are to come back to after the subdirectory
+				self.dirStack.append((self.target_dir, self.DIRPATH))
+				if not self.PDOSPATH_INDEX:
+					self.target_dir = (
+							self.target_dir + "/" + self.activeFileName)
+				self.appledouble_dir = self.target_dir + "/.AppleDouble"
+				if not self.catalog_only:
+					self.ensureDir(self.target_dir)
+					if self.use_appledouble:
+						self.ensureDir(self.appledouble_dir)
+				if self.PDOSPATH_SEGMENT:
+					self.PDOSPATH_INDEX += 1
+					self.PDOSPATH_SEGMENT = self.PDOSPATH[self.PDOSPATH_INDEX]
+				self.process_dir(disk, entry.key_pointer, entry.case_mask)
+				self.target_dir, self.DIRPATH = self.dirStack.pop()
+				self.appledouble_dir = self.target_dir + "/.AppleDouble"
+			else:  # ProDOS or DOS 3.3 file from image or ShrinkIt archive
+				dirPrint = ""
+				if self.DIRPATH:
+					dirPrint = self.DIRPATH + "/"
+				else:
+					if self.src_shk and entry.path:
+						dirPrint = entry.path + "/"
+				if (not self.extract_file or (
+							os.path.basename(self.extract_file.lower())
+							== origFileName.split('#')[0].lower())):
+					filePrint = self.activeFileName.split("#")[0]
+					line = (dirPrint + filePrint
+							+ ("+" if (self.shk_hasrf
+								or (not self.src_shk
+									and entry.storage_type == prodos.EXTENDED))
+								else "")
+							+ ((" [" + origFileName + "] ")
+								if (self.prodos_names
+									and origFileName != self.activeFileName)
+								else ""))
+					if self.catalog is not None:
+						record = self.catalogRecord(
+								disk, entry, dirPrint + filePrint)
+						if self.cached is not None:
+							self.cached.append((catcache.RECORD, record))
+						self.catalog.write(record)
+						return
+					self._print(line)
+					if self.catalog_only:
+						return
+					if not self.target_name:
+						self.target_name = self.activeFileName
+					if self.use_extended:
+						if self.src_shk:
+							eTargetName = entry.name
+						else:  # ProDOS image
+							eTargetName = "{}#{:02x}{:04x}".format(
+									self.target_name,
+									self.getFileType(entry),
+									self.getAuxType(disk, entry))
+					# touch(self.target_dir + "/" + self.target_name)
+					saveName = (self.target_dir + "/"
+							+ (eTargetName if eTargetName
+								else self.target_name))
+					if not self.isCurrent(disk, entry, saveName):
+						self.saveEntry(disk, entry, saveName)
+					if (self.PDOSPATH_SEGMENT
+							or (self.extract_file
+								and (self.extract_file.lower()
+									== origFileName.lower()))):
+						self.quit_now(0)
+					self.target_name = None
+		#else print(self.activeFileName + " doesn't match "
+		#		+ self.PDOSPATH_SEGMENT)
+
+	def catalogRecord(self, disk, entry, path):
+		# returns the catalog.FIELDS of entry, which -cat lists as path
+		if self.src_shk:
+			record = entry.record
+			thread = record.disk_image or record.data_fork
+			return {
+					'path': path,
+					'storage_type': (None if record.disk_image
+						else record.storage_type),
+					'file_type': record.file_type,
+					'aux_type': record.aux_type,
+					'eof': record.length(thread) if thread else 0,
+					'blocks_used': None,
+					'key_pointer': None,
+					'created': catalog.iso_date(record.created),
+					'modified': catalog.iso_date(record.modified),
+					'access': record.access & 0xff}
+		if self.dos33:
+			return {
+					'path': path,
+					'storage_type': entry.storage_type,
+					'file_type': entry.file_type,
+					'aux_type': self.getAuxType(disk, entry),
+					'eof': self.getFileLength(disk, entry),
+					'blocks_used': entry.sector_count,
+					'key_pointer': list(entry.key_pointer),
+					'created': None,
+					'modified': None,
+					'access': 0x01 if entry.locked else 0xc3}
+		return {
+				'path': path,
+				'storage_type': entry.storage_type,
+				'file_type': entry.file_type,
+				'aux_type': entry.aux_type,
+				'eof': self.getDataForkLength(disk, entry),
+				'blocks_used': entry.blocks_used,
+				'key_pointer': entry.key_pointer,
+				'created': catalog.iso_date(entry.created),
+				'modified': catalog.iso_date(entry.modified),
+				'access': entry.access}
+
+	def isCurrent(self, disk, entry, saveName):
+		# returns True if -inc and the manifest says saveName already holds
+		#   this version of entry, so it needn't be extracted again; either
+		#   way, entry's stamp goes into the manifest saved at the end
+		if self.manifest is None:
+			return False
+		rsrcLen = self.getResourceForkLength(disk, entry)
+		modified = self.getModifiedDate(entry)
+		if self.src_shk:
+			thread = entry.record.disk_image or entry.record.data_fork
+			stamp = [entry.name,
+					entry.record.length(thread) if thread else 0,
+					rsrcLen, modified]
+		elif self.dos33:
+			stamp = [list(entry.key_pointer), self.activeFileSize, rsrcLen,
+					modified]
+		else:
+			stamp = [entry.key_pointer, self.getDataForkLength(disk, entry),
+					rsrcLen, modified]
+		if modified is None:
+			# an undated file can change in place without its stamp changing
+			stamp.append(self.manifest.image_stamp())
+		outputs = [to_sys_name(saveName)]
+		if self.use_appledouble:
+			outputs.append(to_sys_name(
+					self.appledouble_dir + "/" + self.target_name))
+		elif self.use_extended and rsrcLen:
+			outputs.append(to_sys_name(saveName + "r"))
+		if self.manifest.is_current(saveName, stamp, outputs):
+			self.skipped.append(saveName)
+			return True
+		return False
+
+	def saveEntry(self, disk, entry, saveName):
+		# copies entry to saveName (and its AppleDouble file, with -ad) and
+		#   hands the open forks to the writer pool to finish
+		if self.use_appledouble:
+			self.makeADfile()
+		self.copyFile(disk, entry, saveName)
+		self.extracted.append(saveName)
+		d_created = self.getCreationDate(entry)
+		d_modified = self.getModifiedDate(entry)
+		if not d_modified:
+			d_modified = (d_created
+					or int(datetime.datetime.today().timestamp()))
+		if not d_created:
+			d_created = d_modified
+		ADfile_path = None
+		if self.use_appledouble:  # AppleDouble
+			# set dates and type/creator
+			ADfile_path = self.appledouble_dir + "/" + self.target_name
+			appledouble.set_file_info(self.ad_header,
+					d_created, d_modified,
+					self.getFileType(entry),
+					self.getAuxType(disk, entry))
+		# the writer pool does the rest while we move on
+		self.writer.submit(finishFile,
+				self.out_data, self.ex_data,
+				(self.ad_header if self.use_appledouble else None),
+				ADfile_path, saveName, d_modified, self.saveFile)
+
+	def processForkedFile(self, disk, arg1, saveName):
+		# saveName: the file to save the data fork in
+		forkStart = arg1 * 512  # start of Forked File key block
+		# finder info except type/creator
+		if self.use_appledouble:
+			fInfoA_entryType = disk.buffer.read1(forkStart + 9)
+			fInfoB_entryType = disk.buffer.read1(forkStart + 27)
+			fInfo = appledouble.FINDER_INFO_OFFSET
+			fxInfo = appledouble.EXTENDED_FINDER_INFO_OFFSET
+			if (fInfoA_entryType == 1):
+				disk.buffer.readinto(forkStart + 18,
+						memoryview(self.ad_header)[fInfo:fInfo + 8])
+			elif (fInfoA_entryType == 2):
+				disk.buffer.readinto(forkStart + 10,
+						memoryview(self.ad_header)[fxInfo:fxInfo + 16])
+			if (fInfoB_entryType == 1):
+				disk.buffer.readinto(forkStart + 36,
+						memoryview(self.ad_header)[fInfo:fInfo + 8])
+			elif (fInfoB_entryType == 2):
+				disk.buffer.readinto(forkStart + 28,
+						memoryview(self.ad_header)[fxInfo:fxInfo + 16])
+
+		for f in (0, 256):
+			self.resourceFork = f
+			self.activeFileBytesCopied = 0
+			#print("--" + forkStart)
+			forkStorageType = disk.buffer.read1(forkStart + f)
+			forkKeyPointer = unpack_u16le(
+					disk.buffer.read(forkStart + f + 1, 2))
+			forkFileLen = unpack_u24le(disk.buffer.read(forkStart + f + 5, 3))
+			self.activeFileSize = forkFileLen
+			if self.resourceFork > 0:
+				rsrcForkLen = unpack_u24le(
+						disk.buffer.read(forkStart + f + 5, 3))
+				#print(">>>", rsrcForkLen)
+				if self.use_appledouble or self.use_extended:
+					self._print("    [resource fork]")
+				else:
+					continue  # nowhere to put it
+				self.ex_data = self.openResourceFork(saveName, rsrcForkLen)
+				if self.ex_data is None:
+					continue  # empty, so there's nothing to copy
+			else:
+				self._print("    [data fork]")
+				self.out_data = self.openFork(saveName, forkFileLen)
+			if forkStorageType in (
+					prodos.SEEDLING, prodos.SAPLING, prodos.TREE):
+				self.copyExtents(disk, prodos.file_extents(
+					disk.buffer, forkStorageType, forkKeyPointer, forkFileLen))
+		#print()
+		self.resourceFork = 0
+
+	def copyExtents(self, disk, arg1):
+		#arg1: list of (first block, block count) from prodos.file_extents
+		# each run of consecutive blocks (or of sparse blocks) is a single copy
+		for block, count in arg1:
+			bytesRemaining = self.activeFileSize - self.activeFileBytesCopied
+			self.copyBlock(disk, block, min(count * 512, bytesRemaining))
+
+	def copySectors(self, disk, arg1):
+		#arg1: list of DOS 3.3 [t,s] from dos33.data_sectors
+		for targetTS in arg1:
+			bytesRemaining = (self.activeFileSize - self.activeFileBytesCopied)
+			if bytesRemaining <= 0:
+				break
+			self.copyBlock(disk, targetTS, min(bytesRemaining, 256))
+
+	def makeADfile(self):
+		if not self.use_appledouble:
+			return
+		self.ad_header = appledouble.new_header()
+
+	def quit_now(self, exitcode=0):
+		self.writer.close()  # finish writing before we say we're done
+		if (exitcode == 0 and self.afpsync_msg and self.use_appledouble
+				and os.path.isdir("/usr/local/etc/netatalk")):
+			self._print(
+					"File(s) have been copied to the target directory. "
+					"If the directory\n"
+					"is shared by Netatalk, please type 'afpsync' now.")
+		raise _Finished(exitcode)
+
+	def shkEntries(self, records):
+		# records: nufx.Records of a ShrinkIt archive
+		# returns (a ShkEntry for each file, set of directory paths), named
+		#   and laid out the way nulib2 -xe would have extracted them
+		entries = []
+		dirs = {""}
+		for record in records:
+			parts = [part.decode("L1").replace("/", ":")
+					for part in record.path()]
+			if not parts:
+				continue
+			path = "/".join(parts[:-1])
+			for i in range(len(parts)):
+				dirs.add("/".join(parts[:i]))
+			if (record.data_fork is None and record.resource_fork is None
+					and record.disk_image is None
+					and (record.file_type == 0x0f
+						or record.storage_type == prodos.DIRECTORY)):
+				dirs.add("/".join(parts))
+				continue
+			if record.disk_image is not None:
+				name = (parts[-1]
+						+ ("" if os.path.splitext(parts[-1].lower())[1]
+							in ('.po', '.hdv') else ".PO") + "#e00005")
+			else:
+				name = "{}#{:02x}{:04x}".format(parts[-1],
+						record.file_type & 0xff, record.aux_type & 0xffff)
+			entries.append(ShkEntry(path, name, record))
+		return entries, dirs
+
+	def processArchive(self, disk):
+		# disk: a ShrinkIt archive, whose records are read and decompressed
+		#   straight from the image buffer by nufx, and processed directory
+		#   by directory in the order nulib2 would have extracted them; a
+		#   catalog reads nothing but the record headers
+		self.prodos_names = False
+		try:
+			entries, dirs = self.shkEntries(nufx.read_records(disk.buffer))
+		except nufx.NuFXError as e:
+			LOG.debug(e)
+			self._print("ShrinkIt archive is invalid, "
 					"or some other problem happened.")
-			quit_now(1)
-		if g.extract_file:
-			g.extract_file = g.extract_file.replace(':', '/')
-			extractPath = (unshkdir + "/" + g.extract_file)
-			extractPathDir = os.path.dirname(extractPath)
-			# move the extracted file to the root
-			newunshkdir = ('/tmp' + "/cppo-" + str(uuid.uuid4()))
-			makedirs(newunshkdir)
-			for filename in os.listdir(extractPathDir):
-				shutil.move(extractPathDir + "/" + filename, newunshkdir)
-			shutil.rmtree(unshkdir)
-			unshkdir = newunshkdir
-
-		fileNames = [name for name in sorted(os.listdir(unshkdir))
-					 if not name.startswith(".")]
-		if g.extract_in_place:  # extract in place from "-n"
+			self.quit_now(1)
+		if self.extract_file:
+			self.extract_file = self.extract_file.replace(':', '/')
+			wanted = self.extract_file.strip('/').lower()
+			# the file is extracted to the top level, alone
+			entries = [ShkEntry("", entry.name, entry.record)
+					for entry in entries
+					if "/".join(filter(None, (entry.path,
+						entry.name.split('#')[0]))).lower() == wanted]
+			dirs = {""}
+			if not entries:
+				self._print(
+						"File not found in ShrinkIt archive. "
+						"Try cppo -cat to get the path,\n"
+						"  and omit any leading slash or colon.")
+				self.quit_now(1)
+
+		# what's at the top level, as nulib2 would have extracted it
+		fileNames = {path.split('/')[0] for path in dirs if path}
+		for entry in entries:
+			if not entry.path:
+				fileNames.add(entry.name)
+				if entry.record.resource_fork is not None:
+					fileNames.add(entry.name + "r")
+		fileNames = sorted(fileNames)
+		if self.extract_in_place:  # extract in place from "-n"
+			curDir = True
+		elif len(fileNames) == 1 and fileNames[0] in dirs:
+			# only one folder at top level, so extract in place
 			curDir = True
-		elif (len(fileNames) == 1 and
-				os.path.isdir(unshkdir + "/" + fileNames[0])):
-			curDir = True  # only one folder at top level, so extract in place
 			volumeName = toProdosName(fileNames[0])
 		elif (len(fileNames) == 1 and  # disk image, so extract in place
-				fileNames[0][-1:] == "i"):
+				entries[0].record.disk_image is not None):
 			curDir = True
 			volumeName = toProdosName(fileNames[0].split("#")[0])
 		else:  # extract in folder based on disk image name
@@ -905,156 +1032,149 @@ def run_cppo():
 			volumeName = toProdosName(os.path.basename(disk.pathname))
 			if volumeName[-4:].lower() in ('.shk', '.sdk', '.bxy'):
 				volumeName = volumeName[:-4]
-		if not g.catalog_only and not curDir and not g.extract_file:
-			print("Extracting into " + volumeName)
-		# recursively process unshrunk archive hierarchy
-		for dirName, subdirList, fileList in os.walk(unshkdir):
-			subdirList.sort()
-			if not g.catalog_only:
-				g.target_dir = (
-						g.target_dir
-						+ ("" if curDir else ("/" + volumeName))
-						+ ("/" if dirName.count('/') > 2 else "")
-						+ ("/".join(dirName.split('/')[3:])))  # chop tempdir
-				if g.casefold_upper:
-					g.target_dir = g.target_dir.upper()
-				g.appledouble_dir = (g.target_dir + "/.AppleDouble")
-				makedirs(g.target_dir)
-				if g.use_appledouble:
-					makedirs(g.appledouble_dir)
-			for fname in sorted(fileList):
-				if fname[-1:] == "i":
-					# disk image; rename to include suffix and correct
-					# type/auxtype
-					imagePath = os.path.join(dirName, fname).split("#")[0]
-					new_name = (
-							imagePath
-							+ ("" if os.path.splitext(imagePath.lower())[1]
-								in ('.po', '.hdv') else ".PO") + "#e00005")
-					os.rename(os.path.join(dirName, fname), new_name)
-					fname = os.path.basename(new_name)
-				g.shk_hasrf = False
-				rfork = False
-				if (fname[-1:] == "r"
-						and os.path.isfile(os.path.join(dirName, fname[:-1]))):
-					rfork = True
-				elif (os.path.isfile(os.path.join(dirName, (fname + "r")))):
-					g.shk_hasrf = True
-				if not rfork:
-					processEntry(disk, dirName, fname)
-		shutil.rmtree(unshkdir, True)
-		quit_now(0)
-
-	# end script if SHK
-
-	# detect if image is 2mg and remove 64-byte header if so
-	if disk.ext in ('.2mg', '.2img'):
-		# FIXME: Seriously STOP doing this...
-		disk.buffer._buf = disk.buffer._buf[64:]
-
-	# handle 140k disk image
-	if len(disk.buffer) == 143360:
-		LOG.debug("140k disk")
-		prodos_disk = False
-		fix_order = False
-		# is it ProDOS?
-		if disk.buffer.read(ts(0, 0), 4) == b'\x01\x38\xb0\x03':
-			LOG.debug("detected ProDOS by boot block")
-			if disk.buffer.read(ts(0, 1) + 3, 6) == b'PRODOS':
-				LOG.debug("order OK (PO)")
-				prodos_disk = True
-			elif disk.buffer.read(ts(0, 14) + 3, 6) == b'PRODOS':
-				LOG.debug("order needs fixing (DO)")
-				prodos_disk = True
-				fix_order = True
-		# is it DOS 3.3?
+		if not self.catalog_only and not curDir and not self.extract_file:
+			self._print("Extracting into " + volumeName)
+
+		files = {path: [] for path in dirs}
+		for entry in entries:
+			files[entry.path].append(entry)
+		baseDir = self.target_dir
+		try:
+			# process the archive hierarchy as os.walk would have
+			for path in sorted(dirs, key=lambda path: path.split('/')):
+				if not self.catalog_only:
+					dirPath = (("" if curDir else ("/" + volumeName))
+							+ ("/" + path if path else ""))
+					if self.casefold_upper:
+						dirPath = dirPath.upper()
+					self.target_dir = baseDir + dirPath
+					self.appledouble_dir = (self.target_dir + "/.AppleDouble")
+					self.ensureDir(self.target_dir)
+					if self.use_appledouble:
+						self.ensureDir(self.appledouble_dir)
+				for entry in sorted(files[path], key=lambda e: e.name):
+					self.shk_hasrf = entry.record.resource_fork is not None
+					self.processEntry(disk, entry)
+		except nufx.NuFXError as e:
+			LOG.debug(e)
+			self._print("ShrinkIt archive is invalid, "
+					"or some other problem happened.")
+			self.quit_now(1)
+		self.quit_now(0)
+
+	def run_cppo(self, disk):
+		# disk: the diskimg.Disk opened by run()
+		# automatically set ShrinkIt mode if extension suggests it
+		if disk.ext in ('.shk', '.sdk', '.bxy'):
+			self.src_shk = True
+
+		if self.src_shk:
+			self.processArchive(disk)
+
+		# end script if SHK
+
+		# 2mg headers are handled by diskimg.Disk, which hides them from us
+
+		# handle 140k disk image
+		if len(disk.buffer) == 143360:
+			LOG.debug("140k disk")
+			prodos_disk = False
+			fix_order = False
+			# is it ProDOS?
+			if disk.buffer.read(ts(0, 0), 4) == b'\x01\x38\xb0\x03':
+				LOG.debug("detected ProDOS by boot block")
+				if disk.buffer.read(ts(0, 1) + 3, 6) == b'PRODOS':
+					LOG.debug("order OK (PO)")
+					prodos_disk = True
+				elif disk.buffer.read(ts(0, 14) + 3, 6) == b'PRODOS':
+					LOG.debug("order needs fixing (DO)")
+					prodos_disk = True
+					fix_order = True
+			# is it DOS 3.3?
+			else:
+				LOG.debug("it's not ProDOS")
+				if disk.buffer.read1(ts(17, 0) + 3) == 3:
+					vtocT, vtocS = disk.buffer.read(ts(17,0) + 1, 2)
+					if vtocT < 35 and vtocS < 16:
+						LOG.debug("it's DOS 3.3")
+						self.dos33 = True
+						# it's DOS 3.3; check sector order next
+						if disk.buffer.read1(ts(17, 14) + 2) != 13:
+							LOG.debug("order needs fixing (PO)")
+							fix_order = True
+						else:
+							LOG.debug("order OK (DO)")
+			# fall back on disk extension if weird boot block (e.g. AppleCommander)
+			if not prodos_disk and not self.dos33:
+				LOG.debug("format and ordering unknown, checking extension")
+				if disk.ext in ('.dsk', '.do'):
+					LOG.debug("extension indicates DO, changing to PO")
+					fix_order = True
+			if fix_order:
+				LOG.debug("fixing order")
+				disk.buffer = diskimg.dopo_swap(disk.buffer)
+
+			if not prodos_disk and not self.dos33:
+				self._print("Warning: Unable to determine disk format, "
+						"assuming ProDOS.")
+
+		# enforce leading slash if ProDOS
+		if (not self.src_shk and not self.dos33 and self.extract_file
+				and (self.extract_file[0] not in ('/', ':'))):
+			LOG.critical("Cannot extract {} from {}: "
+					"ProDOS volume name required".format(
+						self.extract_file, self.image_file))
+			self.quit_now(2)
+
+		if self.dos33:
+			disk_name = (disk.diskname if disk.ext in ('.dsk', '.do', '.po')
+					else disk.filename)
+			if self.prodos_names:
+				disk_name = toProdosName(disk_name)
+			if not self.catalog_only:
+				self._print(self.target_dir)
+				self.target_dir = (self.extract_file if self.extract_file
+						else (self.target_dir + "/" + disk_name))
+				self.appledouble_dir = (self.target_dir + "/.AppleDouble")
+				self.ensureDir(self.target_dir)
+				if self.use_appledouble:
+					self.ensureDir(self.appledouble_dir)
+				if not self.extract_file:
+					self._print("Extracting into " + disk_name)
+			self.process_dir(disk, tuple(disk.buffer.read(ts(17, 0) + 1, 2)))
+			if self.extract_file:
+				self._print("ProDOS file not found within image file.")
+			self.quit_now(0)
+
+		# below: ProDOS
+
+		self.activeDirBlock = 0
+		self.activeFileName = ""
+		self.activeFileSize = 0
+		self.activeFileBytesCopied = 0
+		self.resourceFork = 0
+		self.PDOSPATH_INDEX = 0
+		self.prodos_names = False
+
+		if self.extract_file:
+			self.PDOSPATH = self.extract_file.replace(':', '/').split('/')
+			self.extract_file = None
+			if not self.PDOSPATH[0]:
+				self.PDOSPATH_INDEX += 1
+			self.PDOSPATH_SEGMENT = self.PDOSPATH[self.PDOSPATH_INDEX]
+			self.appledouble_dir = (self.target_dir + "/.AppleDouble")
+			if self.use_appledouble:
+				self.ensureDir(self.appledouble_dir)
+			self.process_dir(disk, 2)
+			self._print("ProDOS file not found within image file.")
+			self.quit_now(2)
 		else:
-			LOG.debug("it's not ProDOS")
-			if disk.buffer.read1(ts(17, 0) + 3) == 3:
-				vtocT, vtocS = disk.buffer.read(ts(17,0) + 1, 2)
-				if vtocT < 35 and vtocS < 16:
-					LOG.debug("it's DOS 3.3")
-					g.dos33 = True
-					# it's DOS 3.3; check sector order next
-					if disk.buffer.read1(ts(17, 14) + 2) != 13:
-						LOG.debug("order needs fixing (PO)")
-						fix_order = True
-					else:
-						LOG.debug("order OK (DO)")
-		# fall back on disk extension if weird boot block (e.g. AppleCommander)
-		if not prodos_disk and not g.dos33:
-			LOG.debug("format and ordering unknown, checking extension")
-			if disk.ext in ('.dsk', '.do'):
-				LOG.debug("extension indicates DO, changing to PO")
-				fix_order = True
-		if fix_order:
-			LOG.debug("fixing order")
-			# FIXME
-			disk.buffer._buf = dopo_swap(disk.buffer._buf)
-			#print("saving fixed order file as outfile.dsk")
-			#save_file("outfile.dsk", disk.buffer._buf)
-			#print("saved")
-
-		if not prodos_disk and not g.dos33:
-			print("Warning: Unable to determine disk format, assuming ProDOS.")
-
-	# enforce leading slash if ProDOS
-	if (not g.src_shk and not g.dos33 and g.extract_file
-			and (g.extract_file[0] not in ('/', ':'))):
-		LOG.critical("Cannot extract {} from {}: "
-				"ProDOS volume name required".format(
-					g.extract_file, g.image_file))
-		quit_now(2)
-
-	if g.dos33:
-		disk_name = (disk.diskname if disk.ext in ('.dsk', '.do', '.po')
-				else disk.filename)
-		if g.prodos_names:
-			disk_name = toProdosName(disk_name)
-		if not g.catalog_only:
-			print(g.target_dir)
-			g.target_dir = (g.extract_file if g.extract_file
-					else (g.target_dir + "/" + disk_name))
-			g.appledouble_dir = (g.target_dir + "/.AppleDouble")
-			makedirs(g.target_dir)
-			if g.use_appledouble:
-				makedirs(g.appledouble_dir)
-			if not g.extract_file:
-				print("Extracting into " + disk_name)
-		process_dir(disk, list(disk.buffer.read(ts(17, 0) + 1, 2)))
-		if g.extract_file:
-			print("ProDOS file not found within image file.")
-		quit_now(0)
-
-	# below: ProDOS
-
-	g.activeDirBlock = 0
-	g.activeFileName = ""
-	g.activeFileSize = 0
-	g.activeFileBytesCopied = 0
-	g.resourceFork = 0
-	g.PDOSPATH_INDEX = 0
-	g.prodos_names = False
-
-	if g.extract_file:
-		g.PDOSPATH = g.extract_file.replace(':', '/').split('/')
-		g.extract_file = None
-		if not g.PDOSPATH[0]:
-			g.PDOSPATH_INDEX += 1
-		g.PDOSPATH_SEGMENT = g.PDOSPATH[g.PDOSPATH_INDEX]
-		g.appledouble_dir = (g.target_dir + "/.AppleDouble")
-		if g.use_appledouble and not os.path.isdir(g.appledouble_dir):
-			mkdir(g.appledouble_dir)
-		process_dir(disk, 2)
-		print("ProDOS file not found within image file.")
-		quit_now(2)
-	else:
-		if not g.catalog_only:
-			g.target_dir = (g.target_dir + "/" + getVolumeName(disk).decode())
-			g.appledouble_dir = (g.target_dir + "/.AppleDouble")
-			if not os.path.isdir(g.target_dir):
-				makedirs(g.target_dir)
-			if g.use_appledouble and not os.path.isdir(g.appledouble_dir):
-				makedirs(g.appledouble_dir)
-		process_dir(disk, 2)
-		quit_now(0)
+			if not self.catalog_only:
+				self.target_dir = (self.target_dir + "/"
+						+ self.getVolumeName(disk).decode())
+				self.appledouble_dir = (self.target_dir + "/.AppleDouble")
+				self.ensureDir(self.target_dir)
+				if self.use_appledouble:
+					self.ensureDir(self.appledouble_dir)
+			self.process_dir(disk, 2)
+			self.quit_now(0)
@@ -0,0 +1,305 @@
+# vim: set tabstop=4 shiftwidth=4 noexpandtab filetype=python:
+
+# Copyright (C) 2017  T. Joseph Carter
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+# or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License
+# for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+"""ShrinkIt's LZW/1 and LZW/2 compression
+
+ShrinkIt compresses a thread 4096 bytes at a time.  Each chunk is first
+run-length encoded, and then LZW compressed if that makes it smaller, with
+9 to 12 bit codes packed least significant bit first.
+
+LZW/1 threads begin with a CRC-16 of the uncompressed data, a volume number,
+and the RLE delimiter.  Each chunk has a three byte header (the length after
+RLE, which is 4096 if RLE didn't help, and a flag saying whether the chunk is
+LZW compressed), and every chunk starts with an empty string table.
+
+LZW/2 threads drop the CRC.  A chunk's header is the length after RLE with
+the high bit set if it is LZW compressed, followed by the chunk's compressed
+length in that case.  The string table carries over from chunk to chunk
+until a clear code empties it, or a chunk is stored without LZW.
+
+Every string in the table is the string before it plus the first byte of
+the string after it, and those two are next to each other in the output.
+So rather than building strings, the Decoder keeps the output since the
+table was last emptied and two preallocated arrays giving where each code's
+string starts in it and how long it is; decoding a code is one slice copy.
+Nothing here knows about NuFX, so any LZW/1 or LZW/2 stream can be expanded,
+whether it's a file's fork or a whole disk image.
+"""
+
+import binascii
+import struct
+from array import array
+from typing import Iterator, Tuple
+
+CHUNK_SIZE = 4096
+"""Length of the data in every chunk but the last"""
+
+CLEAR_CODE = 0x100
+"""LZW/2 code to empty the string table"""
+
+FIRST_CODE = 0x101
+"""First code in the string table"""
+
+MAX_CODE = 0x0fff
+"""Last code in the string table"""
+
+_LONGEST_CHUNK = CHUNK_SIZE * 12 // 8
+"""Most bytes a chunk can be LZW compressed to (one 12 bit code a byte)"""
+
+_WIDTHS = bytes([9] + [min((entry + 1).bit_length(), 12)
+		for entry in range(1, MAX_CODE + 2)])
+"""Code width by the next table entry to be filled (0 after a reset)"""
+
+_MASKS = tuple((1 << width) - 1 for width in range(13))
+"""Mask for a code of each width"""
+
+class LZWError(ValueError):
+	"""Compressed data that can't be decoded"""
+	pass
+
+
+def unrle(data: bytes, delimiter: int, out: bytearray) -> None:
+	"""Expand a run-length encoded chunk into a chunk buffer
+
+	A run is the delimiter, the byte to repeat, and one less than the number
+	of times to repeat it.  Whatever the runs don't fill is zeroed.
+
+	Args:
+		data: The encoded chunk (bytes, bytearray, or memoryview)
+		delimiter: The byte introducing a run
+		out: Buffer of CHUNK_SIZE bytes to expand the chunk into
+
+	Raises:
+		LZWError: The chunk expands to more than CHUNK_SIZE bytes or ends
+			in the middle of a run
+	"""
+	source = bytes(data)
+	end = len(source)
+	i = o = 0
+	while i < end:
+		j = source.find(delimiter, i)
+		if j < 0:
+			j = end
+		if o + j - i > CHUNK_SIZE:
+			raise LZWError("RLE chunk is too long")
+		out[o:o + j - i] = source[i:j]
+		o += j - i
+		if j == end:
+			break
+		if j + 2 >= end:
+			raise LZWError("RLE chunk ends in a run")
+		count = source[j + 2] + 1
+		if o + count > CHUNK_SIZE:
+			raise LZWError("RLE chunk is too long")
+		out[o:o + count] = source[j + 1:j + 2] * count
+		o += count
+		i = j + 3
+	if o < CHUNK_SIZE:
+		out[o:] = bytes(CHUNK_SIZE - o)
+
+
+class Decoder(object):
+	"""LZW decoder whose string table can outlive a chunk (for LZW/2)
+
+	Code strings are (start, length) entries in a pair of arrays, with
+	start counting from the first byte decoded since the decoder was made;
+	_base is how much of that has since been dropped from _history.
+	"""
+	__slots__ = (
+			'_starts', '_lengths', '_history', '_base', 'entry',
+			'_previous_start', '_previous_length')
+
+	def __init__(self) -> None:
+		self._starts = array('L', [0]) * (MAX_CODE + 1)
+		self._lengths = array('H', [0]) * (MAX_CODE + 1)
+		self._history = bytearray()
+		self._base = 0
+		self.entry = 0  # zero until the first code after a reset
+		self._previous_start = 0
+		self._previous_length = 0
+
+	def reset(self) -> None:
+		"""Empty the string table"""
+		self.entry = 0
+
+	def _trim(self) -> None:
+		"""Drop output no string in the table refers to any more"""
+		history = self._history
+		if self.entry > FIRST_CODE:
+			# strings are added in the order they were decoded
+			low = self._starts[FIRST_CODE]
+		elif self.entry:
+			low = self._previous_start
+		else:
+			low = self._base + len(history)
+		if low > self._base:
+			del history[:low - self._base]
+			self._base = low
+
+	def decode(
+			self,
+			data: bytes,
+			length: int,
+			clear: bool
+			) -> Tuple[bytearray, int]:
+		"""Decode codes from data until length bytes have been produced
+
+		Args:
+			data: The compressed chunk, starting at a byte boundary
+			length: Number of bytes the chunk decodes to
+			clear: True if CLEAR_CODE is a clear code (LZW/2)
+
+		Returns:
+			(the decoded bytes, number of bytes of data consumed)
+
+		Raises:
+			LZWError: The chunk is corrupt
+		"""
+		self._trim()
+		starts = self._starts
+		lengths = self._lengths
+		history = self._history
+		base = self._base
+		begin = len(history)
+		end = begin + length
+		bits = len(data) * 8
+		source = bytes(data) + b'\0\0\0'
+		entry = self.entry
+		previous_start = self._previous_start
+		previous_length = self._previous_length
+		bit = 0
+		while len(history) < end:
+			width = _WIDTHS[entry]
+			if bit + width > bits:
+				raise LZWError("compressed chunk is truncated")
+			byte = bit >> 3
+			code = ((source[byte] | source[byte + 1] << 8
+					| source[byte + 2] << 16) >> (bit & 7)) & _MASKS[width]
+			bit += width
+			start = base + len(history)
+			if code < 0x100:
+				history.append(code)
+				code_length = 1
+				if not entry:
+					# first code after a reset starts the table
+					entry = FIRST_CODE
+					previous_start, previous_length = start, 1
+					continue
+			elif code == CLEAR_CODE:
+				if not clear:
+					# LZW/1 never sends it, and never defines it either
+					raise LZWError("bad code {:#x}".format(code))
+				entry = 0
+				continue
+			elif not entry:
+				raise LZWError("bad first code {:#x}".format(code))
+			elif code < entry:
+				code_start = starts[code] - base
+				code_length = lengths[code]
+				history += history[code_start:code_start + code_length]
+			elif code == entry:
+				# the string being defined: previous plus its own first byte
+				code_start = previous_start - base
+				history += history[code_start:code_start + previous_length]
+				history.append(history[code_start])
+				code_length = previous_length + 1
+			else:
+				raise LZWError("bad code {:#x}".format(code))
+			if entry <= MAX_CODE:
+				starts[entry] = previous_start
+				lengths[entry] = previous_length + 1
+				entry += 1
+			previous_start, previous_length = start, code_length
+		self.entry = entry
+		self._previous_start = previous_start
+		self._previous_length = previous_length
+		if len(history) > end:
+			raise LZWError("chunk decodes to more than its length")
+		return history[begin:], (bit + 7) >> 3
+
+
+def expand(
+		data: bytes,
+		length: int,
+		lzw2: bool,
+		verify: bool = True
+		) -> Iterator[memoryview]:
+	"""Decompress an LZW/1 or LZW/2 thread
+
+	Args:
+		data: The compressed thread
+		length: Length of the uncompressed thread
+		lzw2: True for LZW/2, False for LZW/1
+		verify: Check an LZW/1 thread's CRC once it's all decompressed
+
+	Yields:
+		The uncompressed thread a chunk at a time, as views of a buffer
+		which is reused for the next chunk
+
+	Raises:
+		LZWError: The thread is corrupt
+	"""
+	data = memoryview(data)
+	position = 2 if lzw2 else 4
+	if len(data) < position:
+		raise LZWError("thread is too short")
+	delimiter = data[position - 1]
+	decoder = Decoder()
+	chunk = bytearray(CHUNK_SIZE)
+	view = memoryview(chunk)
+	crc = 0
+	remaining = length
+	try:
+		while remaining > 0:
+			if lzw2:
+				header, = struct.unpack_from('<H', data, position)
+				rle_length = header & 0x1fff
+				compressed = bool(header & 0x8000)
+				position += 4 if compressed else 2
+			else:
+				rle_length, compressed = struct.unpack_from(
+						'<HB', data, position)
+				position += 3
+				decoder.reset()
+			if rle_length > CHUNK_SIZE:
+				raise LZWError("bad chunk length {}".format(rle_length))
+			if compressed:
+				rle, used = decoder.decode(
+						data[position:position + _LONGEST_CHUNK],
+						rle_length, lzw2)
+				position += used
+			else:
+				rle = data[position:position + rle_length]
+				if len(rle) < rle_length:
+					raise LZWError("stored chunk is truncated")
+				position += rle_length
+				decoder.reset()
+			if rle_length == CHUNK_SIZE:
+				view[:] = rle
+			else:
+				unrle(rle, delimiter, chunk)
+			if verify and not lzw2:
+				crc = binascii.crc_hqx(view, crc)
+			yield view[:remaining]
+			remaining -= CHUNK_SIZE
+	except struct.error:
+		raise LZWError("thread is truncated")
+	if verify and not lzw2:
+		expected, = struct.unpack_from('<H', data)
+		if crc != expected:
+			raise LZWError("CRC is {:04x} instead of {:04x}".format(
+				crc, expected))
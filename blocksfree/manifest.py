@@ -0,0 +1,147 @@
+# vim: set tabstop=4 shiftwidth=4 noexpandtab filetype=python:
+
+# Copyright (C) 2017  T. Joseph Carter
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+# or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License
+# for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+"""Manifests of what has already been extracted into a directory
+
+Re-extracting an image into the same place rewrites every file, even those
+that haven't changed since last time.  A Manifest kept in the target
+directory remembers, for each image extracted there and each set of options
+it was extracted with, a stamp of every file it held: its key pointer, EOF,
+and modification date, and so on.  A file whose stamp is the same as last
+time, and whose output is all still there, needn't be extracted again, no
+matter what else in the image has changed.
+
+That relies on a file's modification date changing whenever the file does.
+DOS 3.3 files have no dates, and nor do ProDOS files saved without a clock,
+so the stamps of those include the image's own fingerprint as well: they
+are extracted again whenever the image changes at all.
+
+A manifest is only safe for one run at a time to update: runs sharing a
+target directory never see each other's half-written manifest, but the
+last one to finish wins.
+"""
+
+import json
+import os
+import tempfile
+from typing import Any, Dict, List, Sequence
+
+from .catcache import fingerprint
+from .logging import LOG
+
+MANIFEST_NAME = '.cppo-manifest.json'
+MANIFEST_VERSION = 2
+
+class Manifest(object):
+	"""The manifest of one image in one target directory
+
+	Args:
+		target_dir: The directory the image is extracted into
+		image_file: Path of the image
+		options: Anything about how the image is extracted that changes what
+			gets written (e.g. the command line flags)
+	"""
+
+	def __init__(
+			self,
+			target_dir: str,
+			image_file: str,
+			options: str
+			) -> None:
+		self.path = os.path.join(target_dir, MANIFEST_NAME)
+		self.target_dir = target_dir
+		self.image = os.path.abspath(image_file)
+		self.options = options
+		self._images = self._load()
+		self._previous = self._images.get(self.image, {}).get(options, {})
+		self._files = dict(self._previous)
+		self._image_stamp = None
+
+	def _load(self) -> Dict[str, Any]:
+		"""Return the images recorded in the manifest file, if there is one
+
+		Each image's path maps the options it was extracted with to the
+		stamps of its files.
+		"""
+		try:
+			with open(self.path) as manifest_file:
+				manifest = json.load(manifest_file)
+		except FileNotFoundError:
+			return {}
+		except (OSError, ValueError) as e:
+			LOG.warning("ignoring unreadable manifest {}: {}", self.path, e)
+			return {}
+		if (not isinstance(manifest, dict)
+				or manifest.get('version') != MANIFEST_VERSION):
+			return {}
+		return manifest.get('images', {})
+
+	def is_current(
+			self,
+			file_path: str,
+			stamp: List,
+			outputs: Sequence[str]
+			) -> bool:
+		"""Record a file's stamp and say whether its output is current
+
+		Output is current if the same file of the same image, extracted with
+		the same options, was given the same stamp the last time the
+		manifest was saved, and every one of its output files is still
+		there.
+
+		Args:
+			file_path: Path the file is saved at
+			stamp: JSON-compatible list identifying this version of the file
+			outputs: Every file the file's output consists of
+
+		Returns:
+			True if the file need not be extracted again
+		"""
+		key = os.path.relpath(file_path, self.target_dir)
+		self._files[key] = stamp
+		return (self._previous.get(key) == stamp
+				and all(os.path.exists(output) for output in outputs))
+
+	def image_stamp(self) -> List:
+		"""Return the image's fingerprint, for the stamps of undated files
+
+		Raises:
+			OSError: The image can't be read
+		"""
+		if self._image_stamp is None:
+			self._image_stamp = list(fingerprint(self.image))
+		return self._image_stamp
+
+	def save(self) -> None:
+		"""Write the manifest file, replacing the old one in one step
+
+		The new manifest is written to a temporary file of this run's own
+		beside it first, which is removed if it can't be written.
+		"""
+		self._images.setdefault(self.image, {})[self.options] = self._files
+		fd, temp_path = tempfile.mkstemp(
+				prefix=MANIFEST_NAME + '.', dir=self.target_dir)
+		try:
+			os.chmod(temp_path, 0o644)
+			with open(fd, 'w') as manifest_file:
+				json.dump(
+						{'version': MANIFEST_VERSION, 'images': self._images},
+						manifest_file, indent=1, sort_keys=True)
+			os.replace(temp_path, self.path)
+		except BaseException:
+			os.unlink(temp_path)
+			raise
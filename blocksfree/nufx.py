@@ -0,0 +1,374 @@
+# vim: set tabstop=4 shiftwidth=4 noexpandtab filetype=python:
+
+# Copyright (C) 2017  T. Joseph Carter
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+# or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License
+# for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+"""NuFX (ShrinkIt) archives
+
+A NuFX archive is a 48 byte master header followed by its records.  Each
+record is a header describing one file (its name, types, dates, and so on),
+a list of 16 byte thread headers, and then the data of each thread in turn.
+A file's name, data fork, resource fork, or disk image are each a thread of
+their own, compressed or not.
+
+Records are read straight from the archive's buffer, and thread data is
+decompressed as it's read without ever being written anywhere first.  The
+archive may be wrapped in Binary II, as .bxy files are.
+"""
+
+import bz2
+import datetime
+import struct
+import zlib
+from collections import namedtuple
+from typing import Iterator, List, Optional, Tuple
+
+from . import lzw
+from .buffer.buffertype import BufferType
+
+MASTER_ID = b'N\xf5F\xe9l\xe5'
+RECORD_ID = b'N\xf5F\xd8'
+BINARY2_ID = b'\x0aGL'
+BINARY2_HEADER_LENGTH = 128
+
+MASTER_HEADER = struct.Struct('<6sHI8s8sH8sI6s')
+"""Layout of the 48 byte master header"""
+
+RECORD_HEADER = struct.Struct('<4sHHHIHHIIIH8s8s8s')
+"""Layout of the fixed part of a record header"""
+
+THREAD_HEADER = struct.Struct('<HHHHII')
+"""Layout of a 16 byte thread header"""
+
+# Thread classes
+MESSAGE = 0x0
+CONTROL = 0x1
+DATA = 0x2
+FILENAME = 0x3
+
+# Data thread kinds
+DATA_FORK = 0x0
+DISK_IMAGE = 0x1
+RESOURCE_FORK = 0x2
+
+# Thread formats
+UNCOMPRESSED = 0x0
+SQUEEZE = 0x1
+LZW1 = 0x2
+LZW2 = 0x3
+LZC12 = 0x4
+LZC16 = 0x5
+DEFLATE = 0x6
+BZIP2 = 0x7
+
+FORMAT_NAMES = {
+		UNCOMPRESSED: 'uncompressed',
+		SQUEEZE: 'Huffman squeeze',
+		LZW1: 'LZW/1',
+		LZW2: 'LZW/2',
+		LZC12: '12-bit LZC',
+		LZC16: '16-bit LZC',
+		DEFLATE: 'deflate',
+		BZIP2: 'bzip2',
+		}
+
+MasterHeader = namedtuple('MasterHeader', (
+		'offset', 'total_records', 'created', 'modified', 'version', 'eof'))
+"""The master header: where the archive starts, how many records it has,
+its dates, its version, and its length (zero before version 1)"""
+
+class NuFXError(ValueError):
+	"""An archive we can't read"""
+	pass
+
+
+def date_to_unix(raw: bytes) -> Optional[int]:
+	"""Return a UNIX timestamp given a NuFX date, or None if it isn't set
+
+	A NuFX date is the IIgs ReadTimeHex layout: second, minute, hour, year
+	since 1900, day and month (both counting from zero), a filler byte, and
+	the day of the week.  Like ProDOS dates, they're taken as local time.
+	"""
+	second, minute, hour, year, day, month, _filler, _weekday = raw
+	if not any(raw[:6]):
+		return None
+	year += 1900 if year >= 40 else 2000
+	try:
+		return int(datetime.datetime(year, month + 1, day + 1,
+			hour, minute, second).timestamp())
+	except (ValueError, OverflowError):
+		return None
+
+
+class Thread(object):
+	"""A thread header
+
+	Attributes:
+		thread_class: MESSAGE, CONTROL, DATA, or FILENAME
+		format: One of the thread format constants above
+		kind: What the thread is within its class (e.g. DATA_FORK)
+		crc: CRC-16 of the uncompressed thread (record version 3 only)
+		eof: Length of the thread once uncompressed
+		comp_eof: Length of the thread's data in the archive
+		offset: Where the thread's data starts in the archive's buffer
+	"""
+	__slots__ = (
+			'thread_class', 'format', 'kind', 'crc', 'eof', 'comp_eof',
+			'offset')
+
+	def __init__(self, offset: int, fields: tuple) -> None:
+		(self.thread_class, self.format, self.kind, self.crc, self.eof,
+			self.comp_eof) = fields
+		self.offset = offset
+
+	def __repr__(self) -> str:
+		return '<NuFX Thread class {} kind {} {} {}/{}>'.format(
+				self.thread_class, self.kind,
+				FORMAT_NAMES.get(self.format, self.format),
+				self.comp_eof, self.eof)
+
+
+class Record(object):
+	"""A record header, with its threads
+
+	The dates are only decoded when they're first asked for.
+
+	Attributes:
+		offset: Where the record starts in the archive's buffer
+		version: Record version
+		file_sys_id: File system the file came from (1 is ProDOS)
+		separator: Byte separating the parts of filename
+		access: Access bits
+		file_type: File type (ProDOS type, or HFS type for HFS files)
+		aux_type: Auxiliary type (for disk images, the number of blocks)
+		storage_type: Storage type (for disk images, the block size)
+		created: Creation date as a UNIX timestamp or None
+		modified: Modification date as a UNIX timestamp or None
+		archived: Date archived as a UNIX timestamp or None
+		filename: The file's full path within the archive, as stored
+		threads: The record's Threads, in order
+		next_offset: Where the next record starts
+	"""
+	__slots__ = (
+			'offset', 'version', 'file_sys_id', 'separator', 'access',
+			'file_type', 'aux_type', 'storage_type', '_created', '_modified',
+			'_archived', 'filename', 'threads', 'next_offset')
+
+	def __init__(self, buffer: BufferType, offset: int) -> None:
+		(nufx_id, _crc, attrib_count, self.version, total_threads,
+			self.file_sys_id, file_sys_info, self.access, self.file_type,
+			self.aux_type, self.storage_type, created, modified,
+			archived) = RECORD_HEADER.unpack(
+					buffer.read(offset, RECORD_HEADER.size))
+		if nufx_id != RECORD_ID:
+			raise NuFXError("no record header at {}".format(offset))
+		self.offset = offset
+		self.separator = file_sys_info & 0xff or ord(':')
+		self._created = created    # raw until decoded
+		self._modified = modified
+		self._archived = archived
+
+		# the attributes end with the length of an old style filename
+		name_length, = struct.unpack(
+				'<H', buffer.read(offset + attrib_count - 2, 2))
+		position = offset + attrib_count
+		self.filename = buffer.read(position, name_length)
+		position += name_length
+
+		headers = buffer.read(position, total_threads * THREAD_HEADER.size)
+		position += len(headers)
+		self.threads = []
+		for fields in THREAD_HEADER.iter_unpack(headers):
+			thread = Thread(position, fields)
+			self.threads.append(thread)
+			position += thread.comp_eof
+		self.next_offset = position
+
+		name_thread = self.thread(FILENAME, 0)
+		if name_thread is not None:
+			self.filename = buffer.read(name_thread.offset,
+					min(name_thread.eof, name_thread.comp_eof))
+
+	def __repr__(self) -> str:
+		return '<NuFX Record {!r} type ${:02x}>'.format(
+				self.filename, self.file_type)
+
+	@property
+	def created(self) -> Optional[int]:
+		if isinstance(self._created, bytes):
+			self._created = date_to_unix(self._created)
+		return self._created
+
+	@property
+	def modified(self) -> Optional[int]:
+		if isinstance(self._modified, bytes):
+			self._modified = date_to_unix(self._modified)
+		return self._modified
+
+	@property
+	def archived(self) -> Optional[int]:
+		if isinstance(self._archived, bytes):
+			self._archived = date_to_unix(self._archived)
+		return self._archived
+
+	def thread(self, thread_class: int, kind: int) -> Optional[Thread]:
+		"""Return the record's first thread of a class and kind, if any"""
+		for thread in self.threads:
+			if thread.thread_class == thread_class and thread.kind == kind:
+				return thread
+		return None
+
+	@property
+	def data_fork(self) -> Optional[Thread]:
+		return self.thread(DATA, DATA_FORK)
+
+	@property
+	def resource_fork(self) -> Optional[Thread]:
+		return self.thread(DATA, RESOURCE_FORK)
+
+	@property
+	def disk_image(self) -> Optional[Thread]:
+		return self.thread(DATA, DISK_IMAGE)
+
+	def path(self) -> List[bytes]:
+		"""Return the parts of the record's filename"""
+		return [part for part in self.filename.split(bytes((self.separator,)))
+				if part]
+
+	def length(self, thread: Thread) -> int:
+		"""Return the uncompressed length of one of the record's threads
+
+		Some versions of ShrinkIt left the length of disk image threads
+		zero, so for those it's worked out from the image's block count and
+		block size.
+		"""
+		if thread.kind == DISK_IMAGE and thread.thread_class == DATA:
+			return thread.eof or self.aux_type * self.storage_type
+		return thread.eof
+
+
+def read_master_header(buffer: BufferType) -> MasterHeader:
+	"""Return the master header of the archive in a buffer
+
+	Args:
+		buffer: The archive file, which may be wrapped in Binary II
+
+	Raises:
+		NuFXError: The buffer doesn't hold a NuFX archive
+	"""
+	offset = 0
+	if len(buffer) >= 3 and buffer.read(0, 3) == BINARY2_ID:
+		offset = BINARY2_HEADER_LENGTH
+	if offset + MASTER_HEADER.size > len(buffer):
+		raise NuFXError("not a NuFX archive")
+	raw = buffer.read(offset, MASTER_HEADER.size)
+	(nufile_id, _crc, total_records, created, modified, version, _reserved,
+		eof, _reserved2) = MASTER_HEADER.unpack(raw)
+	if nufile_id != MASTER_ID:
+		raise NuFXError("not a NuFX archive")
+	return MasterHeader(offset, total_records, date_to_unix(created),
+			date_to_unix(modified), version, eof)
+
+def read_records(buffer: BufferType) -> Iterator[Record]:
+	"""Yield the records of the archive in a buffer
+
+	Only headers and filenames are read; no thread data is touched, so
+	an archive can be cataloged without decompressing anything.  For the
+	same reason, a record is yielded even if its threads are cut short by
+	the end of the archive; that's only an error once they're read (or if
+	another record was supposed to follow).
+
+	Args:
+		buffer: The archive file, which may be wrapped in Binary II
+
+	Yields:
+		Each Record in archive order
+
+	Raises:
+		NuFXError: The buffer doesn't hold a NuFX archive, or it is cut
+			short
+	"""
+	master = read_master_header(buffer)
+	offset = master.offset + MASTER_HEADER.size
+	for _ in range(master.total_records):
+		try:
+			record = Record(buffer, offset)
+		except (IndexError, struct.error):
+			raise NuFXError("record at {} is truncated".format(offset))
+		yield record
+		offset = record.next_offset
+
+def _stream(decompressor, data: memoryview, length: int) -> Iterator[bytes]:
+	"""Feed data through a zlib or bz2 decompressor 64K at a time"""
+	for start in range(0, len(data), 65536):
+		if length <= 0:
+			return
+		chunk = decompressor.decompress(data[start:start + 65536])
+		if chunk:
+			yield chunk[:length]
+			length -= len(chunk)
+
+def read_thread(
+		buffer: BufferType,
+		record: Record,
+		thread: Thread,
+		verify: bool = True
+		) -> Iterator[Tuple[int, bytes]]:
+	"""Yield a thread's data, uncompressed, as it's decompressed
+
+	Uncompressed threads are yielded as a single view of the buffer.  LZW
+	threads are yielded a chunk at a time as views of a buffer that's reused
+	for the next chunk, so they must be copied if they're to be kept.
+
+	Args:
+		buffer: The archive file
+		record: The record the thread belongs to
+		thread: The thread to read
+		verify: Check the CRC of LZW/1 threads
+
+	Yields:
+		(offset, data) pairs covering the thread
+
+	Raises:
+		NuFXError: The thread is corrupt or compressed in a format we can't
+			decompress
+	"""
+	length = record.length(thread)
+	if thread.offset + thread.comp_eof > len(buffer):
+		raise NuFXError("thread at {} runs past the end of the archive".format(
+			thread.offset))
+	data = buffer.read_view(thread.offset, thread.comp_eof)
+	if thread.format == UNCOMPRESSED:
+		chunks = iter((data[:length],))
+	elif thread.format in (LZW1, LZW2):
+		chunks = lzw.expand(data, length, thread.format == LZW2, verify)
+	elif thread.format == DEFLATE:
+		chunks = _stream(zlib.decompressobj(), data, length)
+	elif thread.format == BZIP2:
+		chunks = _stream(bz2.BZ2Decompressor(), data, length)
+	else:
+		raise NuFXError("{} threads are not supported".format(
+			FORMAT_NAMES.get(thread.format,
+				"format {}".format(thread.format))))
+	position = 0
+	try:
+		for chunk in chunks:
+			yield position, chunk
+			position += len(chunk)
+	except (lzw.LZWError, zlib.error, OSError, EOFError) as e:
+		raise NuFXError("thread at {} is corrupt: {}".format(
+			thread.offset, e))
+	if position < length:
+		raise NuFXError("thread at {} is truncated".format(thread.offset))
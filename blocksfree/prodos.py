@@ -0,0 +1,385 @@
+# vim: set tabstop=4 shiftwidth=4 noexpandtab filetype=python:
+
+# Copyright (C) 2013-2016  Ivan Drucker
+# Copyright (C) 2017       T. Joseph Carter
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+# or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License
+# for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+"""ProDOS directory structures
+
+A ProDOS directory is a chain of 512 byte blocks, each beginning with the
+previous and next block pointers and followed by thirteen 39 byte entries.  The
+first entry of the first (key) block is the directory header rather than a
+file entry.
+
+Every field of an entry is decoded in a single struct unpack into a slotted
+record, so callers can look at a file's type, length, or dates as often as they
+like without going back to the disk image for them.
+"""
+
+import datetime
+import struct
+from typing import Iterator, List, Optional, Tuple
+
+from .buffer.buffertype import BufferType
+
+BLOCK_SIZE = 512
+ENTRY_LENGTH = 39
+ENTRIES_PER_BLOCK = 13
+
+# Storage types
+DELETED = 0x0
+SEEDLING = 0x1
+SAPLING = 0x2
+TREE = 0x3
+PASCAL_AREA = 0x4
+EXTENDED = 0x5
+DIRECTORY = 0xd
+SUBDIR_HEADER = 0xe
+VOLUME_HEADER = 0xf
+
+ENTRY = struct.Struct('<B15sBHH3s4sHBH4sH')
+"""Layout of a 39 byte ProDOS file entry"""
+
+HEADER = struct.Struct('<B15s6xH4sBBBBBHHH')
+"""Layout of a 39 byte ProDOS volume or subdirectory header"""
+
+def date_to_unix(prodos_date: bytes) -> Optional[int]:
+	"""Returns a UNIX timestamp given a raw ProDOS date"""
+	"""The ProDOS date consists of two 16-bit words stored little-
+	endian.  We receive them as raw bytes with this layout:
+
+	  mmmddddd yyyyyyym 00MMMMMM 000HHHHH
+
+	where:
+
+	  year     yyyyyyy
+	  month    m mmm
+	  day      ddddd
+	  hour     HHHHH
+	  minute   MMMMMM
+
+	Some notes about that:
+
+	- The high bit of the month is the low bit of prodos_date[1], the rest of
+	  lower bits are found in prodos_date[0].
+	- The two-digit year treats 40-99 as being 19xx, else 20xx.
+	- ProDOS has only minute-precision for its timestamps.  Data regarding
+	  seconds is lost.
+	- ProDOS dates are naive in the sense they lack a timezone.  We (naively)
+	  assume these timestamps are in local time.
+	- The unused bits in the time fields are masked off, just in case they're
+	  ever NOT zero.  2040 is coming.
+	"""
+	try:
+		year = (prodos_date[1] & 0xfe)>>1
+		year += 1900 if year >= 40 else 2000
+		month = ((prodos_date[1] & 0x01)<<4) | ((prodos_date[0] & 0xe0)>>5)
+		day = prodos_date[0] & 0x1f
+		hour = prodos_date[3] & 0x1f
+		minute = prodos_date[2] & 0x3f
+
+		return int(datetime.datetime(year, month, day,
+			hour, minute).timestamp())
+	except:
+		# <NO DATE> is always an option
+		return None
+
+def case_mask(raw_mask: int) -> Optional[int]:
+	"""Return a GS/OS lowercase mask, or None if there isn't one
+
+	GS/OS stores mixed case filenames as uppercase plus a 16-bit mask whose
+	high bit says the mask is valid.  Bits 14 through 0 then say whether each
+	of the (up to) fifteen characters of the name is lowercase.
+
+	Args:
+		raw_mask: The 16-bit mask as stored on disk
+
+	Returns:
+		The raw mask if it is valid, otherwise None
+	"""
+	return raw_mask if raw_mask & 0x8000 else None
+
+def apply_case_mask(name: bytes, mask: Optional[int]) -> bytes:
+	"""Return name with the characters flagged by a GS/OS case mask lowered
+
+	Args:
+		name: An uppercase ProDOS name
+		mask: A valid case mask as returned by case_mask, or None
+
+	Returns:
+		The mixed case name
+	"""
+	if not mask:
+		return name
+	return bytes(
+			(char | 0x20) if (mask & (0x4000 >> i)) and 0x41 <= char <= 0x5a
+			else char
+			for i, char in enumerate(name))
+
+
+class DirectoryHeader(object):
+	"""The header of a ProDOS volume directory or subdirectory
+
+	For a subdirectory, the case mask is found in the directory's file entry
+	in its parent directory rather than in the header itself, so case_mask is
+	only meaningful for volume directories.
+	"""
+	__slots__ = (
+			'block', 'storage_type', 'raw_name', 'case_mask', 'created',
+			'access', 'entry_length', 'entries_per_block', 'file_count',
+			'pointer')
+
+	def __init__(self, block: int, raw: bytes) -> None:
+		(storage_name, name, raw_mask, created, _version, _min_version,
+			self.access, self.entry_length, self.entries_per_block,
+			self.file_count, self.pointer, _extra) = HEADER.unpack(raw)
+		self.block = block
+		self.storage_type = storage_name >> 4
+		self.raw_name = name[:storage_name & 0x0f]
+		self.case_mask = (case_mask(raw_mask)
+				if self.storage_type == VOLUME_HEADER else None)
+		self.created = date_to_unix(created)
+
+	def name(self, mask: Optional[int] = None) -> bytes:
+		"""Return the directory name, mixed case if we have a case mask
+
+		Args:
+			mask: The case mask from the directory's file entry, used for
+				subdirectories
+
+		Returns:
+			The directory name as bytes
+		"""
+		return apply_case_mask(self.raw_name, self.case_mask or mask)
+
+
+class FileEntry(object):
+	"""A ProDOS file entry
+
+	The dates are only decoded when they're first asked for, since a plain
+	catalog never looks at them.
+
+	Attributes:
+		block: The directory block containing the entry
+		storage_type: One of the storage type constants above
+		raw_name: The uppercase name as stored on disk
+		name: The name with any GS/OS case mask applied
+		case_mask: The GS/OS case mask or None
+		file_type: ProDOS file type as an int
+		key_pointer: Key block of the file
+		blocks_used: Number of blocks the file occupies
+		eof: Length of the file (the key block for extended files)
+		created: Creation date as a UNIX timestamp or None
+		access: ProDOS access bits
+		aux_type: ProDOS auxiliary type as an int
+		modified: Modification date as a UNIX timestamp or None
+		header_pointer: Key block of the directory containing the entry
+	"""
+	__slots__ = (
+			'block', 'storage_type', 'raw_name', 'name', 'case_mask',
+			'file_type', 'key_pointer', 'blocks_used', 'eof', '_created',
+			'access', 'aux_type', '_modified', 'header_pointer')
+
+	def __init__(self, block: int, fields: tuple) -> None:
+		(storage_name, name, self.file_type, self.key_pointer,
+			self.blocks_used, eof, created, raw_mask, self.access,
+			self.aux_type, modified, self.header_pointer) = fields
+		self.block = block
+		self.storage_type = storage_name >> 4
+		self.raw_name = name[:storage_name & 0x0f]
+		self.case_mask = case_mask(raw_mask)
+		self.name = apply_case_mask(self.raw_name, self.case_mask)
+		self.eof = int.from_bytes(eof, 'little')
+		self._created = created    # raw until decoded
+		self._modified = modified
+
+	@property
+	def created(self) -> Optional[int]:
+		if isinstance(self._created, bytes):
+			self._created = date_to_unix(self._created)
+		return self._created
+
+	@property
+	def modified(self) -> Optional[int]:
+		if isinstance(self._modified, bytes):
+			self._modified = date_to_unix(self._modified)
+		return self._modified
+
+	def __repr__(self) -> str:
+		return '<ProDOS FileEntry {!r} type ${:02x} storage {}>'.format(
+				self.name, self.file_type, self.storage_type)
+
+
+def read_directory_header(
+		buffer: BufferType,
+		key_block: int
+		) -> DirectoryHeader:
+	"""Return the header of the directory whose key block is given
+
+	Args:
+		buffer: The disk image, in ProDOS order
+		key_block: The key block of a volume directory or subdirectory
+
+	Returns:
+		The parsed DirectoryHeader
+	"""
+	return DirectoryHeader(key_block,
+			buffer.read(key_block * BLOCK_SIZE + 4, ENTRY_LENGTH))
+
+def read_directory(
+		buffer: BufferType,
+		key_block: int,
+		file_count: Optional[int] = None
+		) -> Iterator[FileEntry]:
+	"""Yield the active file entries of a directory
+
+	Each directory block is unpacked in a single pass.  The walk ends once
+	file_count active entries have been found, at the end of the block chain,
+	or if the chain loops back on itself or points outside the image.
+
+	Args:
+		buffer: The disk image, in ProDOS order
+		key_block: The key block of a volume directory or subdirectory
+		file_count: Number of active entries; read from the header if None
+
+	Yields:
+		A FileEntry for each active entry in directory order
+	"""
+	if file_count is None:
+		file_count = read_directory_header(buffer, key_block).file_count
+	total_blocks = len(buffer) // BLOCK_SIZE
+	seen = set()
+	found = 0
+	block = key_block
+	first = 1  # skip the header in the key block
+	while found < file_count and 0 < block < total_blocks:
+		if block in seen:
+			break
+		seen.add(block)
+		with buffer.read_view(block * BLOCK_SIZE, BLOCK_SIZE) as raw:
+			next_block = raw[2] | (raw[3] << 8)
+			entries = list(ENTRY.iter_unpack(
+					raw[4:4 + ENTRY_LENGTH * ENTRIES_PER_BLOCK]))
+		for fields in entries[first:]:
+			if fields[0] >> 4 != DELETED:
+				yield FileEntry(block, fields)
+				found += 1
+				if found >= file_count:
+					break
+		first = 0
+		block = next_block
+
+
+def index_block(buffer: BufferType, block: int) -> List[int]:
+	"""Return the 256 block pointers held in an index block
+
+	The low bytes of the pointers fill the first half of the block and the
+	high bytes fill the second half, so the whole block is decoded at once.
+	Master index blocks use the same layout.
+
+	Args:
+		buffer: The disk image, in ProDOS order
+		block: The index block to decode
+
+	Returns:
+		A list of 256 block numbers, with zero marking a sparse block
+	"""
+	raw = buffer.read(block * BLOCK_SIZE, BLOCK_SIZE)
+	return [lo | (hi << 8) for lo, hi in zip(raw[:256], raw[256:])]
+
+def data_blocks(
+		buffer: BufferType,
+		storage_type: int,
+		key_pointer: int,
+		eof: int
+		) -> List[int]:
+	"""Return the data blocks of a seedling, sapling, or tree file
+
+	Only the blocks needed to hold eof bytes are returned, and only the index
+	blocks holding them are read.
+
+	Args:
+		buffer: The disk image, in ProDOS order
+		storage_type: SEEDLING, SAPLING, or TREE
+		key_pointer: The key block of the file or fork
+		eof: The length of the file or fork
+
+	Returns:
+		A list of block numbers in file order, with zero marking a sparse
+		block (or one beyond the reach of the file's index)
+	"""
+	count = (eof + BLOCK_SIZE - 1) // BLOCK_SIZE
+	if storage_type == SEEDLING:
+		blocks = [key_pointer]
+	elif storage_type == SAPLING:
+		blocks = index_block(buffer, key_pointer)
+	elif storage_type == TREE:
+		blocks = []
+		for index in index_block(buffer, key_pointer)[:(count + 255) // 256]:
+			blocks.extend(index_block(buffer, index) if index else [0] * 256)
+	else:
+		raise ValueError(
+				'storage type {} has no data blocks'.format(storage_type))
+	blocks = blocks[:count]
+	return blocks + [0] * (count - len(blocks))
+
+def extents(blocks: List[int]) -> List[Tuple[int, int]]:
+	"""Coalesce a list of blocks into runs of consecutive blocks
+
+	Args:
+		blocks: Block numbers in file order, zero meaning sparse
+
+	Returns:
+		A list of (first block, block count) tuples.  A run of sparse blocks
+		has a first block of zero.
+	"""
+	runs = []
+	start = None
+	length = 0
+	for block in blocks:
+		if start is not None and (
+				(block == 0 and start == 0)
+				or (block and start and block == start + length)):
+			length += 1
+		else:
+			if start is not None:
+				runs.append((start, length))
+			start, length = block, 1
+	if start is not None:
+		runs.append((start, length))
+	return runs
+
+def file_extents(
+		buffer: BufferType,
+		storage_type: int,
+		key_pointer: int,
+		eof: int
+		) -> List[Tuple[int, int]]:
+	"""Return the extents of a seedling, sapling, or tree file
+
+	Freshly written volumes tend to store files contiguously, so a file of
+	hundreds of blocks usually resolves to a handful of extents which can
+	each be read in one go.
+
+	Args:
+		buffer: The disk image, in ProDOS order
+		storage_type: SEEDLING, SAPLING, or TREE
+		key_pointer: The key block of the file or fork
+		eof: The length of the file or fork
+
+	Returns:
+		A list of (first block, block count) tuples, see extents()
+	"""
+	return extents(data_blocks(buffer, storage_type, key_pointer, eof))
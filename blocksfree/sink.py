@@ -0,0 +1,609 @@
+# vim: set tabstop=4 shiftwidth=4 noexpandtab filetype=python:
+
+# Copyright (C) 2017  T. Joseph Carter
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+# or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License
+# for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+"""Destinations for extracted file data
+
+We know how long a fork is before we copy a byte of it, and the data arrives
+as a series of extents at known offsets.  A ForkWriter takes those extents and
+puts them wherever the fork is going.  StreamWriter writes each one straight
+to the output file, so memory use stays flat no matter how large the file is,
+while MemoryWriter collects the whole fork before writing it out in one go.
+
+Either kind can drop a number of bytes from the front of the fork, as is done
+with the address and length header of DOS 3.3 binary files when they are
+converted for ProDOS.
+
+Writing can also be handed off to a WriterPool.  A QueuedWriter just keeps
+hold of the extents it's given, and the file is only opened and written when
+it is closed, which a WriterPool does on a thread of its own while the next
+file is being read from the image.  Extents that are views of a memory-mapped
+image cost nothing to keep, but those that aren't (decompressed data, or
+anything from an image that had to be read into memory or reordered) have to
+be copied; once a QueuedWriter has copied SPILL_LIMIT bytes it writes the
+fork as it arrives instead, so memory use stays flat however large the
+files.
+
+However a file is written, it is opened once, its modification time is set
+through the same descriptor the data went through, and it is closed once.
+
+Files that are the same from one image to the next needn't be written again
+at all.  A DedupeWriter collects extents the way a QueuedWriter does, hashes
+the fork when it is closed, and hard links the output file to an identical
+one already in a DedupeStore if there is one.
+"""
+
+import errno
+import hashlib
+import os
+import threading
+from abc import ABCMeta, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+_O_BINARY = getattr(os, 'O_BINARY', 0)
+_UTIME_FD = os.utime in os.supports_fd
+_ZEROS = bytes(65536)
+
+SPILL_LIMIT = 1 << 20
+"""Bytes a QueuedWriter copies before it writes its fork as it arrives"""
+
+def create_file(path: str) -> int:
+	"""Open a new file for writing, replacing any file already there
+
+	An existing file is unlinked rather than truncated, so that if it's a
+	hard link (into a DedupeStore, say) the other links are left alone.
+
+	Args:
+		path: The file to open
+
+	Returns:
+		The file descriptor
+	"""
+	try:
+		os.unlink(path)
+	except FileNotFoundError:
+		pass
+	return os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | _O_BINARY,
+			0o666)
+
+def write_all(fd: int, data: bytes, offset: Optional[int] = None) -> None:
+	"""Write all of data to a file descriptor
+
+	Args:
+		fd: The file descriptor
+		data: A bytes-like object
+		offset: Where in the file to write data (default: current position)
+	"""
+	data = memoryview(data)
+	while len(data):
+		if offset is None:
+			written = os.write(fd, data)
+		elif hasattr(os, 'pwrite'):
+			written = os.pwrite(fd, data, offset)
+			offset += written
+		else:
+			os.lseek(fd, offset, os.SEEK_SET)
+			written = os.write(fd, data)
+			offset += written
+		data = data[written:]
+
+def finish_file(fd: int, path: str, mtime: Optional[int] = None) -> None:
+	"""Set the times of a file we've written and close it
+
+	Times are set through the open descriptor where the platform allows it,
+	and by path after closing where it doesn't.
+
+	Args:
+		fd: The file's open descriptor
+		path: The file's path
+		mtime: Access and modification time to set (default: leave alone)
+	"""
+	times = None if mtime is None else (mtime, mtime)
+	if times and _UTIME_FD:
+		os.utime(fd, times)
+		times = None
+	os.close(fd)
+	if times:
+		os.utime(path, times)
+
+def write_file(path: str, data: bytes, mtime: Optional[int] = None) -> None:
+	"""Write data to a file with one open and one close
+
+	Args:
+		path: The file to write
+		data: A bytes-like object holding its contents
+		mtime: Access and modification time to set (default: now)
+	"""
+	fd = create_file(path)
+	try:
+		write_all(fd, data)
+	except BaseException:
+		os.close(fd)
+		raise
+	finish_file(fd, path, mtime)
+
+class ForkWriter(object, metaclass=ABCMeta):
+	"""Abstract destination for a single fork of known length
+
+	Args:
+		path: The file the fork will be written to
+		size: The length of the fork
+		skip: Number of bytes to drop from the front of the fork
+	"""
+
+	def __init__(self, path: str, size: int, skip: int = 0) -> None:
+		self.path = path
+		self.skip = min(skip, size)
+		self.size = size - self.skip
+
+	def __enter__(self) -> 'ForkWriter':
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback) -> None:
+		self.close()
+
+	def write(self, offset: int, data: bytes) -> None:
+		"""Write data at a given offset within the fork
+
+		Offsets are relative to the start of the fork before any skipped
+		bytes have been dropped.  Anything that falls within the skipped bytes
+		or past the length of the fork is ignored.  Nothing need be written
+		for sparse areas of the fork, which are always zero.
+
+		Args:
+			offset: Position of data in the fork
+			data: A bytes-like object
+		"""
+		data = memoryview(data)
+		if offset < self.skip:
+			data = data[self.skip - offset:]
+			offset = self.skip
+		offset -= self.skip
+		if offset + len(data) > self.size:
+			data = data[:max(self.size - offset, 0)]
+		if len(data):
+			self._write(offset, data)
+
+	@abstractmethod
+	def _write(self, offset: int, data: memoryview) -> None:
+		"""Write data at offset, which has been adjusted for skip"""
+		pass
+
+	def close(self, mtime: Optional[int] = None) -> None:
+		"""Finish writing the fork
+
+		Args:
+			mtime: Access and modification time to give the file
+		"""
+		pass
+
+	def discard(self) -> None:
+		"""Give up on the fork, letting go of anything held for it
+
+		Whatever has been written to the file so far is left as it is.  A
+		writer that has already been closed is left alone.
+		"""
+		pass
+
+
+class MemoryWriter(ForkWriter):
+	"""ForkWriter which holds the fork in memory until it is closed
+
+	The buffer is allocated at the fork's full length up front and written
+	to the file in a single call when the writer is closed.
+	"""
+
+	def __init__(self, path: str, size: int, skip: int = 0) -> None:
+		super(MemoryWriter, self).__init__(path, size, skip)
+		self.buffer = bytearray(self.size)
+
+	def _write(self, offset: int, data: memoryview) -> None:
+		self.buffer[offset:offset + len(data)] = data
+
+	def close(self, mtime: Optional[int] = None) -> None:
+		"""Write the collected fork to its file
+
+		Args:
+			mtime: Access and modification time to give the file
+		"""
+		if self.buffer is not None:
+			write_file(self.path, self.buffer, mtime)
+			self.buffer = None
+
+	def discard(self) -> None:
+		self.buffer = None
+
+
+class StreamWriter(ForkWriter):
+	"""ForkWriter which writes each extent to the file as it arrives
+
+	The file is opened and sized when the writer is created, so sparse areas
+	of the fork are left as holes wherever the filesystem supports them.
+	"""
+
+	def __init__(self, path: str, size: int, skip: int = 0) -> None:
+		super(StreamWriter, self).__init__(path, size, skip)
+		self.fd = create_file(path)
+		try:
+			os.ftruncate(self.fd, self.size)
+		except OSError:
+			pass  # we'll write the zeros the hard way if we need to
+
+	def _write(self, offset: int, data: memoryview) -> None:
+		write_all(self.fd, data, offset)
+
+	def close(self, mtime: Optional[int] = None) -> None:
+		"""Close the output file
+
+		Args:
+			mtime: Access and modification time to give the file
+		"""
+		if self.fd is not None:
+			fd, self.fd = self.fd, None
+			finish_file(fd, self.path, mtime)
+
+	def discard(self) -> None:
+		if self.fd is not None:
+			fd, self.fd = self.fd, None
+			os.close(fd)
+
+
+class QueuedWriter(ForkWriter):
+	"""ForkWriter which defers all file access until it is closed
+
+	Extents are kept as they're given, without copying them unless they're
+	mutable, and written out through a StreamWriter or MemoryWriter when the
+	writer is closed.  That makes it safe to close from another thread so long
+	as whatever the extents are views of is still around.  The extents are
+	released once the writer is closed or discarded, whether or not they
+	could be written, so that nothing is left holding views of an image.
+
+	If more than spill bytes would have to be copied, the file is opened
+	there and then instead, and what's been queued and everything after it
+	is written as it arrives.  Only finishing the file is left for close.
+
+	Args:
+		path: The file the fork will be written to
+		size: The length of the fork
+		skip: Number of bytes to drop from the front of the fork
+		stream: True to write the file an extent at a time, False to
+			collect it in memory first
+		spill: Bytes of extents to copy before writing them out instead
+	"""
+
+	def __init__(
+			self,
+			path: str,
+			size: int,
+			skip: int = 0,
+			stream: bool = True,
+			spill: int = SPILL_LIMIT
+			) -> None:
+		super(QueuedWriter, self).__init__(path, size, skip)
+		self.stream = stream
+		self.spill = spill
+		self._extents = []
+		self._copied = 0
+		self._writer = None     # the file's own writer, once spilled
+
+	@property
+	def spilled(self) -> bool:
+		"""True if the fork is being written as it arrives"""
+		return self._writer is not None
+
+	def _write(self, offset: int, data: memoryview) -> None:
+		if self._writer is None and not data.readonly:
+			self._copied += len(data)
+			if self._copied > self.spill:
+				self._spill()
+			else:
+				data = memoryview(bytes(data))
+		if self._writer is not None:
+			self._writer.write(offset, data)
+		else:
+			self._extents.append((offset, data))
+
+	def _spill(self) -> None:
+		"""Open the file and write out what has been queued so far"""
+		self._writer = open_writer(self.path, self.size, 0, self.stream)
+		extents, self._extents = self._extents, []
+		for offset, data in extents:
+			self._writer.write(offset, data)
+			data.release()
+
+	def close(self, mtime: Optional[int] = None) -> None:
+		"""Write the queued extents to the file and close it
+
+		Args:
+			mtime: Access and modification time to give the file
+		"""
+		if self._extents is None:
+			return
+		try:
+			writer, self._writer = self._writer, None
+			if writer is None:
+				writer = open_writer(self.path, self.size, 0, self.stream)
+			try:
+				for offset, data in self._extents:
+					writer.write(offset, data)
+			except BaseException:
+				writer.discard()
+				raise
+			writer.close(mtime)
+		finally:
+			self.discard()
+
+	def discard(self) -> None:
+		if self._writer is not None:
+			writer, self._writer = self._writer, None
+			writer.discard()
+		if self._extents is not None:
+			extents, self._extents = self._extents, None
+			for _offset, data in extents:
+				data.release()
+
+
+class DedupeStore(object):
+	"""Directory of files shared by hard links between extracted trees
+
+	Files are named for the SHA-256 of their contents and their modification
+	time, since every link to a file has the same one.  The store must be on
+	the same filesystem as the output; where a link can't be made, files are
+	simply written as usual.
+
+	Output files linked into a store must not be modified in place, or the
+	store and every other link are modified too.  Every writer here replaces
+	an existing file rather than truncating it, so extracting over a
+	deduplicated tree, with or without a DedupeStore, is safe.
+
+	Args:
+		root: The store's directory, which is created if need be
+	"""
+
+	def __init__(self, root: str) -> None:
+		self.root = root
+		os.makedirs(root, exist_ok=True)
+
+	def _path(self, digest: str, mtime: Optional[int]) -> str:
+		name = digest if mtime is None else "{}-{}".format(digest, mtime)
+		return os.path.join(self.root, digest[:2], name)
+
+	def link(self, path: str, digest: str, mtime: Optional[int]) -> bool:
+		"""Replace path with a link to a stored file, if there is one
+
+		Args:
+			path: The file to replace
+			digest: SHA-256 hex digest of its contents
+			mtime: Its modification time
+
+		Returns:
+			True if path is now a link to the stored file
+		"""
+		temp_path = path + ".dedupe"
+		try:
+			os.link(self._path(digest, mtime), temp_path)
+		except OSError:
+			return False
+		os.replace(temp_path, path)
+		return True
+
+	def add(self, path: str, digest: str, mtime: Optional[int]) -> None:
+		"""Link a newly written file into the store
+
+		Args:
+			path: The file
+			digest: SHA-256 hex digest of its contents
+			mtime: Its modification time
+		"""
+		stored = self._path(digest, mtime)
+		try:
+			os.makedirs(os.path.dirname(stored), exist_ok=True)
+			os.link(path, stored)
+		except OSError as e:
+			# already stored (by another thread or process), or unlinkable
+			if e.errno not in (errno.EEXIST, errno.EXDEV, errno.EPERM,
+					errno.EMLINK, errno.ENOTSUP):
+				raise
+
+
+def file_digest(path: str) -> str:
+	"""Return the SHA-256 hex digest of a file's contents"""
+	digest = hashlib.sha256()
+	with open(path, 'rb') as stored:
+		for chunk in iter(lambda: stored.read(len(_ZEROS)), b''):
+			digest.update(chunk)
+	return digest.hexdigest()
+
+
+class DedupeWriter(QueuedWriter):
+	"""QueuedWriter which links identical files to a DedupeStore
+
+	When the writer is closed the queued extents are hashed in order, with
+	zeros for any gaps, and the file is linked to the stored copy if one
+	exists.  Otherwise it is written as a QueuedWriter would write it and
+	then added to the store.  A fork too big to queue has been written
+	already by the time the writer is closed, so it's hashed from the file
+	instead, and replaced by a link to the stored copy if there is one.
+
+	Args:
+		path: The file the fork will be written to
+		size: The length of the fork
+		skip: Number of bytes to drop from the front of the fork
+		stream: True to write the file an extent at a time, False to
+			collect it in memory first
+		store: The DedupeStore to link to
+		spill: Bytes of extents to copy before writing them out instead
+	"""
+
+	def __init__(
+			self,
+			path: str,
+			size: int,
+			skip: int = 0,
+			stream: bool = True,
+			store: DedupeStore = None,
+			spill: int = SPILL_LIMIT
+			) -> None:
+		super(DedupeWriter, self).__init__(path, size, skip, stream, spill)
+		self.store = store
+
+	def _digest(self) -> Optional[str]:
+		"""Return the hex digest of the fork, or None if extents overlap"""
+		digest = hashlib.sha256()
+		position = 0
+		for offset, data in sorted(self._extents, key=lambda e: e[0]):
+			if offset < position:
+				return None
+			while position < offset:
+				gap = min(offset - position, len(_ZEROS))
+				digest.update(_ZEROS[:gap])
+				position += gap
+			digest.update(data)
+			position += len(data)
+		while position < self.size:
+			gap = min(self.size - position, len(_ZEROS))
+			digest.update(_ZEROS[:gap])
+			position += gap
+		return digest.hexdigest()
+
+	def close(self, mtime: Optional[int] = None) -> None:
+		"""Link the file to its stored copy, or write it and store it
+
+		Args:
+			mtime: Access and modification time to give the file
+		"""
+		if self._extents is None:
+			return
+		if self.spilled:
+			super(DedupeWriter, self).close(mtime)
+			digest = file_digest(self.path)
+			if not self.store.link(self.path, digest, mtime):
+				self.store.add(self.path, digest, mtime)
+			return
+		try:
+			digest = self._digest()
+			linked = (digest is not None
+					and self.store.link(self.path, digest, mtime))
+		except BaseException:
+			self.discard()
+			raise
+		if linked:
+			self.discard()
+			return
+		# create_file() replaces rather than writes through a link
+		super(DedupeWriter, self).close(mtime)
+		if digest is not None:
+			self.store.add(self.path, digest, mtime)
+
+
+def open_writer(
+		path: str,
+		size: int,
+		skip: int = 0,
+		stream: bool = True,
+		queued: bool = False,
+		store: DedupeStore = None
+		) -> ForkWriter:
+	"""Return a ForkWriter for a fork of a given size
+
+	Args:
+		path: The file the fork will be written to
+		size: The length of the fork
+		skip: Number of bytes to drop from the front of the fork
+		stream: True to write extents to the file as they arrive, False to
+			collect the fork in memory first
+		queued: True to put off writing anything until the writer is closed
+		store: DedupeStore to link identical files to, if any (implies
+			queued)
+
+	Returns:
+		A StreamWriter, MemoryWriter, QueuedWriter, or DedupeWriter
+	"""
+	if store is not None:
+		return DedupeWriter(path, size, skip, stream, store)
+	if queued:
+		return QueuedWriter(path, size, skip, stream)
+	if stream:
+		return StreamWriter(path, size, skip)
+	return MemoryWriter(path, size, skip)
+
+
+class WriterPool(object):
+	"""Bounded pool of threads for finishing output files
+
+	Jobs are run in the order they are submitted on up to threads threads.
+	Once backlog jobs are waiting, submit() blocks until one finishes, so a
+	slow filesystem holds up reading rather than letting the queue grow
+	without limit.  With no threads at all, jobs are simply run as they are
+	submitted.
+
+	The first exception raised by any job is raised again by close().
+
+	Args:
+		threads: Number of writer threads (0 to write synchronously)
+		backlog: Jobs allowed to wait for a thread (default: 2 per thread)
+	"""
+
+	def __init__(self, threads: int, backlog: int = None) -> None:
+		self.threads = threads
+		self._executor = None
+		self._slots = None
+		self._errors = []
+		if threads:
+			if backlog is None:
+				backlog = threads * 2
+			self._executor = ThreadPoolExecutor(max_workers=threads)
+			self._slots = threading.BoundedSemaphore(threads + backlog)
+
+	def __enter__(self) -> 'WriterPool':
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback) -> None:
+		self.close()
+
+	def submit(self, job: Callable, *args) -> None:
+		"""Run job(*args) on a writer thread
+
+		Args:
+			job: The function to call
+			args: Its arguments
+		"""
+		if self._executor is None:
+			job(*args)
+			return
+		self._slots.acquire()
+		future = self._executor.submit(job, *args)
+		future.add_done_callback(self._done)
+
+	def _done(self, future) -> None:
+		self._slots.release()
+		if future.exception() is not None:
+			self._errors.append(future.exception())
+
+	def close(self) -> None:
+		"""Wait for every submitted job to finish
+
+		Raises:
+			The first exception raised by a job, if any did
+		"""
+		if self._executor is not None:
+			self._executor.shutdown(wait=True)
+			self._executor = None
+		if self._errors:
+			error = self._errors[0]
+			self._errors = []
+			raise error
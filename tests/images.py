@@ -0,0 +1,77 @@
+# vim: set tabstop=4 shiftwidth=4 noexpandtab filetype=python:
+
+# Copyright (C) 2017  T. Joseph Carter
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+# or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License
+# for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+"""Disk images built for the tests"""
+
+import os
+import struct
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+	__file__))))
+
+#pylint: disable=wrong-import-position
+from blocksfree import prodos
+#pylint: enable=wrong-import-position
+
+BLOCKS = 280
+
+MODIFIED = b'\x21\x22\x00\x0c'
+"""A ProDOS date and time, noon on 1 January 2017"""
+
+def _entry(storage_type, name, file_type, key_pointer, blocks_used, eof,
+		aux_type=0, modified=bytes(4)):
+	"""Return a 39 byte ProDOS directory entry"""
+	return (bytes(((storage_type << 4) | len(name),)) + name.ljust(15, b'\0')
+			+ struct.pack('<BHH', file_type, key_pointer, blocks_used)
+			+ eof.to_bytes(3, 'little') + bytes(4) + bytes(2)
+			+ struct.pack('<BH', 0xe3, aux_type) + modified
+			+ struct.pack('<H', 2))
+
+def forked_image(dated=False):
+	"""Return a 140K ProDOS image holding a seedling and a forked file
+
+	PLAIN holds 20 bytes at block 7.  FORKED has a 100 byte data fork at
+	block 9 and a 50 byte resource fork, and the EOF in its directory entry
+	is that of its extended key block, at block 8.  The files have no dates
+	unless dated is True, when both were modified at MODIFIED.
+	"""
+	modified = MODIFIED if dated else bytes(4)
+	image = bytearray(BLOCKS * prodos.BLOCK_SIZE)
+	image[0:4] = b'\x01\x38\xb0\x03'
+	image[259:265] = b'PRODOS'
+
+	volume = 2 * prodos.BLOCK_SIZE
+	header = (bytes((0xf0 | 4,)) + b'TEST'.ljust(15, b'\0') + bytes(8)
+			+ bytes(4) + bytes((0, 0, 0xc3, 0x27, 0x0d))
+			+ struct.pack('<HHH', 2, 6, BLOCKS))
+	image[volume + 4:volume + 4 + 39] = header
+	entries = (_entry(prodos.SEEDLING, b'PLAIN', 0x04, 7, 1, 20,
+				modified=modified)
+			+ _entry(prodos.EXTENDED, b'FORKED', 0xb3, 8, 3, 512, 0xdb07,
+				modified))
+	image[volume + 43:volume + 43 + len(entries)] = entries
+
+	image[7 * 512:7 * 512 + 20] = b'plain file contents.'
+	key = 8 * prodos.BLOCK_SIZE
+	image[key:key + 8] = (bytes((prodos.SEEDLING,)) + struct.pack('<HH', 9, 1)
+			+ (100).to_bytes(3, 'little'))
+	image[key + 256:key + 264] = (bytes((prodos.SEEDLING,))
+			+ struct.pack('<HH', 10, 1) + (50).to_bytes(3, 'little'))
+	image[9 * 512:9 * 512 + 100] = b'd' * 100
+	image[10 * 512:10 * 512 + 50] = b'r' * 50
+	return bytes(image)
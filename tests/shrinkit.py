@@ -0,0 +1,235 @@
+# vim: set tabstop=4 shiftwidth=4 noexpandtab filetype=python:
+
+# Copyright (C) 2017  T. Joseph Carter
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+# or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License
+# for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+"""ShrinkIt archives built for the tests
+
+This is a compressor and archiver written from the NuFX and LZW/1 and LZW/2
+descriptions, sharing no code with blocksfree's decompressor, so that what
+one gets wrong the other is unlikely to agree with.  It compresses the way
+ShrinkIt does: RLE first, LZW if that's smaller, storing a chunk otherwise.
+"""
+
+import bz2
+import struct
+import zlib
+
+CHUNK_SIZE = 4096
+DELIMITER = 0xdb
+CLEAR_CODE = 0x100
+FIRST_CODE = 0x101
+MAX_CODE = 0xfff
+
+ARCHIVED = bytes((5, 4, 3, 90, 1, 0, 0, 1))
+"""A NuFX date, 3:04:05 on 2 January 1990"""
+
+def crc16(data, crc=0):
+	"""Return the CRC-16/XMODEM of data, a bit at a time"""
+	for byte in data:
+		crc ^= byte << 8
+		for _ in range(8):
+			crc = (crc << 1) ^ 0x1021 if crc & 0x8000 else crc << 1
+			crc &= 0xffff
+	return crc
+
+def rle(chunk):
+	"""Return a chunk run-length encoded, as ShrinkIt would"""
+	out = bytearray()
+	i = 0
+	while i < len(chunk):
+		byte = chunk[i]
+		count = 1
+		while (i + count < len(chunk) and chunk[i + count] == byte
+				and count < 256):
+			count += 1
+		if count >= 4 or byte == DELIMITER:
+			out += bytes((DELIMITER, byte, count - 1))
+			i += count
+		else:
+			out.append(byte)
+			i += 1
+	return bytes(out)
+
+
+class Codes(object):
+	"""Codes packed least significant bit first"""
+
+	def __init__(self):
+		self.value = 0
+		self.bits = 0
+
+	def put(self, code, width):
+		self.value |= code << self.bits
+		self.bits += width
+
+	def packed(self):
+		return self.value.to_bytes((self.bits + 7) // 8, 'little')
+
+
+class Encoder(object):
+	"""LZW encoder, whose table LZW/2 carries from one chunk to the next"""
+
+	def __init__(self, lzw2):
+		self.lzw2 = lzw2
+		self.reset()
+
+	def reset(self):
+		self.table = {}
+		self.next_code = FIRST_CODE
+		self.pending = None
+
+	def save(self):
+		return dict(self.table), self.next_code, self.pending
+
+	def restore(self, state):
+		self.table, self.next_code, self.pending = state
+
+	def add(self, string):
+		if self.next_code <= MAX_CODE:
+			self.table[string] = self.next_code
+			self.next_code += 1
+
+	def width(self):
+		return min(12, self.next_code.bit_length())
+
+	def code(self, string):
+		return string[0] if len(string) == 1 else self.table[string]
+
+	def chunk(self, data):
+		"""Return a chunk LZW compressed"""
+		if not self.lzw2:
+			self.reset()
+		codes = Codes()
+		string = bytes(data[:1])
+		if self.pending is not None:
+			# the last chunk's final string is defined by this one
+			self.add(self.pending + string)
+		for byte in data[1:]:
+			longer = string + bytes((byte,))
+			if longer in self.table:
+				string = longer
+				continue
+			codes.put(self.code(string), self.width())
+			if self.lzw2 and self.next_code > MAX_CODE:
+				codes.put(CLEAR_CODE, 12)
+				self.reset()
+			else:
+				self.add(longer)
+			string = bytes((byte,))
+		codes.put(self.code(string), self.width())
+		self.pending = string
+		return codes.packed()
+
+
+def lzw(data, lzw2, crc=None):
+	"""Return an LZW/1 or LZW/2 thread of data
+
+	An LZW/1 thread's CRC may be given to make a corrupt one.
+	"""
+	chunks = max(1, -(-len(data) // CHUNK_SIZE))
+	padded = bytes(data).ljust(chunks * CHUNK_SIZE, b'\0')
+	encoder = Encoder(lzw2)
+	out = bytearray()
+	if not lzw2:
+		out += struct.pack('<H', crc16(padded) if crc is None else crc)
+	out += bytes((0, DELIMITER))
+	for start in range(0, len(padded), CHUNK_SIZE):
+		chunk = padded[start:start + CHUNK_SIZE]
+		packed = rle(chunk)
+		if len(packed) >= CHUNK_SIZE:
+			packed = chunk
+		state = encoder.save()
+		compressed = encoder.chunk(packed)
+		if len(compressed) < len(packed):
+			if lzw2:
+				out += struct.pack('<HH', len(packed) | 0x8000,
+						len(compressed) + 4)
+			else:
+				out += struct.pack('<HB', len(packed), 1)
+			out += compressed
+		else:
+			if lzw2:
+				encoder.reset()
+				out += struct.pack('<H', len(packed))
+			else:
+				encoder.restore(state)
+				out += struct.pack('<HB', len(packed), 0)
+			out += packed
+	return bytes(out)
+
+def compress(thread_format, data):
+	"""Return data compressed in a NuFX thread format"""
+	if thread_format == 0x2:
+		return lzw(data, False)
+	if thread_format == 0x3:
+		return lzw(data, True)
+	if thread_format == 0x6:
+		return zlib.compress(data)
+	if thread_format == 0x7:
+		return bz2.compress(data)
+	return data
+
+def thread(thread_class, thread_format, kind, eof, data):
+	"""Return a thread's (header, data)"""
+	return (struct.pack('<HHHHII', thread_class, thread_format, kind, 0, eof,
+			len(data)), data)
+
+def record(name, file_type=0x06, aux_type=0, thread_format=0x0, data=None,
+		rsrc=None, disk=None, old_name=None, modified=ARCHIVED,
+		threads=None):
+	"""Return a NuFX record
+
+	The name goes in a filename thread, or in the record header as an old
+	style filename if old_name is given instead.  The data fork, resource
+	fork, and disk image threads are compressed with thread_format.  A disk
+	image's thread is given an EOF of zero, as some versions of ShrinkIt
+	did.  Other (header, data) threads may be added after them.
+	"""
+	old_name = old_name or b''
+	storage_type = 0x1
+	headers = []
+	if name is not None:
+		headers.append(thread(0x3, 0x0, 0x0, len(name),
+				name.ljust(32, b'\0')))
+	if data is not None:
+		headers.append(thread(0x2, thread_format, 0x0, len(data),
+				compress(thread_format, data)))
+	if rsrc is not None:
+		storage_type = 0x5
+		headers.append(thread(0x2, thread_format, 0x2, len(rsrc),
+				compress(thread_format, rsrc)))
+	if disk is not None:
+		file_type = 0
+		aux_type = len(disk) // 512
+		storage_type = 512
+		headers.append(thread(0x2, thread_format, 0x1, 0,
+				compress(thread_format, disk)))
+	headers += threads or []
+	# no GS/OS option list, then the old style filename's length
+	header = struct.pack('<4sHHHIHHIIIH8s8s8sHH', b'N\xf5F\xd8', 0, 60, 3,
+			len(headers), 1, ord('/'), 0xe3, file_type, aux_type,
+			storage_type, ARCHIVED, modified, ARCHIVED, 0, len(old_name))
+	return (header + old_name + b''.join(h for h, _ in headers)
+			+ b''.join(d for _, d in headers))
+
+def archive(*records, binary2=False):
+	"""Return a NuFX archive of records, wrapped in Binary II if binary2"""
+	body = b''.join(records)
+	out = struct.pack('<6sHI8s8sH8sI6s', b'N\xf5F\xe9l\xe5', 0, len(records),
+			ARCHIVED, ARCHIVED, 2, bytes(8), 48 + len(body), bytes(6)) + body
+	if binary2:
+		out = b'\x0aGL' + bytes(15) + b'\x02' + bytes(109) + out
+	return out
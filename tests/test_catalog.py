@@ -0,0 +1,175 @@
+# vim: set tabstop=4 shiftwidth=4 noexpandtab filetype=python:
+
+# Copyright (C) 2017  T. Joseph Carter
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+# or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License
+# for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+"""Tests of -catfmt catalog records and the -catcache catalog cache"""
+
+import io
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+	__file__))))
+
+#pylint: disable=wrong-import-position
+from blocksfree import catcache, legacy, prodos
+from blocksfree.logging import LOG, WARNING
+from images import forked_image
+#pylint: enable=wrong-import-position
+
+
+class CatalogRecordTest(unittest.TestCase):
+	"""Catalog records of a ProDOS image"""
+
+	def setUp(self):
+		fd, self.image_file = tempfile.mkstemp(suffix='.po')
+		with open(fd, 'wb') as image:
+			image.write(forked_image())
+
+	def tearDown(self):
+		os.unlink(self.image_file)
+
+	def catalog(self):
+		"""Return the image's NDJSON catalog records by path"""
+		output = io.StringIO()
+		extractor = legacy.Extractor(self.image_file, catalog_format='ndjson',
+				catalog_output=output, output=io.StringIO())
+		self.assertEqual(extractor.run(), 0)
+		records = [json.loads(line) for line in output.getvalue().splitlines()]
+		return {record['path']: record for record in records}
+
+	def test_seedling_eof(self):
+		record = self.catalog()['/TEST/PLAIN']
+		self.assertEqual(record['storage_type'], prodos.SEEDLING)
+		self.assertEqual(record['eof'], 20)
+
+	def test_forked_file_eof_is_data_fork_length(self):
+		record = self.catalog()['/TEST/FORKED']
+		self.assertEqual(record['storage_type'], prodos.EXTENDED)
+		self.assertEqual(record['eof'], 100)
+		self.assertEqual(record['key_pointer'], 8)
+		self.assertEqual(record['aux_type'], 0xdb07)
+
+
+class CatalogCacheTest(unittest.TestCase):
+	"""Catalogs served from a -catcache"""
+
+	def setUp(self):
+		fd, self.image_file = tempfile.mkstemp(suffix='.po')
+		with open(fd, 'wb') as image:
+			image.write(forked_image())
+		self.cache_dir = tempfile.mkdtemp()
+
+	def tearDown(self):
+		shutil.rmtree(self.cache_dir)
+		os.unlink(self.image_file)
+
+	def cat(self, **options):
+		"""Return what cataloging the image printed"""
+		output = io.StringIO()
+		extractor = legacy.Extractor(self.image_file, catalog_only=True,
+				catalog_cache=self.cache_dir, output=output, **options)
+		self.assertEqual(extractor.run(), 0)
+		return output.getvalue()
+
+	def test_cached_catalog_is_the_same(self):
+		for options in ({}, {'catalog_format': 'csv'}):
+			cold = self.cat(**options)
+			self.assertEqual(self.cat(**options), cold)
+
+	def test_same_image_with_another_extension(self):
+		# without a boot block, the extension decides the sector order
+		image = bytearray(forked_image())
+		image[0:4] = bytes(4)
+		image_files = [self.image_file, self.image_file[:-3] + '.dsk']
+		for image_file in image_files:
+			with open(image_file, 'wb') as image_out:
+				image_out.write(image)
+			os.utime(image_file, ns=(0, 0))
+		try:
+			uncached = io.StringIO()
+			legacy.Extractor(image_files[1], catalog_only=True,
+					output=uncached).run()
+			cats = []
+			for image_file in image_files:
+				self.image_file = image_file
+				cats.append(self.cat())
+			self.assertNotEqual(cats[0], cats[1])
+			self.assertEqual(cats[1], uncached.getvalue())
+		finally:
+			self.image_file = image_files[0]
+			os.unlink(image_files[1])
+
+	def test_changed_image_replaces_its_catalog(self):
+		self.cat()
+		with open(self.image_file, 'r+b') as image:
+			image.seek(7 * prodos.BLOCK_SIZE)
+			image.write(b'PLAIN')
+		self.cat()
+		db = sqlite3.connect(os.path.join(self.cache_dir, catcache.CACHE_NAME))
+		try:
+			self.assertEqual(
+					db.execute('SELECT COUNT(*) FROM images').fetchone(), (1,))
+		finally:
+			db.close()
+
+	def test_new_cache_opened_at_once(self):
+		errors = []
+		def store(number):
+			try:
+				with catcache.CatalogCache(self.cache_dir) as cache:
+					cache.store('image{}'.format(number),
+							(number, number, ''), '', [])
+			except Exception as e:  # pylint: disable=broad-except
+				errors.append(e)
+		threads = [threading.Thread(target=store, args=(number,))
+				for number in range(8)]
+		for thread in threads:
+			thread.start()
+		for thread in threads:
+			thread.join()
+		self.assertEqual(errors, [])
+		with catcache.CatalogCache(self.cache_dir) as cache:
+			for number in range(8):
+				self.assertEqual(cache.lookup((number, number, ''), ''), [])
+
+
+class LogRecorderTest(unittest.TestCase):
+	"""Recording the messages logged while cataloging an image"""
+
+	def test_only_own_thread_is_recorded(self):
+		entries = []
+		recorder = catcache.LogRecorder(entries)
+		LOG.logger.addHandler(recorder)
+		try:
+			other = threading.Thread(
+					target=LOG.warning, args=("other {}", 'image'))
+			other.start()
+			other.join()
+			LOG.warning("this {}", 'image')
+		finally:
+			LOG.logger.removeHandler(recorder)
+		self.assertEqual(entries, [(catcache.LOG, [WARNING, "this image"])])
+
+
+if __name__ == '__main__':
+	unittest.main()
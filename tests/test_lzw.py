@@ -0,0 +1,169 @@
+# vim: set tabstop=4 shiftwidth=4 noexpandtab filetype=python:
+
+# Copyright (C) 2017  T. Joseph Carter
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+# or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License
+# for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+"""Tests of LZW/1 and LZW/2 decompression"""
+
+import io
+import os
+import random
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+	__file__))))
+
+#pylint: disable=wrong-import-position
+from blocksfree import legacy, lzw, nufx
+from blocksfree.buffer.bytebuffer import ByteBuffer
+from images import forked_image
+import shrinkit
+#pylint: enable=wrong-import-position
+
+
+def sample(length):
+	"""Return length bytes of words, runs, delimiters, and noise
+
+	The words fill LZW/2's string table and clear it several times over,
+	the runs and delimiters are RLE encoded, and the noise makes a chunk
+	that's stored rather than compressed.
+	"""
+	rnd = random.Random(2017)
+	words = [bytes(rnd.choice(b'abcdefghij') for _ in range(rnd.randint(2, 7)))
+			for _ in range(300)]
+	out = bytearray(b'x' * 300 + b'a\xdbb' + b'\xdb' * 9 + b'\0' * 5000)
+	out += bytes(rnd.getrandbits(8) for _ in range(lzw.CHUNK_SIZE))
+	while len(out) < length:
+		out += rnd.choice(words) + b' '
+	return bytes(out[:length])
+
+def expand(thread, length, lzw2, verify=True):
+	return b''.join(bytes(chunk)
+			for chunk in lzw.expand(thread, length, lzw2, verify))
+
+
+class DecoderTest(unittest.TestCase):
+	"""Decoding one chunk's codes"""
+
+	# 0x41 0x42 0x101 0x103 as 9 bit codes: A, B, AB, then the code being
+	# defined (ABA), which decodes to the previous string plus its own
+	# first byte
+	ABABABA = bytes.fromhex('4184041c08')
+
+	# 0x41 0x100 0x42
+	CLEARED = bytes.fromhex('41000a01')
+
+	def test_known_codes(self):
+		for clear in (False, True):
+			decoded, used = lzw.Decoder().decode(self.ABABABA, 7, clear)
+			self.assertEqual((bytes(decoded), used), (b'ABABABA', 5))
+
+	def test_lzw2_clear_code(self):
+		decoded, used = lzw.Decoder().decode(self.CLEARED, 2, True)
+		self.assertEqual((bytes(decoded), used), (b'AB', 4))
+
+	def test_lzw1_has_no_clear_code(self):
+		with self.assertRaises(lzw.LZWError):
+			lzw.Decoder().decode(self.CLEARED, 2, False)
+
+	def test_code_past_the_table(self):
+		# 0x41 0x102, when 0x101 is the next code to be defined
+		with self.assertRaises(lzw.LZWError):
+			lzw.Decoder().decode(bytes.fromhex('410402'), 3, False)
+
+
+class ExpandTest(unittest.TestCase):
+	"""Decompressing whole threads"""
+
+	def test_lzw1(self):
+		data = sample(5 * lzw.CHUNK_SIZE + 1000)
+		self.assertEqual(expand(shrinkit.lzw(data, False), len(data), False),
+				data)
+
+	def test_lzw2(self):
+		data = sample(12 * lzw.CHUNK_SIZE + 1000)
+		self.assertEqual(expand(shrinkit.lzw(data, True), len(data), True),
+				data)
+
+	def test_empty_thread(self):
+		for lzw2 in (False, True):
+			self.assertEqual(expand(shrinkit.lzw(b'', lzw2), 0, lzw2), b'')
+
+	def test_crc_mismatch(self):
+		data = sample(2 * lzw.CHUNK_SIZE)
+		thread = shrinkit.lzw(data, False,
+				crc=shrinkit.crc16(data) ^ 0x0101)
+		with self.assertRaises(lzw.LZWError):
+			expand(thread, len(data), False)
+		self.assertEqual(expand(thread, len(data), False, verify=False), data)
+
+
+class ShrinkItThreadTest(unittest.TestCase):
+	"""Decompressing the threads of ShrinkIt archives"""
+
+	def read(self, archive, kind):
+		"""Return a thread of the first record in an archive"""
+		buffer = ByteBuffer(archive)
+		record = next(nufx.read_records(buffer))
+		thread = record.thread(nufx.DATA, kind)
+		return b''.join(bytes(data)
+				for _, data in nufx.read_thread(buffer, record, thread))
+
+	def test_forks(self):
+		data = sample(3 * lzw.CHUNK_SIZE + 10)
+		rsrc = sample(700)
+		for thread_format in (nufx.LZW1, nufx.LZW2):
+			archive = shrinkit.archive(shrinkit.record(b'FORKED',
+					thread_format=thread_format, data=data, rsrc=rsrc))
+			self.assertEqual(self.read(archive, nufx.DATA_FORK), data)
+			self.assertEqual(self.read(archive, nufx.RESOURCE_FORK), rsrc)
+
+	def test_disk_image(self):
+		image = forked_image()
+		for thread_format in (nufx.LZW1, nufx.LZW2):
+			archive = shrinkit.archive(shrinkit.record(b'DISK',
+					thread_format=thread_format, disk=image))
+			self.assertEqual(self.read(archive, nufx.DISK_IMAGE), image)
+
+	def test_crc_mismatch(self):
+		archive = bytearray(shrinkit.archive(shrinkit.record(b'DISK',
+				thread_format=nufx.LZW1, disk=forked_image())))
+		thread = next(nufx.read_records(ByteBuffer(archive))).disk_image
+		archive[thread.offset] ^= 0x01
+		with self.assertRaisesRegex(nufx.NuFXError, 'CRC'):
+			self.read(bytes(archive), nufx.DISK_IMAGE)
+
+	def test_sdk_extracted(self):
+		target_dir = tempfile.mkdtemp()
+		try:
+			archive_file = os.path.join(target_dir, 'disk.sdk')
+			with open(archive_file, 'wb') as archive:
+				archive.write(shrinkit.archive(shrinkit.record(b'DISK',
+						thread_format=nufx.LZW2, disk=forked_image())))
+			extractor = legacy.Extractor(archive_file,
+					os.path.join(target_dir, 'out'), output=io.StringIO())
+			self.assertEqual(extractor.run(), 0)
+			image_file = os.path.join(target_dir, 'out', 'DISK.PO')
+			with open(image_file, 'rb') as image:
+				self.assertEqual(image.read(), forked_image())
+		finally:
+			shutil.rmtree(target_dir)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,92 @@
+# vim: set tabstop=4 shiftwidth=4 noexpandtab filetype=python:
+
+# Copyright (C) 2017  T. Joseph Carter
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+# or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License
+# for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+"""Tests of -inc re-extraction"""
+
+import io
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+	__file__))))
+
+#pylint: disable=wrong-import-position
+from blocksfree import legacy, prodos
+from images import forked_image
+#pylint: enable=wrong-import-position
+
+
+class IncrementalTest(unittest.TestCase):
+	"""Re-extracting a changed image with -inc"""
+
+	def setUp(self):
+		fd, self.image_file = tempfile.mkstemp(suffix='.po')
+		os.close(fd)
+		self.target_dir = tempfile.mkdtemp()
+
+	def tearDown(self):
+		shutil.rmtree(self.target_dir)
+		os.unlink(self.image_file)
+
+	def write_image(self, image):
+		with open(self.image_file, 'wb') as image_file:
+			image_file.write(image)
+
+	def patch_image(self, offset, data):
+		with open(self.image_file, 'r+b') as image_file:
+			image_file.seek(offset)
+			image_file.write(data)
+
+	def extract(self):
+		"""Return the names of the files extracted and skipped"""
+		extractor = legacy.Extractor(self.image_file, self.target_dir,
+				incremental=True, output=io.StringIO())
+		self.assertEqual(extractor.run(), 0)
+		return ({os.path.basename(path) for path in extractor.extracted},
+				{os.path.basename(path) for path in extractor.skipped})
+
+	def test_unchanged_files_are_skipped(self):
+		self.write_image(forked_image(dated=True))
+		self.assertEqual(self.extract(), ({'PLAIN', 'FORKED'}, set()))
+		self.assertEqual(self.extract(), (set(), {'PLAIN', 'FORKED'}))
+
+	def test_undated_file_changed_in_place_is_extracted(self):
+		self.write_image(forked_image())
+		self.extract()
+		self.patch_image(7 * prodos.BLOCK_SIZE, b'PLAIN')
+		extracted, _skipped = self.extract()
+		self.assertIn('PLAIN', extracted)
+		plain = os.path.join(self.target_dir, 'TEST', 'PLAIN')
+		with open(plain, 'rb') as output:
+			self.assertEqual(output.read(), b'PLAIN file contents.')
+
+	def test_forked_file_with_new_data_fork_length_is_extracted(self):
+		self.write_image(forked_image(dated=True))
+		self.extract()
+		self.patch_image(
+				8 * prodos.BLOCK_SIZE + 5, (90).to_bytes(3, 'little'))
+		self.assertEqual(self.extract(), ({'FORKED'}, {'PLAIN'}))
+		self.assertEqual(
+				os.path.getsize(
+					os.path.join(self.target_dir, 'TEST', 'FORKED')), 90)
+
+
+if __name__ == '__main__':
+	unittest.main()
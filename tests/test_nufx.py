@@ -0,0 +1,168 @@
+# vim: set tabstop=4 shiftwidth=4 noexpandtab filetype=python:
+
+# Copyright (C) 2017  T. Joseph Carter
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+# or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License
+# for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+"""Tests of reading NuFX (ShrinkIt) archives"""
+
+import io
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+	__file__))))
+
+#pylint: disable=wrong-import-position
+from blocksfree import legacy, nufx
+from blocksfree.buffer.bytebuffer import ByteBuffer
+import shrinkit
+#pylint: enable=wrong-import-position
+
+
+def records(archive):
+	"""Return the records of an archive and the buffer holding it"""
+	buffer = ByteBuffer(archive)
+	return list(nufx.read_records(buffer)), buffer
+
+def read(buffer, record, thread):
+	"""Return a thread's data, uncompressed"""
+	return b''.join(bytes(data)
+			for _, data in nufx.read_thread(buffer, record, thread))
+
+def run_extractor(archive, **options):
+	"""Return the exit status and output of cppo on an archive"""
+	fd, archive_file = tempfile.mkstemp(suffix='.shk')
+	target_dir = tempfile.mkdtemp()
+	try:
+		with open(fd, 'wb') as archive_out:
+			archive_out.write(archive)
+		output = io.StringIO()
+		status = legacy.Extractor(archive_file, target_dir, output=output,
+				**options).run()
+		return status, output.getvalue()
+	finally:
+		os.unlink(archive_file)
+		shutil.rmtree(target_dir)
+
+
+class RecordTest(unittest.TestCase):
+	"""Reading records and their threads"""
+
+	def test_binary2_wrapper(self):
+		for binary2 in (False, True):
+			archive = shrinkit.archive(
+					shrinkit.record(b'ONE', data=b'one'),
+					shrinkit.record(b'TWO', data=b'two'),
+					binary2=binary2)
+			master = nufx.read_master_header(ByteBuffer(archive))
+			self.assertEqual(master.offset, 128 if binary2 else 0)
+			self.assertEqual(master.total_records, 2)
+			found, buffer = records(archive)
+			self.assertEqual([record.filename for record in found],
+					[b'ONE', b'TWO'])
+			self.assertEqual(read(buffer, found[1], found[1].data_fork),
+					b'two')
+
+	def test_not_an_archive(self):
+		for archive in (b'', b'\x0aGL' + bytes(200), bytes(200)):
+			with self.assertRaisesRegex(nufx.NuFXError, 'not a NuFX'):
+				records(archive)
+
+	def test_filename_thread_over_record_filename(self):
+		(record,), _buffer = records(shrinkit.archive(
+				shrinkit.record(b'NEW/NAME', old_name=b'OLD')))
+		self.assertEqual(record.filename, b'NEW/NAME')
+		self.assertEqual(record.path(), [b'NEW', b'NAME'])
+
+	def test_record_filename(self):
+		(record,), _buffer = records(shrinkit.archive(
+				shrinkit.record(None, old_name=b'OLD/NAME')))
+		self.assertEqual(record.path(), [b'OLD', b'NAME'])
+
+	def test_forked_file(self):
+		for thread_format in (nufx.UNCOMPRESSED, nufx.LZW1, nufx.LZW2,
+				nufx.DEFLATE, nufx.BZIP2):
+			(record,), buffer = records(shrinkit.archive(shrinkit.record(
+					b'FORKED', 0xb3, 0xdb07, thread_format, data=b'd' * 100,
+					rsrc=b'r' * 50)))
+			self.assertEqual((record.file_type, record.aux_type),
+					(0xb3, 0xdb07))
+			self.assertIsNone(record.disk_image)
+			self.assertEqual(record.length(record.data_fork), 100)
+			self.assertEqual(read(buffer, record, record.data_fork),
+					b'd' * 100)
+			self.assertEqual(read(buffer, record, record.resource_fork),
+					b'r' * 50)
+
+	def test_disk_image(self):
+		image = bytes(range(256)) * 2 * 280
+		(record,), buffer = records(shrinkit.archive(shrinkit.record(
+				b'DISK', thread_format=nufx.UNCOMPRESSED, disk=image)))
+		self.assertIsNone(record.data_fork)
+		self.assertEqual(record.disk_image.eof, 0)
+		self.assertEqual(record.length(record.disk_image), len(image))
+		self.assertEqual(read(buffer, record, record.disk_image), image)
+
+	def test_unsupported_formats(self):
+		for thread_format, name in ((nufx.SQUEEZE, 'Huffman squeeze'),
+				(nufx.LZC12, '12-bit LZC'), (nufx.LZC16, '16-bit LZC')):
+			archive = shrinkit.archive(shrinkit.record(b'PACKED',
+					threads=[shrinkit.thread(nufx.DATA, thread_format,
+						nufx.DATA_FORK, 100, bytes(40))]))
+			(record,), buffer = records(archive)
+			with self.assertRaisesRegex(nufx.NuFXError,
+					'{} threads are not supported'.format(name)):
+				read(buffer, record, record.data_fork)
+			status, output = run_extractor(archive)
+			self.assertEqual(status, 1)
+			self.assertIn('ShrinkIt archive is invalid', output)
+
+
+class TruncatedArchiveTest(unittest.TestCase):
+	"""Archives cut short in the middle of a record's threads"""
+
+	def setUp(self):
+		archive = shrinkit.archive(
+				shrinkit.record(b'FIRST', data=b'1' * 100),
+				shrinkit.record(b'LAST', data=b'2' * 100))
+		self.archive = archive[:-50]
+
+	def test_last_record_read(self):
+		(first, last), buffer = records(self.archive)
+		self.assertEqual(last.filename, b'LAST')
+		self.assertEqual(read(buffer, first, first.data_fork), b'1' * 100)
+		with self.assertRaisesRegex(nufx.NuFXError, 'runs past the end'):
+			read(buffer, last, last.data_fork)
+
+	def test_record_missing(self):
+		with self.assertRaisesRegex(nufx.NuFXError, 'record at .* truncated'):
+			records(self.archive[:-100])
+
+	def test_cataloged(self):
+		status, output = run_extractor(self.archive, catalog_only=True)
+		self.assertEqual(status, 0)
+		self.assertIn('LAST', output)
+
+	def test_extracting_reports_it(self):
+		status, output = run_extractor(self.archive)
+		self.assertEqual(status, 1)
+		self.assertIn('ShrinkIt archive is invalid', output)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,138 @@
+# vim: set tabstop=4 shiftwidth=4 noexpandtab filetype=python:
+
+# Copyright (C) 2017  T. Joseph Carter
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+# or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License
+# for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+"""Tests of writing output files, and of errors doing so"""
+
+import io
+import mmap
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+	__file__))))
+
+#pylint: disable=wrong-import-position
+from blocksfree import legacy, sink
+from blocksfree.buffer.mmapbuffer import MmapBuffer
+from images import forked_image
+#pylint: enable=wrong-import-position
+
+
+class WriteErrorTest(unittest.TestCase):
+	"""Errors writing output files from a memory-mapped image"""
+
+	def setUp(self):
+		fd, self.image_file = tempfile.mkstemp(suffix='.po')
+		with open(fd, 'wb') as image:
+			image.write(forked_image())
+		self.target_dir = tempfile.mkdtemp()
+
+	def tearDown(self):
+		shutil.rmtree(self.target_dir)
+		os.unlink(self.image_file)
+
+	def test_extraction_error_is_raised(self):
+		# a directory where an output file goes
+		os.makedirs(os.path.join(self.target_dir, 'TEST', 'PLAIN'))
+		for threads in (4, 0):
+			extractor = legacy.Extractor(self.image_file, self.target_dir,
+					writer_threads=threads, output=io.StringIO())
+			with self.assertRaises(IsADirectoryError):
+				extractor.run()
+
+	def test_failed_queued_writer_releases_extents(self):
+		with open(self.image_file, 'rb') as image:
+			image_map = mmap.mmap(image.fileno(), 0, access=mmap.ACCESS_READ)
+		writer = sink.QueuedWriter(
+				os.path.join(self.target_dir, 'missing', 'file'), 4)
+		writer.write(0, memoryview(image_map)[0:4])
+		with self.assertRaises(FileNotFoundError):
+			writer.close()
+		image_map.close()
+
+	def test_buffer_closes_with_views_left(self):
+		buffer = MmapBuffer(self.image_file)
+		view = buffer.read_view(0, 4)
+		buffer.close()
+		self.assertEqual(bytes(view), b'\x01\x38\xb0\x03')
+		view.release()
+
+
+class SpillTest(unittest.TestCase):
+	"""QueuedWriters that would have to copy too much to queue a fork"""
+
+	def setUp(self):
+		self.target_dir = tempfile.mkdtemp()
+		self.path = os.path.join(self.target_dir, 'fork')
+		self.data = bytes(range(256)) * 16
+
+	def tearDown(self):
+		shutil.rmtree(self.target_dir)
+
+	def read(self, path=None):
+		with open(path or self.path, 'rb') as fork:
+			return fork.read()
+
+	def write(self, writer, data):
+		for offset in range(0, len(data), 512):
+			writer.write(offset, bytearray(data[offset:offset + 512]))
+
+	def test_copies_up_to_the_limit_are_queued(self):
+		writer = sink.QueuedWriter(self.path, len(self.data), spill=4096)
+		self.write(writer, self.data)
+		self.assertFalse(writer.spilled)
+		self.assertFalse(os.path.exists(self.path))
+		writer.close()
+		self.assertEqual(self.read(), self.data)
+
+	def test_views_are_not_counted(self):
+		writer = sink.QueuedWriter(self.path, len(self.data), spill=512)
+		for offset in range(0, len(self.data), 512):
+			writer.write(offset, self.data[offset:offset + 512])
+		self.assertFalse(writer.spilled)
+		writer.close()
+		self.assertEqual(self.read(), self.data)
+
+	def test_bigger_forks_are_written_as_they_arrive(self):
+		for stream in (True, False):
+			writer = sink.QueuedWriter(
+					self.path, len(self.data), 2, stream, spill=1024)
+			self.write(writer, self.data)
+			self.assertTrue(writer.spilled)
+			writer.close(0)
+			self.assertEqual(self.read(), self.data[2:])
+			self.assertEqual(os.stat(self.path).st_mtime, 0)
+
+	def test_spilled_fork_is_deduplicated(self):
+		store = sink.DedupeStore(os.path.join(self.target_dir, 'store'))
+		paths = [self.path, self.path + '2']
+		for path in paths:
+			writer = sink.DedupeWriter(
+					path, len(self.data), store=store, spill=1024)
+			self.write(writer, self.data)
+			self.assertTrue(writer.spilled)
+			writer.close(0)
+		stats = [os.stat(path) for path in paths]
+		self.assertEqual(stats[0].st_ino, stats[1].st_ino)
+		self.assertEqual(self.read(paths[1]), self.data)
+
+
+if __name__ == '__main__':
+	unittest.main()